@@ -0,0 +1,285 @@
+"""Generación de menús en lote (p. ej. los del día siguiente, durante la noche).
+
+Carga inventarios y recetas de cada cohorte de usuarios con una consulta por tabla,
+reparte las llamadas a la IA en un pool de workers async con límite de ritmo y
+reintentos con backoff, y guarda cada menú en generated_menus.
+
+Se puede reanudar: los usuarios que ya tienen menú para la fecha se saltan, y con
+--checkpoint se guarda el último usuario procesado para seguir desde ahí. Los que fallaron
+(agotados los reintentos) quedan en failed_user_ids y se vuelven a intentar al reanudar.
+
+    cd backend
+    python batch_menus.py --date 2026-10-19 --concurrency 8 --rpm 600 --checkpoint batch.json
+"""
+import os
+import json
+import logging
+import time
+import random
+import asyncio
+import argparse
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Optional
+
+from sqlalchemy import exists
+
+import models
+from database import SessionLocal
+from menu_generation import calculate_target_calories, build_menu_prompts, generate_menu, menu_record
+
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", 200))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 8))
+BATCH_REQUESTS_PER_MINUTE = int(os.getenv("BATCH_REQUESTS_PER_MINUTE", 300))
+BATCH_MAX_RETRIES = int(os.getenv("BATCH_MAX_RETRIES", 3))
+BATCH_BACKOFF_SECONDS = float(os.getenv("BATCH_BACKOFF_SECONDS", 2.0))
+# Mismo límite que /generate-menu usa para "gustos previos"
+SAVED_RECIPES_PER_USER = 10
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Espacia las peticiones para no pasar de `per_minute` completions por minuto"""
+
+    def __init__(self, per_minute: int):
+        self._interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            now = time.monotonic()
+            if self._next > now:
+                await asyncio.sleep(self._next - now)
+                now = self._next
+            self._next = now + self._interval
+
+
+def new_report(menu_date: date) -> dict:
+    return {
+        "status": "pending",
+        "menu_date": menu_date.isoformat(),
+        "users_seen": 0,
+        "generated": 0,
+        "skipped": 0,
+        "failed": 0,
+        "failed_user_ids": [],
+        "retries": 0,
+        "last_user_id": 0,
+        "elapsed_seconds": 0.0,
+        "users_per_minute": 0.0,
+    }
+
+
+# --- Acceso a BD (síncrono, se ejecuta en hilos) ---
+
+def _next_cohort_ids(after_id: int, limit: int, menu_date: date, user_ids: Optional[list[int]]) -> list[int]:
+    db = SessionLocal()
+    try:
+        already_done = exists().where(models.GeneratedMenu.owner_id == models.User.id, models.GeneratedMenu.menu_date == menu_date)
+        query = db.query(models.User.id).filter(models.User.id > after_id, ~already_done)
+        if user_ids is not None:
+            query = query.filter(models.User.id.in_(user_ids))
+        return [row.id for row in query.order_by(models.User.id).limit(limit)]
+    finally:
+        db.close()
+
+
+def _load_cohort(user_ids: list[int]) -> list[tuple]:
+    """Usuarios + inventarios + recetas de toda la cohorte en tres consultas"""
+    db = SessionLocal()
+    try:
+        users = db.query(models.User).filter(models.User.id.in_(user_ids)).order_by(models.User.id).all()
+        inventory = defaultdict(list)
+        for item in db.query(models.InventoryItem).filter(models.InventoryItem.owner_id.in_(user_ids)):
+            inventory[item.owner_id].append(item)
+        recipes = defaultdict(list)
+        for recipe in db.query(models.SavedRecipe).filter(models.SavedRecipe.owner_id.in_(user_ids)).order_by(models.SavedRecipe.id):
+            if len(recipes[recipe.owner_id]) < SAVED_RECIPES_PER_USER:
+                recipes[recipe.owner_id].append(recipe)
+        return [(user, inventory[user.id], recipes[user.id]) for user in users]
+    finally:
+        db.close()
+
+
+def _save_menu(record: models.GeneratedMenu):
+    db = SessionLocal()
+    try:
+        db.add(record)
+        db.commit()
+    finally:
+        db.close()
+
+
+# --- Checkpoint ---
+
+def _load_checkpoint(path: Optional[str], menu_date: date) -> Optional[dict]:
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    return checkpoint if checkpoint.get("menu_date") == menu_date.isoformat() else None
+
+
+def _save_checkpoint(path: Optional[str], report: dict):
+    if not path:
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+# --- Pool de workers ---
+
+async def _generate_with_retries(prompts: tuple[str, str, str], target_calories: int, limiter: RateLimiter, max_retries: int, report: dict) -> dict:
+    prompt_del_sistema, prompt_del_usuario, _ = prompts
+    for attempt in range(max_retries + 1):
+        await limiter.acquire()
+        try:
+            return await generate_menu(prompt_del_sistema, prompt_del_usuario, target_calories)
+        except Exception:
+            if attempt == max_retries:
+                raise
+            report["retries"] += 1
+            # Backoff exponencial con jitter
+            await asyncio.sleep(BATCH_BACKOFF_SECONDS * (2 ** attempt) * (0.5 + random.random()))
+
+
+async def _worker(queue: asyncio.Queue, menu_date: date, limiter: RateLimiter, max_retries: int, report: dict):
+    while True:
+        entry = await queue.get()
+        try:
+            user, inventory_items, saved = entry
+            if not inventory_items:
+                report["skipped"] += 1
+                continue
+            try:
+                prompts = build_menu_prompts(user, inventory_items, saved, menu_date)
+                menu_data = await _generate_with_retries(prompts, calculate_target_calories(user), limiter, max_retries, report)
+                await asyncio.to_thread(_save_menu, menu_record(user.id, menu_date, prompts[2], menu_data, source="batch"))
+                report["generated"] += 1
+            except Exception as e:
+                logger.warning("Error batch usuario %s: %s", user.id, e)
+                report["failed"] += 1
+                report["failed_user_ids"].append(user.id)
+        finally:
+            queue.task_done()
+
+
+async def _process_cohort(ids: list[int], menu_date: date, limiter: RateLimiter, concurrency: int, max_retries: int, report: dict):
+    cohort = await asyncio.to_thread(_load_cohort, ids)
+    queue: asyncio.Queue = asyncio.Queue()
+    for entry in cohort:
+        queue.put_nowait(entry)
+    workers = [asyncio.create_task(_worker(queue, menu_date, limiter, max_retries, report)) for _ in range(concurrency)]
+    await queue.join()
+    for w in workers:
+        w.cancel()
+
+
+async def run_batch(
+    menu_date: date,
+    user_ids: Optional[list[int]] = None,
+    concurrency: int = BATCH_CONCURRENCY,
+    requests_per_minute: int = BATCH_REQUESTS_PER_MINUTE,
+    max_retries: int = BATCH_MAX_RETRIES,
+    chunk_size: int = BATCH_CHUNK_SIZE,
+    checkpoint_path: Optional[str] = None,
+    report: Optional[dict] = None,
+) -> dict:
+    """Genera los menús de `menu_date` para todos los usuarios (o `user_ids`). `report` se actualiza en vivo."""
+    # Sin workers queue.join() no volvería nunca; sin ritmo, RateLimiter no limitaría nada
+    for name, value in (("concurrency", concurrency), ("requests_per_minute", requests_per_minute), ("chunk_size", chunk_size)):
+        if value < 1:
+            raise ValueError(f"{name} debe ser >= 1 (recibido {value})")
+    if max_retries < 0:
+        raise ValueError(f"max_retries debe ser >= 0 (recibido {max_retries})")
+
+    report = report if report is not None else new_report(menu_date)
+    checkpoint = _load_checkpoint(checkpoint_path, menu_date)
+    retry_ids: list[int] = []
+    if checkpoint:
+        for key in ("users_seen", "generated", "skipped", "failed", "retries", "last_user_id"):
+            report[key] = checkpoint[key]
+        # last_user_id ya pasó de largo a los que fallaron: se reintentan antes de seguir
+        retry_ids = checkpoint.get("failed_user_ids", [])
+        if user_ids is not None:
+            wanted = set(user_ids)
+            # Los de fuera de esta ejecución siguen pendientes para la siguiente
+            report["failed_user_ids"] = [uid for uid in retry_ids if uid not in wanted]
+            retry_ids = [uid for uid in retry_ids if uid in wanted]
+        report["failed"] -= len(retry_ids)
+    report["status"] = "running"
+
+    limiter = RateLimiter(requests_per_minute)
+    start = time.perf_counter()
+    processed_before = report["users_seen"]
+    try:
+        if retry_ids:
+            # Solo los que siguen sin menú (otro proceso o /generate-menu pudo generarlo ya)
+            pending = await asyncio.to_thread(_next_cohort_ids, 0, len(retry_ids), menu_date, retry_ids)
+            report["skipped"] += len(retry_ids) - len(pending)
+            if pending:
+                await _process_cohort(pending, menu_date, limiter, concurrency, max_retries, report)
+            _save_checkpoint(checkpoint_path, report)
+
+        while True:
+            ids = await asyncio.to_thread(_next_cohort_ids, report["last_user_id"], chunk_size, menu_date, user_ids)
+            if not ids:
+                break
+            await _process_cohort(ids, menu_date, limiter, concurrency, max_retries, report)
+
+            report["users_seen"] += len(ids)
+            report["last_user_id"] = ids[-1]
+            elapsed = time.perf_counter() - start
+            report["elapsed_seconds"] = round(elapsed, 2)
+            report["users_per_minute"] = round((report["users_seen"] - processed_before) / elapsed * 60, 1) if elapsed else 0.0
+            _save_checkpoint(checkpoint_path, report)
+        report["status"] = "done"
+    except Exception:
+        report["status"] = "failed"
+        raise
+    finally:
+        _save_checkpoint(checkpoint_path, report)
+    return report
+
+
+def _at_least(minimum: int):
+    def parse(value: str) -> int:
+        number = int(value)
+        if number < minimum:
+            raise argparse.ArgumentTypeError(f"debe ser >= {minimum}")
+        return number
+    return parse
+
+
+def main():
+    import migrations
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--date", type=date.fromisoformat, default=date.today() + timedelta(days=1), help="fecha del menú (por defecto mañana)")
+    parser.add_argument("--user-ids", type=lambda v: [int(x) for x in v.split(",")], default=None, help="lista separada por comas")
+    parser.add_argument("--concurrency", type=_at_least(1), default=BATCH_CONCURRENCY)
+    parser.add_argument("--rpm", type=_at_least(1), default=BATCH_REQUESTS_PER_MINUTE, help="completions máximas por minuto")
+    parser.add_argument("--max-retries", type=_at_least(0), default=BATCH_MAX_RETRIES)
+    parser.add_argument("--chunk-size", type=_at_least(1), default=BATCH_CHUNK_SIZE)
+    parser.add_argument("--checkpoint", default=None, help="archivo JSON para reanudar")
+    args = parser.parse_args()
+
+    migrations.upgrade()
+    report = asyncio.run(run_batch(
+        args.date,
+        user_ids=args.user_ids,
+        concurrency=args.concurrency,
+        requests_per_minute=args.rpm,
+        max_retries=args.max_retries,
+        chunk_size=args.chunk_size,
+        checkpoint_path=args.checkpoint,
+    ))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Consultas y latencia de los endpoints autenticados con y sin la caché de usuarios.
+
+Hace la misma ráfaga de peticiones a /users/me, /inventory y /menus/history con la caché
+desactivada (USER_CACHE_TTL_SECONDS=0) y activada, y cuenta sentencias SQL por petición.
+
+    cd backend
+    python -m benchmarks.auth_cache --requests 500 --clients 8
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks import harness
+
+PATHS = ("/users/me", "/inventory", "/menus/history")
+
+
+async def _burst(base_url: str, headers: dict, requests: int, clients: int) -> dict:
+    import httpx
+
+    samples = {path: [] for path in PATHS}
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        async def worker(n: int):
+            for i in range(n):
+                path = PATHS[i % len(PATHS)]
+                start = time.perf_counter()
+                (await client.get(path, headers=headers)).raise_for_status()
+                samples[path].append(time.perf_counter() - start)
+
+        await asyncio.gather(*(worker(requests // clients) for _ in range(clients)))
+    return samples
+
+
+async def _login(base_url: str) -> dict:
+    import httpx
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        return await harness.register_and_login(client)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=600)
+    parser.add_argument("--clients", type=int, default=8)
+    args = parser.parse_args()
+
+    harness.setup_isolated_env()
+    import main as backend
+    import security
+
+    counter = harness.count_statements()
+
+    report = {}
+    with harness.ServerThread(backend.app) as api:
+        headers = asyncio.run(_login(api.url))
+        configured_ttl = security.USER_CACHE_TTL_SECONDS
+        for label, ttl in (("no_cache", 0), ("user_cache", configured_ttl or 60)):
+            security.USER_CACHE_TTL_SECONDS = ttl
+            security.clear_user_cache()
+            counter["n"] = 0
+            start = time.perf_counter()
+            samples = asyncio.run(_burst(api.url, headers, args.requests, args.clients))
+            wall = time.perf_counter() - start
+            total = sum(len(s) for s in samples.values())
+            report[label] = {
+                "requests": total,
+                "rps": round(total / wall, 1),
+                "sql_per_request": round(counter["n"] / total, 2),
+                "latency": {path: harness.summarize(s) for path, s in samples.items()},
+            }
+        report["user_cache_stats"] = security.user_cache_stats
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Tráfico de refresco de la despensa: lista completa vs If-None-Match (304) vs /sync?since=.
+
+Un usuario con una despensa grande refresca la app R veces; entre refrescos cambia C ítems
+(sumas, altas y borrados por /inventory/batch) y guarda alguna receta. Se cuentan los bytes
+en el cable (con GZip, como pide la app) de cada estrategia y se comprueba que la copia
+local reconstruida solo con /sync coincide con las listas completas.
+
+    cd backend
+    python -m benchmarks.delta_sync --pantry 500 --refreshes 50 --changes 3
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks import harness
+
+
+async def _refresh_full(client, headers) -> int:
+    r = await client.get("/inventory", headers=headers)
+    return int(r.headers.get("content-length", len(r.content)))
+
+
+async def _run(base_url: str, pantry: int, refreshes: int, changes: int, counter: dict) -> dict:
+    import httpx
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        auth = await harness.register_and_login(client, pantry=())
+        headers = {**auth, "Accept-Encoding": "gzip"}
+        operations = [{"op": "add", "name": f"ingrediente {i}", "quantity": 5, "unit": "Unidades"} for i in range(pantry)]
+        (await client.post("/inventory/batch", json={"operations": operations}, headers=auth)).raise_for_status()
+
+        # Estado inicial de cada estrategia
+        etag = (await client.get("/inventory", headers=headers)).headers["etag"]
+        first = (await client.get("/sync", headers=headers)).json()
+        mirror = {"inventory": {i["id"]: i for i in first["inventory"]}, "recipes": {r["id"]: r for r in first["recipes"]}}
+        since = first["version"]
+
+        totals = {"full_list": 0, "if_none_match": 0, "sync": 0}
+        timings = {"full_list": [], "if_none_match": [], "sync": []}
+        statements = {"full_list": 0, "if_none_match": 0, "sync": 0}
+        not_modified = 0
+        for n in range(refreshes):
+            if changes and n % 2 == 1:
+                # Cambios entre refrescos (uno de cada dos: el resto son refrescos sin cambios)
+                ops = [{"op": "add", "name": f"ingrediente {(n * changes + k) % pantry}", "quantity": 1} for k in range(changes - 1)]
+                ops.append({"op": "remove", "name": f"ingrediente {(n * 7) % pantry}"})
+                ops.append({"op": "add", "name": f"nuevo {n}", "quantity": 1, "unit": "Kg"})
+                (await client.post("/inventory/batch", json={"operations": ops}, headers=auth)).raise_for_status()
+                recipe = {"name": f"receta {n}", "ingredients": ["arroz"], "steps": ["cocer"], "calories": 300}
+                (await client.post("/save-recipe", json=recipe, headers=auth)).raise_for_status()
+
+            counter["n"] = 0
+            start = time.perf_counter()
+            totals["full_list"] += await _refresh_full(client, headers)
+            timings["full_list"].append(time.perf_counter() - start)
+            statements["full_list"] += counter["n"]
+
+            counter["n"] = 0
+            start = time.perf_counter()
+            r = await client.get("/inventory", headers={**headers, "If-None-Match": etag})
+            timings["if_none_match"].append(time.perf_counter() - start)
+            statements["if_none_match"] += counter["n"]
+            totals["if_none_match"] += int(r.headers.get("content-length", len(r.content)))
+            not_modified += r.status_code == 304
+            etag = r.headers["etag"]
+
+            counter["n"] = 0
+            start = time.perf_counter()
+            r = await client.get("/sync", params={"since": since}, headers=headers)
+            timings["sync"].append(time.perf_counter() - start)
+            statements["sync"] += counter["n"]
+            totals["sync"] += int(r.headers.get("content-length", len(r.content)))
+            delta = r.json()
+            for entity, deleted in (("inventory", delta["deleted_inventory"]), ("recipes", delta["deleted_recipes"])):
+                if delta["full"]:
+                    mirror[entity].clear()
+                for item_id in deleted:
+                    mirror[entity].pop(item_id, None)
+                mirror[entity].update({row["id"]: row for row in delta[entity]})
+            since = delta["version"]
+
+        inventory = (await client.get("/inventory", headers=auth)).json()
+        recipes = (await client.get("/saved-recipes", headers=auth)).json()
+        consistent = (sorted(mirror["inventory"].values(), key=lambda i: i["id"]) == inventory
+                      and sorted(mirror["recipes"].values(), key=lambda r: r["id"]) == recipes)
+
+    return {
+        "pantry_items": pantry,
+        "refreshes": refreshes,
+        "changes_per_refresh": changes,
+        "wire_bytes": totals,
+        "bytes_per_refresh": {k: round(v / refreshes) for k, v in totals.items()},
+        "sql_statements_per_refresh": {k: round(v / refreshes, 1) for k, v in statements.items()},
+        "latency": {k: harness.summarize(v) for k, v in timings.items()},
+        "not_modified_responses": not_modified,
+        "sync_mirror_matches_full_lists": consistent,
+        "final_version": since,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pantry", type=int, default=500)
+    parser.add_argument("--refreshes", type=int, default=50)
+    parser.add_argument("--changes", type=int, default=3, help="ítems cambiados entre refrescos (0: nunca cambia nada)")
+    args = parser.parse_args()
+
+    harness.setup_isolated_env()
+    import main as backend
+
+    counter = harness.count_statements()
+
+    with harness.ServerThread(backend.app) as api:
+        report = asyncio.run(_run(api.url, args.pantry, args.refreshes, args.changes, counter))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Servidor falso compatible con /v1/chat/completions de OpenAI, con latencia inyectada.
+
+Uso independiente:
+    python -m benchmarks.fake_openai --port 9100 --latency 3
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+SAMPLE_MEAL = {
+    "name": "Bowl Energético de Avena",
+    "ingredients": ["50g avena", "1 unidad plátano", "200ml leche"],
+    "steps": ["Calienta la leche 3 min", "Agrega la avena y cocina 5 min", "Emplatado: sirve con plátano en rodajas"],
+    "calories": 450,
+    "carbs": 70,
+    "protein": 15,
+    "fat": 10,
+    "fiber": 7.5,
+    "sugar": 18.0,
+    "sodium": 120,
+    "time": "15 min",
+}
+
+SAMPLE_MENU = {
+    "breakfast": SAMPLE_MEAL,
+    "lunch": {**SAMPLE_MEAL, "name": "Risotto Cremoso de Pollo", "calories": 800},
+    "dinner": {**SAMPLE_MEAL, "name": "Salteado Mediterráneo", "calories": 550},
+    "note": "¡Vas excelente con tus objetivos!",
+    "total_calories": 1800,
+}
+
+
+def _stream_chunks(app: FastAPI, model: str, include_usage: bool = False, chunk_chars: int = 8):
+    """Emite el contenido en trozos: primer token tras `ttft` y el resto repartido hasta `latency`"""
+    content = app.state.content
+    pieces = [content[i:i + chunk_chars] for i in range(0, len(content), chunk_chars)]
+    gap = max(app.state.latency - app.state.ttft, 0) / max(len(pieces), 1)
+
+    async def events():
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        await asyncio.sleep(app.state.ttft)
+        for piece in pieces:
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            await asyncio.sleep(gap)
+        if include_usage:
+            # stream_options={"include_usage": true}: un último fragmento sin choices con el uso
+            usage = {"prompt_tokens": 900, "completion_tokens": len(pieces), "total_tokens": 900 + len(pieces)}
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model, "choices": [], "usage": usage}
+            yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def create_app(latency: float = 3.0, content: str | None = None, ttft: float = 0.3) -> FastAPI:
+    app = FastAPI(title="Fake OpenAI")
+    app.state.latency = latency
+    app.state.ttft = min(ttft, latency)
+    app.state.content = content or json.dumps(SAMPLE_MENU, ensure_ascii=False)
+    app.state.calls = 0
+
+    @app.post("/v1/chat/completions")
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.calls += 1
+        if body.get("stream"):
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            return _stream_chunks(app, body.get("model", "gpt-3.5-turbo"), include_usage)
+        await asyncio.sleep(app.state.latency)
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-3.5-turbo"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": app.state.content},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 900, "completion_tokens": 600, "total_tokens": 1500},
+        }
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=3.0, help="segundos de latencia por completion")
+    parser.add_argument("--ttft", type=float, default=0.3, help="segundos hasta el primer token (modo stream)")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency, ttft=args.ttft), host="127.0.0.1", port=args.port, log_level="warning")
@@ -0,0 +1,150 @@
+"""Login con Google sin red: servidor JWKS falso, tokens firmados localmente, caché fría vs caliente.
+
+Levanta un servidor que imita el endpoint de certificados de Google (con latencia inyectada
+y Cache-Control: max-age), firma ID tokens con una clave RSA local y mide /auth/google:
+- cold: las claves se vacían antes de cada login (equivale a descargarlas siempre, como antes)
+- warm: claves en caché, la firma se verifica sin red
+Además comprueba que se rechazan (401) tokens caducados, de otra audiencia, con firma alterada
+o mal formados, y que una rotación de claves (kid nuevo) se resuelve con una sola recarga; si
+alguna comprobación no da lo esperado el script termina con error.
+
+    cd backend
+    python -m benchmarks.google_auth --logins 200 --jwks-latency 0.08
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+import uuid
+
+from benchmarks import harness
+
+CLIENT_ID = "bench-web.apps.googleusercontent.com"
+# Lo que deben dar las comprobaciones de seguridad; cualquier diferencia hace fallar la ejecución
+EXPECTED_CHECKS = {
+    "expired": 401,
+    "wrong_audience": 401,
+    "bad_signature": 401,
+    "garbage": 401,
+    "rotated_key": 200,
+    "rotated_key_fetches": 1,
+}
+
+
+class SigningKey:
+    def __init__(self):
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        from jose import jwk
+
+        private = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.kid = uuid.uuid4().hex
+        self.pem = private.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+        public_pem = private.public_key().public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+        self.jwk = {**jwk.construct(public_pem, "RS256").to_dict(), "kid": self.kid, "use": "sig"}
+
+    def token(self, email: str, aud: str = CLIENT_ID, expires_in: int = 3600) -> str:
+        from jose import jwt
+
+        now = int(time.time())
+        claims = {"iss": "https://accounts.google.com", "aud": aud, "sub": email, "email": email,
+                  "given_name": "Bench", "iat": now, "exp": now + expires_in}
+        return jwt.encode(claims, self.pem, algorithm="RS256", headers={"kid": self.kid})
+
+
+def build_jwks_app(latency: float, max_age: int):
+    from fastapi import FastAPI
+    from fastapi.responses import JSONResponse
+
+    app = FastAPI()
+    app.state.keys = []
+    app.state.requests = 0
+
+    @app.get("/oauth2/v3/certs")
+    async def certs():
+        app.state.requests += 1
+        await asyncio.sleep(latency)
+        return JSONResponse({"keys": [key.jwk for key in app.state.keys]}, headers={"Cache-Control": f"public, max-age={max_age}"})
+
+    return app
+
+
+async def _sign_in(client, token: str) -> int:
+    return (await client.post("/auth/google", json={"token": token})).status_code
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--jwks-latency", type=float, default=0.08, help="segundos que tarda el servidor de claves (red hasta Google)")
+    parser.add_argument("--max-age", type=int, default=21600)
+    args = parser.parse_args()
+
+    jwks_port = harness.free_port()
+    harness.setup_isolated_env(
+        GOOGLE_JWKS_URL=f"http://127.0.0.1:{jwks_port}/oauth2/v3/certs",
+        GOOGLE_WEB_CLIENT_ID=CLIENT_ID,
+        GOOGLE_ANDROID_CLIENT_ID="bench-android.apps.googleusercontent.com",
+    )
+    import httpx
+    import google_auth
+    import main as backend
+
+    signer = SigningKey()
+    jwks_app = build_jwks_app(args.jwks_latency, args.max_age)
+    jwks_app.state.keys = [signer]
+    emails = [f"google{i}@mealia.dev" for i in range(args.users)]
+
+    async def run(base_url: str) -> dict:
+        report = {}
+        async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+            # Alta de los usuarios fuera de la medición
+            for email in emails:
+                assert await _sign_in(client, signer.token(email)) == 200
+
+            for label in ("cold", "warm"):
+                timings = []
+                jwks_before = jwks_app.state.requests
+                for i in range(args.logins):
+                    token = signer.token(emails[i % len(emails)])
+                    if label == "cold":
+                        google_auth.key_store.clear()
+                    start = time.perf_counter()
+                    assert await _sign_in(client, token) == 200
+                    timings.append(time.perf_counter() - start)
+                report[label] = {"sign_in": harness.summarize(timings), "jwks_fetches": jwks_app.state.requests - jwks_before}
+
+            forged = signer.token(emails[0])
+            forged = forged[:-8] + ("A" * 8 if not forged.endswith("A" * 8) else "B" * 8)
+            checks = {
+                "expired": await _sign_in(client, signer.token(emails[0], expires_in=-600)),
+                "wrong_audience": await _sign_in(client, signer.token(emails[0], aud="otra-app")),
+                "bad_signature": await _sign_in(client, forged),
+                "garbage": await _sign_in(client, "no-es-un-jwt"),
+            }
+            # Rotación: Google publica una clave nueva y empieza a firmar con ella
+            rotated = SigningKey()
+            jwks_app.state.keys = [signer, rotated]
+            # La recarga por kid desconocido está limitada a una cada MIN_FORCED_REFRESH_SECONDS
+            google_auth.MIN_FORCED_REFRESH_SECONDS = 0
+            jwks_before = jwks_app.state.requests
+            checks["rotated_key"] = await _sign_in(client, rotated.token(emails[0]))
+            checks["rotated_key_fetches"] = jwks_app.state.requests - jwks_before
+            report["checks"] = checks
+        return report
+
+    with harness.ServerThread(jwks_app, port=jwks_port), harness.ServerThread(backend.app) as api:
+        report = asyncio.run(run(api.url))
+    report["jwks_latency_ms"] = args.jwks_latency * 1000
+    report["key_store"] = google_auth.key_store.stats
+    print(json.dumps(report, indent=2))
+
+    mismatches = {name: report["checks"][name] for name, expected in EXPECTED_CHECKS.items() if report["checks"][name] != expected}
+    if mismatches:
+        sys.exit(f"Comprobaciones de seguridad fallidas (esperado {EXPECTED_CHECKS}): {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Utilidades compartidas por los benchmarks: entorno aislado, servidores locales y estadísticas."""
+import asyncio
+import os
+import signal
+import sys
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import asynccontextmanager
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_isolated_env(db_url: str | None = None, **extra_env) -> str:
+    """Prepara variables de entorno y un directorio temporal ANTES de importar main.
+
+    Devuelve el directorio de trabajo temporal (uploads/ y la BD SQLite quedan ahí).
+    """
+    workdir = tempfile.mkdtemp(prefix="mealia-bench-")
+    os.environ["SQLALCHEMY_DATABASE_URL"] = db_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.setdefault("SECRET_KEY", "bench-secret-key")
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+    # Los benchmarks hacen ráfagas de logins y menús desde 127.0.0.1: sin límites salvo que se pidan
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+    # /metrics y los endpoints internos piden X-Admin-Key (ver admin_headers)
+    os.environ.setdefault("ADMIN_API_KEY", "bench-admin-key")
+    for key, value in extra_env.items():
+        os.environ[key] = str(value)
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    os.chdir(workdir)
+    return workdir
+
+
+def admin_headers() -> dict:
+    """Cabecera para /metrics y los endpoints internos (clave de setup_isolated_env)"""
+    return {"X-Admin-Key": os.environ["ADMIN_API_KEY"]}
+
+
+def count_statements() -> dict:
+    """Contador {"n": sentencias SQL} sobre todos los engines de database (sync y async).
+
+    Llamar después de setup_isolated_env; poner counter["n"] = 0 antes de cada medición.
+    """
+    from sqlalchemy import event
+    import database
+
+    counter = {"n": 0}
+    engines = {database.engine, database.read_engine}
+    if database.async_engine is not None:
+        engines |= {database.async_engine.sync_engine, database.async_read_engine.sync_engine}
+
+    def _count(*_):
+        counter["n"] += 1
+
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", _count)
+    return counter
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class ServerThread:
+    """Levanta una app ASGI con uvicorn en un hilo de fondo."""
+
+    def __init__(self, app, port: int | None = None, **config):
+        import uvicorn
+
+        self.port = port or free_port()
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning", **config))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        self.thread.start()
+        deadline = time.time() + 10
+        while not self.server.started:
+            if time.time() > deadline:
+                raise RuntimeError("El servidor no arrancó a tiempo")
+            time.sleep(0.02)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+class UvicornProcess:
+    """Levanta main:app con uvicorn en un proceso aparte (un worker) y espera a /health.
+
+    `env` se añade al entorno actual (el de setup_isolated_env) y el proceso arranca en el
+    directorio de trabajo actual (uploads/ y la BD SQLite de la prueba).
+    """
+
+    def __init__(self, port: int | None = None, **env):
+        self.port = port or free_port()
+        self.env = {**os.environ, **{key: str(value) for key, value in env.items()}}
+        self.process = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        import httpx
+
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR,
+             "--host", "127.0.0.1", "--port", str(self.port), "--log-level", "warning"],
+            env=self.env, stdout=subprocess.DEVNULL,
+            # Grupo propio: al terminar se cierran también los procesos hijos (pool de contraseñas)
+            start_new_session=True,
+        )
+        deadline = time.time() + 60
+        while True:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"El servidor terminó al arrancar (código {self.process.returncode})")
+            try:
+                if httpx.get(f"{self.url}/health", timeout=2).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                pass
+            if time.time() > deadline:
+                self.__exit__()
+                raise RuntimeError("El servidor no arrancó a tiempo")
+            time.sleep(0.2)
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.wait(timeout=30)
+        if hasattr(os, "killpg"):
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+
+def install_loop_lag_probe(app, interval: float = 0.005) -> list[float]:
+    """Sonda dentro del servidor: duerme `interval` en bucle y anota cuánto se retrasa cada
+    despertar (lag del event loop, en segundos). Llamar antes de arrancar el servidor."""
+    lags = []
+
+    async def probe():
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            lags.append(max(time.perf_counter() - start - interval, 0.0))
+
+    app_lifespan = app.router.lifespan_context
+
+    @asynccontextmanager
+    async def lifespan_with_probe(app_):
+        async with app_lifespan(app_) as state:
+            task = asyncio.get_running_loop().create_task(probe())
+            yield state
+            task.cancel()
+
+    app.router.lifespan_context = lifespan_with_probe
+    return lags
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    k = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def summarize(samples: list[float]) -> dict:
+    """Resumen en milisegundos de una lista de latencias en segundos."""
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+        "max_ms": round(max(samples) * 1000, 2) if samples else 0.0,
+    }
+
+
+DEFAULT_PANTRY = ("avena", "leche", "plátano", "arroz", "pollo")
+
+
+async def register_and_login(client, email: str = "bench@mealia.dev", password: str = "bench-pass", pantry=DEFAULT_PANTRY) -> dict:
+    """Crea un usuario por la API, le llena la despensa y devuelve las cabeceras de auth."""
+    await client.post("/register", json={"email": email, "first_name": "Bench", "password": password})
+    r = await client.post("/token", data={"username": email, "password": password})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    for name in pantry:
+        await client.post("/inventory", json={"name": name, "quantity": 2, "unit": "Kg"}, headers=headers)
+    return headers
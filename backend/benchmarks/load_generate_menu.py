@@ -0,0 +1,117 @@
+"""Prueba de carga: /generate-menu lento no debe degradar los endpoints que no usan la IA.
+
+Levanta un OpenAI falso con latencia de varios segundos, lanza muchas generaciones de menú
+en paralelo y mide la latencia de /users/me e /inventory antes y durante la carga (sondas en
+un hilo con su propio event loop) y el lag del event loop del servidor.
+
+    cd backend
+    python -m benchmarks.load_generate_menu --menus 64 --latency 3
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+
+from benchmarks import harness
+
+
+async def _probe_loop(base_url: str, headers: dict, probes: int, stop: threading.Event, samples: dict):
+    import httpx
+
+    async def probe(client):
+        while not stop.is_set():
+            for path in ("/users/me", "/inventory"):
+                start = time.perf_counter()
+                r = await client.get(path, headers=headers)
+                r.raise_for_status()
+                samples[path].append(time.perf_counter() - start)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        await asyncio.gather(*(probe(client) for _ in range(probes)))
+
+
+def _start_probes(base_url: str, headers: dict, probes: int, samples: dict) -> tuple[threading.Thread, threading.Event]:
+    # Hilo y event loop propios: la ráfaga de menús del cliente (64 conexiones nuevas a la vez)
+    # no retrasa las sondas, así su latencia refleja al servidor y no al generador de carga
+    stop = threading.Event()
+    thread = threading.Thread(target=lambda: asyncio.run(_probe_loop(base_url, headers, probes, stop, samples)), daemon=True)
+    thread.start()
+    return thread, stop
+
+
+async def _run(base_url: str, menus: int, probes: int, baseline_seconds: float, lags: list) -> dict:
+    import httpx
+
+    limits = httpx.Limits(max_connections=menus + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        headers = await harness.register_and_login(client)
+
+        # 1. Línea base sin carga de IA
+        baseline = {"/users/me": [], "/inventory": []}
+        lags.clear()
+        thread, stop = _start_probes(base_url, headers, probes, baseline)
+        await asyncio.sleep(baseline_seconds)
+        stop.set()
+        thread.join()
+        baseline_lag = harness.summarize(lags)
+
+        # 2. Mismas sondas mientras se generan muchos menús
+        loaded = {"/users/me": [], "/inventory": []}
+        menu_latencies, errors = [], 0
+
+        async def generate():
+            nonlocal errors
+            start = time.perf_counter()
+            r = await client.post("/generate-menu", headers=headers)
+            if r.status_code != 200:
+                errors += 1
+            menu_latencies.append(time.perf_counter() - start)
+
+        lags.clear()
+        thread, stop = _start_probes(base_url, headers, probes, loaded)
+        start = time.perf_counter()
+        await asyncio.gather(*(generate() for _ in range(menus)))
+        wall = time.perf_counter() - start
+        stop.set()
+        thread.join()
+
+    return {
+        "menus": menus,
+        "menu_errors": errors,
+        "menu_wall_seconds": round(wall, 2),
+        "generate_menu": harness.summarize(menu_latencies),
+        "baseline": {path: harness.summarize(s) for path, s in baseline.items()},
+        "under_load": {path: harness.summarize(s) for path, s in loaded.items()},
+        # Retraso de la sonda de 5 ms dentro del servidor: bloqueos del event loop
+        "server_loop_lag": {"baseline": baseline_lag, "under_load": harness.summarize(lags)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--menus", type=int, default=64, help="generaciones de menú concurrentes")
+    parser.add_argument("--latency", type=float, default=3.0, help="latencia inyectada en el OpenAI falso (s)")
+    parser.add_argument("--probes", type=int, default=4, help="clientes concurrentes sondeando endpoints sin IA")
+    parser.add_argument("--baseline-seconds", type=float, default=2.0)
+    parser.add_argument("--llm-concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    fake_port = harness.free_port()
+    harness.setup_isolated_env(
+        OPENAI_BASE_URL=f"http://127.0.0.1:{fake_port}/v1",
+        LLM_MAX_CONCURRENCY=args.llm_concurrency,
+        # Los menús son idénticos (mismo usuario): sin esto se resolverían con una sola completion
+        MENU_COALESCE=0,
+    )
+    from benchmarks.fake_openai import create_app
+    import main as backend
+
+    lags = harness.install_loop_lag_probe(backend.app)
+    with harness.ServerThread(create_app(args.latency), port=fake_port), harness.ServerThread(backend.app) as api:
+        report = asyncio.run(_run(api.url, args.menus, args.probes, args.baseline_seconds, lags))
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Motor de menús local: tiempo de generación en proceso y latencia de /generate-menu con la IA lenta.
+
+1. En proceso: genera menús para despensas sintéticas y mide ms por menú y desviación
+   respecto al objetivo de calorías.
+2. HTTP: con un OpenAI falso más lento que el SLO, compara engine=local contra el modo
+   por defecto (IA con respaldo local al vencer el SLO).
+
+    cd backend
+    python -m benchmarks.local_menu --menus 500 --latency 5 --slo 1
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+from benchmarks import harness
+
+GOALS = ["Déficit", "Mantenimiento", "Aumentar masa"]
+UNITS = ["Unidades", "Kg", "g", "L"]
+
+
+def _synthetic_user(i: int, rng: random.Random):
+    return SimpleNamespace(id=i, first_name="Bench", weight=rng.uniform(50, 100), height=rng.uniform(1.5, 1.95), birthdate=None, goal=rng.choice(GOALS))
+
+
+def _synthetic_pantry(rng: random.Random, foods: list[str]):
+    return [SimpleNamespace(name=name, quantity=rng.choice([1, 2, 6, 500]), unit=rng.choice(UNITS)) for name in rng.sample(foods, rng.randint(5, 30))]
+
+
+def run_in_process(menus: int) -> dict:
+    import nutrition
+    from local_menu import generate_local_menu
+    from menu_generation import calculate_target_calories
+
+    rng = random.Random(3)
+    foods = sorted(nutrition._food_table())
+    generate_local_menu(_synthetic_user(0, rng), _synthetic_pantry(rng, foods), [])  # carga del corpus
+
+    timings, deviations = [], []
+    for i in range(menus):
+        user = _synthetic_user(i, rng)
+        pantry = _synthetic_pantry(rng, foods)
+        start = time.perf_counter()
+        menu = generate_local_menu(user, pantry, [])
+        timings.append(time.perf_counter() - start)
+        deviations.append(abs(menu["total_calories"] - calculate_target_calories(user)))
+    deviations.sort()
+    return {
+        "menus": menus,
+        "generate": harness.summarize(timings),
+        "calorie_deviation_kcal": {"p50": deviations[len(deviations) // 2], "max": deviations[-1], "within_50": sum(d <= 50 for d in deviations)},
+    }
+
+
+async def _run_http(base_url: str, requests: int) -> dict:
+    import httpx
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        headers = await harness.register_and_login(client)
+        results = {}
+        for label, params in (("engine_local", {"engine": "local"}), ("llm_with_fallback", {})):
+            latencies, engines = [], {}
+            for _ in range(requests):
+                start = time.perf_counter()
+                r = await client.post("/generate-menu", headers=headers, params=params)
+                latencies.append(time.perf_counter() - start)
+                engine = r.headers.get("x-menu-engine", f"status {r.status_code}")
+                engines[engine] = engines.get(engine, 0) + 1
+            results[label] = {"latency": harness.summarize(latencies), "engines": engines}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--menus", type=int, default=500, help="menús generados en proceso")
+    parser.add_argument("--requests", type=int, default=5, help="peticiones HTTP por modo")
+    parser.add_argument("--latency", type=float, default=5.0, help="latencia del OpenAI falso (s)")
+    parser.add_argument("--slo", type=float, default=1.0, help="MENU_LLM_SLO_SECONDS")
+    args = parser.parse_args()
+
+    fake_port = harness.free_port()
+    harness.setup_isolated_env(OPENAI_BASE_URL=f"http://127.0.0.1:{fake_port}/v1", MENU_LLM_SLO_SECONDS=args.slo)
+    if harness.BACKEND_DIR not in sys.path:
+        sys.path.insert(0, harness.BACKEND_DIR)
+    from benchmarks.fake_openai import create_app
+    import main as backend
+
+    report = {"in_process": run_in_process(args.menus)}
+    with harness.ServerThread(create_app(args.latency), port=fake_port), harness.ServerThread(backend.app) as api:
+        report["http"] = asyncio.run(_run_http(api.url, args.requests))
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Costo de parseo y regeneraciones evitadas: json.loads + saneado manual vs camino rápido con reparación.
+
+Genera un corpus de respuestas de IA con defectos típicos (vallas markdown, comas finales,
+colas truncadas, macros en 0, texto antes del JSON) y cuenta, para cada pipeline, cuántas
+respuestas habrían obligado a regenerar el menú completo. En las respuestas limpias se mide
+hasta el menú final (como finalize_menu) y se comprueba que cada comida se valida una sola vez
+(una llamada a meal_nutrition por comida); el script termina con error si no.
+
+    cd backend
+    python -m benchmarks.menu_parsing --responses 2000
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+from benchmarks import harness
+from benchmarks.fake_openai import SAMPLE_MENU
+
+if harness.BACKEND_DIR not in sys.path:
+    sys.path.insert(0, harness.BACKEND_DIR)
+
+import nutrition  # noqa: E402
+import schemas  # noqa: E402
+from menu_parsing import MenuParseError, parse_menu  # noqa: E402
+
+
+def _with_trailing_commas(text: str) -> str:
+    return text.replace('"time": "15 min"', '"time": "15 min",').replace('"]', '",]', 1)
+
+
+def _truncated(text: str) -> str:
+    # Corte a mitad de la cena (límite de tokens)
+    return text[: text.index('"dinner"') + 120]
+
+
+def _zero_macros(text: str) -> str:
+    return text.replace('"carbs": 70', '"carbs": 0').replace('"sodium": 120', '"sodium": 0')
+
+
+DEFECTS = {
+    "clean": lambda t: t,
+    "fenced": lambda t: f"```json\n{t}\n```",
+    "prose": lambda t: f"¡Claro! Aquí tienes tu menú:\n{t}",
+    "trailing_commas": _with_trailing_commas,
+    "truncated": _truncated,
+    "zero_macros": _zero_macros,
+}
+
+
+def build_corpus(size: int, seed: int = 7) -> list[tuple[str, str]]:
+    rng = random.Random(seed)
+    base = json.dumps(SAMPLE_MENU, ensure_ascii=False, indent=2)
+    weights = {"clean": 70, "fenced": 8, "prose": 4, "trailing_commas": 8, "truncated": 5, "zero_macros": 5}
+    kinds = rng.choices(list(weights), weights=list(weights.values()), k=size)
+    return [(kind, DEFECTS[kind](base)) for kind in kinds]
+
+
+def legacy_parse(content: str) -> dict:
+    """Pipeline anterior: json.loads, saneado recorriendo dicts y validación de pydantic aparte"""
+    menu_data = json.loads(content)
+    menu_data["total_calories"] = sum(menu_data.get(m, {}).get("calories", 0) for m in ("breakfast", "lunch", "dinner"))
+    for meal_name in ("breakfast", "lunch", "dinner"):
+        meal = menu_data.get(meal_name)
+        if not meal:
+            continue
+        cal = meal.get("calories", 500)
+        if meal.get("carbs", 0) == 0: meal["carbs"] = int((cal * 0.50) / 4)
+        if meal.get("protein", 0) == 0: meal["protein"] = int((cal * 0.20) / 4)
+        if meal.get("fat", 0) == 0: meal["fat"] = int((cal * 0.30) / 9)
+        if meal.get("sodium", 0) == 0: meal["sodium"] = int(cal * 0.5)
+        if meal.get("sugar", 0) == 0: meal["sugar"] = round(cal * 0.02, 1)
+        if meal.get("fiber", 0) == 0: meal["fiber"] = round(cal * 0.015, 1)
+        if not meal.get("time") or meal.get("time") == "0 min":
+            meal["time"] = f"{15 + len(meal.get('steps', [])) * 5} min"
+    return schemas.MenuGenerationResponse.model_validate(menu_data).model_dump()
+
+
+def new_parse(content: str) -> dict:
+    """Camino rápido hasta el menú final, como finalize_menu cuando no hay que re-preguntar"""
+    menu_data, _ = parse_menu(content)
+    return schemas.MenuGenerationResponse.model_validate(menu_data).model_dump()
+
+
+def run(size: int) -> dict:
+    corpus = build_corpus(size)
+    by_kind = {kind: 0 for kind in DEFECTS}
+    for kind, _ in corpus:
+        by_kind[kind] += 1
+
+    legacy_regens = 0
+    start = time.perf_counter()
+    for _, content in corpus:
+        try:
+            legacy_parse(content)
+        except Exception:
+            legacy_regens += 1
+    legacy_us = (time.perf_counter() - start) / size * 1e6
+
+    new_regens, meal_reasks = 0, 0
+    start = time.perf_counter()
+    for _, content in corpus:
+        try:
+            _, failed = parse_menu(content)
+            meal_reasks += len(failed)
+        except MenuParseError:
+            new_regens += 1
+    new_us = (time.perf_counter() - start) / size * 1e6
+
+    clean = [content for kind, content in corpus if kind == "clean"]
+    start = time.perf_counter()
+    for content in clean:
+        legacy_parse(content)
+    legacy_clean_us = (time.perf_counter() - start) / len(clean) * 1e6
+    calls = {"n": 0}
+    meal_nutrition = nutrition.meal_nutrition
+
+    def counting(ingredients):
+        calls["n"] += 1
+        return meal_nutrition(ingredients)
+
+    nutrition.meal_nutrition = counting
+    try:
+        start = time.perf_counter()
+        for content in clean:
+            new_parse(content)
+        new_clean_us = (time.perf_counter() - start) / len(clean) * 1e6
+    finally:
+        nutrition.meal_nutrition = meal_nutrition
+
+    return {
+        "responses": size,
+        "defects": by_kind,
+        "legacy": {"full_regenerations": legacy_regens, "parse_us_per_response": round(legacy_us, 1), "clean_us_per_response": round(legacy_clean_us, 1)},
+        "fast_path": {
+            "full_regenerations": new_regens, "single_meal_reasks": meal_reasks, "parse_us_per_response": round(new_us, 1),
+            "clean_us_per_response": round(new_clean_us, 1), "clean_nutrition_calls_per_response": calls["n"] / len(clean),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--responses", type=int, default=2000)
+    args = parser.parse_args()
+    report = run(args.responses)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if report["fast_path"]["clean_nutrition_calls_per_response"] != 3:
+        sys.exit("Cada comida de una respuesta limpia debe validarse una sola vez")
+
+
+if __name__ == "__main__":
+    main()
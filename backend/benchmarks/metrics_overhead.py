@@ -0,0 +1,140 @@
+"""Coste de las métricas (metrics.py): desactivadas vs muestreadas vs todas las peticiones.
+
+1. Micro (la mejor de REPEATS rondas intercaladas): el middleware sobre una app ASGI vacía
+   (µs por petición) y una consulta SQL trivial sin los eventos de SQLAlchemy, con ellos
+   fuera de una petición muestreada y dentro de una (µs por consulta).
+2. HTTP: la app real en un hilo con uvicorn; por rondas intercaladas (para repartir el ruido
+   entre modos) lanza una mezcla de GET /inventory, GET /sync y POST /inventory en cada modo
+   y compara latencias. También mide lo que tarda GET /metrics en renderizarse.
+
+    cd backend
+    python -m benchmarks.metrics_overhead --rounds 10 --requests 200 --sample-rate 0.1
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks import harness
+
+REPEATS = 5  # micro-mediciones: rondas intercaladas, se queda la mejor de cada modo
+
+
+def _micro_middleware(metrics, iterations: int) -> dict:
+    async def empty_app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def noop(*_):
+        return None
+
+    scope = {"type": "http", "method": "GET", "path": "/bench", "headers": []}
+    middleware = metrics.MetricsMiddleware(empty_app)
+
+    async def loop(app):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            await app(dict(scope), noop, noop)
+        return (time.perf_counter() - start) / iterations * 1e6
+
+    modes = {"bare_app_us": (empty_app, True, 0.0), "disabled_us": (middleware, False, 0.0),
+             "unsampled_us": (middleware, True, 0.0), "sampled_us": (middleware, True, 1.0)}
+    results = {label: [] for label in modes}
+    for _ in range(REPEATS):
+        for label, (app, enabled, rate) in modes.items():
+            metrics.METRICS_ENABLED, metrics.METRICS_SAMPLE_RATE = enabled, rate
+            results[label].append(asyncio.run(loop(app)))
+    return {label: round(min(samples), 2) for label, samples in results.items()}
+
+
+def _micro_sql(metrics, iterations: int) -> dict:
+    from sqlalchemy import create_engine, event, text
+    from sqlalchemy.engine import Engine
+
+    engine = create_engine("sqlite://")
+
+    def loop() -> float:
+        with engine.connect() as conn:
+            start = time.perf_counter()
+            for _ in range(iterations):
+                conn.execute(text("SELECT 1"))
+            return (time.perf_counter() - start) / iterations * 1e6
+
+    listeners = (("before_cursor_execute", metrics._before_cursor_execute), ("after_cursor_execute", metrics._after_cursor_execute))
+    results = {"no_listeners_us": [], "unsampled_us": [], "sampled_us": []}
+    loop()  # calentar la caché de sentencias
+    for _ in range(REPEATS):
+        for name, fn in listeners:
+            event.remove(Engine, name, fn)
+        results["no_listeners_us"].append(loop())
+        for name, fn in listeners:
+            event.listen(Engine, name, fn)
+        results["unsampled_us"].append(loop())
+        token = metrics._request_stats.set(metrics.RequestStats())
+        results["sampled_us"].append(loop())
+        metrics._request_stats.reset(token)
+    engine.dispose()
+    return {label: round(min(samples), 2) for label, samples in results.items()}
+
+
+async def _http(base_url: str, metrics, modes: dict, rounds: int, requests: int) -> dict:
+    import httpx
+
+    latencies = {mode: [] for mode in modes}
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        headers = await harness.register_and_login(client, pantry=[f"ingrediente {i}" for i in range(30)])
+        calls = (
+            lambda: client.get("/inventory", headers=headers),
+            lambda: client.get("/sync", params={"since": 1}, headers=headers),
+            lambda: client.post("/inventory", json={"name": "ingrediente 1", "quantity": 1}, headers=headers),
+        )
+        for n in range(rounds + 1):
+            for mode, (enabled, rate) in modes.items():
+                metrics.METRICS_ENABLED, metrics.METRICS_SAMPLE_RATE = enabled, rate
+                for i in range(requests):
+                    start = time.perf_counter()
+                    (await calls[i % len(calls)]()).raise_for_status()
+                    if n:  # la ronda 0 es de calentamiento
+                        latencies[mode].append(time.perf_counter() - start)
+
+        metrics.METRICS_ENABLED = True
+        render = []
+        for _ in range(20):
+            start = time.perf_counter()
+            r = await client.get("/metrics", headers=harness.admin_headers())
+            render.append(time.perf_counter() - start)
+        exposition = r.text
+
+    baseline = sum(latencies["disabled"]) / len(latencies["disabled"])
+    return {
+        "latency": {mode: harness.summarize(samples) for mode, samples in latencies.items()},
+        "mean_overhead_pct": {mode: round((sum(s) / len(s) / baseline - 1) * 100, 2) for mode, s in latencies.items() if mode != "disabled"},
+        "metrics_endpoint": {**harness.summarize(render), "bytes": len(exposition), "series": sum(1 for line in exposition.splitlines() if not line.startswith("#"))},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=200, help="peticiones por modo y ronda")
+    parser.add_argument("--sample-rate", type=float, default=0.1, help="fracción muestreada del modo 'sampled'")
+    parser.add_argument("--iterations", type=int, default=20000, help="iteraciones de las micro-mediciones")
+    args = parser.parse_args()
+
+    harness.setup_isolated_env()
+    import main as backend
+    import metrics
+
+    report = {
+        "micro_middleware": _micro_middleware(metrics, args.iterations),
+        "micro_sql_statement": _micro_sql(metrics, args.iterations),
+    }
+    modes = {"disabled": (False, 0.0), "sampled": (True, args.sample_rate), "full": (True, 1.0)}
+    with harness.ServerThread(backend.app) as api:
+        report["http"] = asyncio.run(_http(api.url, metrics, modes, args.rounds, args.requests))
+    report["http"]["sample_rate"] = args.sample_rate
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Motor de nutrición local: tiempo por comida, cobertura de ingredientes y tokens de salida ahorrados.
+
+Arma un corpus de listas de ingredientes "cant+unidad ing" con los alimentos de la tabla,
+mide cuánto tarda meal_nutrition (con la caché de parseo fría y caliente) y compara los
+tokens de completion de una comida con y sin los campos de calorías/macros/micros.
+También lee R veces un menú guardado (schemas.GeneratedMenu, lo que hacen /menus/today y el
+historial): la nutrición se calculó al generarlo y no se recalcula; el script termina con error si
+la lectura llama a meal_nutrition.
+
+    cd backend
+    python -m benchmarks.nutrition --meals 5000
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+from benchmarks import harness
+from benchmarks.fake_openai import SAMPLE_MENU
+
+if harness.BACKEND_DIR not in sys.path:
+    sys.path.insert(0, harness.BACKEND_DIR)
+
+import nutrition  # noqa: E402
+import schemas  # noqa: E402
+from prompt_builder import count_tokens  # noqa: E402
+
+NUTRITION_FIELDS = ("calories", "carbs", "protein", "fat", "fiber", "sugar", "sodium")
+QUANTITIES = ["{q}g {food}", "{q} g de {food}", "{n} unidad {food}", "{n} {food}", "{n} cdas {food}", "1/2 taza {food}", "{food} al gusto"]
+UNKNOWN = ["hojas de menta fresca", "ralladura de limón verde", "1 ramita de romero"]
+
+
+def build_corpus(meals: int, seed: int = 11) -> list[list[str]]:
+    rng = random.Random(seed)
+    foods = sorted(nutrition._food_table())
+    corpus = []
+    for _ in range(meals):
+        ingredients = []
+        for _ in range(rng.randint(3, 8)):
+            template = rng.choice(QUANTITIES)
+            ingredients.append(template.format(q=rng.randint(10, 250), n=rng.randint(1, 3), food=rng.choice(foods)))
+        if rng.random() < 0.2:
+            ingredients.append(rng.choice(UNKNOWN))
+        corpus.append(ingredients)
+    return corpus
+
+
+def stored_reads(reads: int) -> dict:
+    """Validar un menú guardado: como se lee (Meal) frente a recalculando la nutrición (MealDetail)"""
+    menu = schemas.MenuGenerationResponse.model_validate(
+        {**{m: SAMPLE_MENU[m] for m in ("breakfast", "lunch", "dinner")}, "note": SAMPLE_MENU["note"]}
+    ).model_dump()
+    row = {"id": 1, "menu_date": "2026-10-19", "source": "api", **menu}
+
+    calls = {"n": 0}
+    meal_nutrition = nutrition.meal_nutrition
+
+    def counting(ingredients):
+        calls["n"] += 1
+        return meal_nutrition(ingredients)
+
+    nutrition.meal_nutrition = counting
+    try:
+        start = time.perf_counter()
+        for _ in range(reads):
+            schemas.GeneratedMenu.model_validate(row)
+        stored_us = (time.perf_counter() - start) / reads * 1e6
+        stored_calls = calls["n"]
+        start = time.perf_counter()
+        for _ in range(reads):
+            schemas.MenuGenerationResponse.model_validate(row)
+        recomputed_us = (time.perf_counter() - start) / reads * 1e6
+    finally:
+        nutrition.meal_nutrition = meal_nutrition
+    return {
+        "reads": reads,
+        "us_per_read": round(stored_us, 2),
+        "us_per_read_recomputing": round(recomputed_us, 2),
+        "meal_nutrition_calls": stored_calls,
+    }
+
+
+def run(meals: int) -> dict:
+    corpus = build_corpus(meals)
+    total_ingredients = sum(len(ingredients) for ingredients in corpus)
+
+    nutrition.parse_ingredient.cache_clear()
+    nutrition.lookup_food.cache_clear()
+    start = time.perf_counter()
+    for ingredients in corpus:
+        nutrition.meal_nutrition(ingredients)
+    cold_us = (time.perf_counter() - start) / meals * 1e6
+
+    start = time.perf_counter()
+    for ingredients in corpus:
+        nutrition.meal_nutrition(ingredients)
+    warm_us = (time.perf_counter() - start) / meals * 1e6
+
+    resolved = sum(1 for ingredients in corpus for ingredient in ingredients if nutrition.parse_ingredient(ingredient)[0])
+
+    full_meal = SAMPLE_MENU["lunch"]
+    slim_meal = {k: v for k, v in full_meal.items() if k not in NUTRITION_FIELDS}
+    full_menu = {**{m: full_meal for m in ("breakfast", "lunch", "dinner")}, "note": SAMPLE_MENU["note"], "total_calories": 1800}
+    slim_menu = {**{m: slim_meal for m in ("breakfast", "lunch", "dinner")}, "note": SAMPLE_MENU["note"]}
+    full_tokens = count_tokens(json.dumps(full_menu, ensure_ascii=False, indent=2))
+    slim_tokens = count_tokens(json.dumps(slim_menu, ensure_ascii=False, indent=2))
+
+    return {
+        "meals": meals,
+        "ingredients": total_ingredients,
+        "resolved_ratio": round(resolved / total_ingredients, 3),
+        "us_per_meal_cold": round(cold_us, 2),
+        "us_per_meal_warm": round(warm_us, 2),
+        "completion_tokens": {"with_nutrition_fields": full_tokens, "local_nutrition": slim_tokens, "saved": full_tokens - slim_tokens},
+        "sample": nutrition.meal_nutrition(full_meal["ingredients"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--meals", type=int, default=5000)
+    parser.add_argument("--reads", type=int, default=5000, help="lecturas de un menú guardado")
+    args = parser.parse_args()
+    report = {**run(args.meals), "stored_menu": stored_reads(args.reads)}
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if report["stored_menu"]["meal_nutrition_calls"]:
+        sys.exit("Leer un menú guardado no debe recalcular la nutrición")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Ráfaga de logins: Argon2 en el threadpool del servidor vs en el pool de procesos dedicado.
+
+Mientras varios clientes hacen login sin parar, otro cliente mide la latencia de /health,
+que no toca contraseñas: con el hashing en el threadpool esas peticiones esperan detrás
+de Argon2. Reporta logins/s, latencias y las métricas del pool (cola, rechazos 503).
+
+    cd backend
+    python -m benchmarks.password_hashing --logins 200 --clients 16
+    ARGON2_MEMORY_COST=19456 ARGON2_TIME_COST=2 python -m benchmarks.password_hashing
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from benchmarks import harness
+
+PASSWORD = "bench-password"
+
+
+async def _register(client, users: int):
+    for i in range(users):
+        (await client.post("/register", json={"email": f"login{i}@mealia.dev", "password": PASSWORD, "first_name": "Bench"})).raise_for_status()
+
+
+async def _burst(base_url: str, users: int, logins: int, clients: int) -> dict:
+    import httpx
+
+    login_times, health_times, statuses = [], [], {}
+    done = asyncio.Event()
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        async def login_worker(worker: int, n: int):
+            for i in range(n):
+                form = {"username": f"login{(worker + i) % users}@mealia.dev", "password": PASSWORD}
+                start = time.perf_counter()
+                r = await client.post("/token", data=form)
+                login_times.append(time.perf_counter() - start)
+                statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+        async def health_probe():
+            while not done.is_set():
+                start = time.perf_counter()
+                (await client.get("/health")).raise_for_status()
+                health_times.append(time.perf_counter() - start)
+                await asyncio.sleep(0.02)
+
+        probe = asyncio.create_task(health_probe())
+        start = time.perf_counter()
+        await asyncio.gather(*(login_worker(w, logins // clients) for w in range(clients)))
+        wall = time.perf_counter() - start
+        done.set()
+        await probe
+    ok = statuses.get(200, 0)
+    return {
+        "logins_per_second": round(ok / wall, 1),
+        "status_codes": statuses,
+        "login": harness.summarize(login_times),
+        "health_during_burst": harness.summarize(health_times),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=160)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=None, help="procesos del pool (por defecto PASSWORD_HASH_WORKERS)")
+    args = parser.parse_args()
+
+    harness.setup_isolated_env()
+    import httpx
+    import main as backend
+    import password_hashing
+    import security
+
+    pool_workers = args.workers or security.PASSWORD_HASH_WORKERS or min(4, os.cpu_count() or 1)
+    report = {
+        "cpus": os.cpu_count(),
+        "argon2": {"time_cost": password_hashing.ARGON2_TIME_COST, "memory_kib": password_hashing.ARGON2_MEMORY_COST, "parallelism": password_hashing.ARGON2_PARALLELISM},
+    }
+    with harness.ServerThread(backend.app) as api:
+        async def register():
+            async with httpx.AsyncClient(base_url=api.url, timeout=120) as client:
+                await _register(client, args.users)
+        asyncio.run(register())
+
+        for label, workers in (("threadpool", 0), ("process_pool", pool_workers)):
+            security.shutdown_password_pool()
+            security.PASSWORD_HASH_WORKERS = workers
+            for key in ("submitted", "completed", "rejected", "max_in_flight"):
+                security.password_pool_stats[key] = 0
+            if workers:
+                # Arranque de los procesos fuera de la medición
+                asyncio.run(security.hash_password_async("warmup"))
+            report[label] = asyncio.run(_burst(api.url, args.users, args.logins, args.clients))
+            report[label]["pool"] = security.password_pool_snapshot()
+        security.shutdown_password_pool()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Fotos por contenido: deduplicación, coste de reabrir la app y recolección de basura.
+
+- N usuarios suben fotos elegidas de un conjunto de K imágenes distintas: objetos y bytes
+  guardados frente a lo que se guardaba antes (un archivo por subida), y latencia de una
+  subida nueva frente a una ya conocida (sin Pillow).
+- "Abrir la app" M veces: bytes descargados sin caché, revalidando con If-None-Match (304)
+  y con Cache-Control immutable (el cliente ni pregunta).
+- Los usuarios borran sus fotos y se ejecuta collect_garbage.
+
+    cd backend
+    python -m benchmarks.photo_storage --users 60 --distinct 6
+    python -m benchmarks.photo_storage --storage s3      # contra un S3 local (moto)
+"""
+import argparse
+import asyncio
+import io
+import json
+import time
+
+from benchmarks import harness
+
+S3_PORT = 5055
+
+
+def _images(count: int) -> list[bytes]:
+    from PIL import Image
+
+    images = []
+    for i in range(count):
+        noise = Image.effect_noise((200, 150), 40 + i).convert("RGB").resize((1600, 1200))
+        buffer = io.BytesIO()
+        noise.save(buffer, "JPEG", quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+def _start_s3_stand_in() -> dict:
+    import boto3
+    from moto.server import ThreadedMotoServer
+
+    ThreadedMotoServer(port=S3_PORT, verbose=False).start()
+    env = {
+        "PHOTO_STORAGE_URL": "s3://mealia-photos/avatars",
+        "PHOTO_S3_ENDPOINT_URL": f"http://127.0.0.1:{S3_PORT}",
+        "AWS_ACCESS_KEY_ID": "bench", "AWS_SECRET_ACCESS_KEY": "bench", "AWS_DEFAULT_REGION": "us-east-1",
+    }
+    boto3.client("s3", endpoint_url=env["PHOTO_S3_ENDPOINT_URL"], region_name="us-east-1",
+                 aws_access_key_id="bench", aws_secret_access_key="bench").create_bucket(Bucket="mealia-photos")
+    return env
+
+
+async def _run(base_url: str, images: list[bytes], users: int, launches: int) -> dict:
+    import httpx
+
+    report = {}
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        sessions = [await harness.register_and_login(client, email=f"foto{i}@mealia.dev", pantry=()) for i in range(users)]
+
+        first, repeated, urls = [], [], []
+        seen = set()
+        for i, headers in enumerate(sessions):
+            image_index = i % len(images)
+            start = time.perf_counter()
+            r = await client.post("/users/me/upload-photo", headers=headers, files={"file": ("foto.jpg", images[image_index], "image/jpeg")})
+            r.raise_for_status()
+            (repeated if image_index in seen else first).append(time.perf_counter() - start)
+            seen.add(image_index)
+            urls.append(r.json()["photo_url"].replace(base_url, ""))
+        report["upload"] = {"new_image": harness.summarize(first), "known_image": harness.summarize(repeated)}
+        report["uploaded_bytes"] = sum(len(images[i % len(images)]) for i in range(users))
+
+        # Reabrir la app: cada lanzamiento vuelve a mostrar el avatar
+        url = urls[0]
+        full = await client.get(url)
+        etag = full.headers["etag"]
+        no_cache = revalidate = 0
+        for _ in range(launches):
+            no_cache += len((await client.get(url)).content)
+            r = await client.get(url, headers={"If-None-Match": etag})
+            assert r.status_code == 304
+            revalidate += len(r.content)
+        report["app_launches"] = {
+            "launches": launches,
+            "no_cache_bytes": no_cache,
+            "revalidate_bytes": revalidate,
+            "revalidate_requests": launches,
+            "immutable_requests": 0,
+            "cache_control": full.headers["cache-control"],
+        }
+        r = await client.get(url, headers={"Range": "bytes=0-1023"})
+        report["range_request"] = {"status": r.status_code, "content_range": r.headers.get("content-range")}
+
+        for headers in sessions:
+            (await client.delete("/users/me/delete-photo", headers=headers)).raise_for_status()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=60)
+    parser.add_argument("--distinct", type=int, default=6, help="imágenes distintas entre todas las subidas")
+    parser.add_argument("--launches", type=int, default=50)
+    parser.add_argument("--storage", choices=("local", "s3"), default="local")
+    args = parser.parse_args()
+
+    env = _start_s3_stand_in() if args.storage == "s3" else {}
+    harness.setup_isolated_env(PHOTO_GC_GRACE_SECONDS=0, **env)
+    import database
+    import main as backend
+    import models
+    import photo_storage
+
+    images = _images(args.distinct)
+    storage = photo_storage.get_storage()
+    with harness.ServerThread(backend.app) as api:
+        report = asyncio.run(_run(api.url, images, args.users, args.launches))
+
+    db = database.SessionLocal()
+    try:
+        objects = list(storage.list_objects())
+        stored_bytes = sum(storage.size(name) for name, _ in objects)
+        report["storage"] = {
+            "backend": type(storage).__name__,
+            "uploads": args.users,
+            "blobs": db.query(models.PhotoBlob).count(),
+            "objects": len(objects),
+            "stored_bytes": stored_bytes,
+        }
+        start = time.perf_counter()
+        report["gc"] = photo_storage.collect_garbage(db, storage)
+        report["gc"]["seconds"] = round(time.perf_counter() - start, 3)
+        report["gc"]["objects_left"] = len(list(storage.list_objects()))
+    finally:
+        db.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Bloqueo del event loop con subidas de fotos concurrentes: handler anterior vs pipeline nuevo.
+
+Dentro del servidor corre una sonda que duerme 5 ms en bucle y anota cuánto se retrasa
+cada despertar (lag del event loop). Se comparan:
+- legacy: el handler anterior (shutil.copyfileobj en el event loop, sin avatares)
+- threadpool: pipeline nuevo con los avatares en hilos (PHOTO_WORKERS=0)
+- process_pool: pipeline nuevo con los avatares en el pool de procesos
+
+    cd backend
+    python -m benchmarks.photo_upload --uploads 40 --clients 8 --megapixels 12
+"""
+import argparse
+import asyncio
+import io
+import json
+import shutil
+import time
+import uuid
+
+from benchmarks import harness
+
+PROBE_INTERVAL = 0.005
+
+
+def _sample_jpeg(megapixels: float) -> bytes:
+    from PIL import Image
+
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    # Ruido a baja resolución escalado: foto "realista" de varios MB, no un color plano
+    noise = Image.effect_noise((width // 8, height // 8), 64).convert("RGB")
+    img = noise.resize((width, height), Image.Resampling.BICUBIC)
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=92)
+    return buffer.getvalue()
+
+
+def _install_legacy_route(app, security, models):
+    from fastapi import Depends, File, UploadFile
+
+    @app.post("/bench/legacy-upload")
+    async def legacy_upload(file: UploadFile = File(...), current_user: models.User = Depends(security.get_current_user)):
+        file_path = f"uploads/{uuid.uuid4()}.jpg"
+        with open(file_path, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+        return {"photo_url": file_path}
+
+
+async def _burst(base_url: str, path: str, headers: dict, payload: bytes, uploads: int, clients: int) -> dict:
+    import httpx
+
+    timings, statuses = [], {}
+    async with httpx.AsyncClient(base_url=base_url, timeout=300) as client:
+        async def worker(n: int):
+            for _ in range(n):
+                start = time.perf_counter()
+                r = await client.post(path, headers=headers, files={"file": ("foto.jpg", payload, "image/jpeg")})
+                timings.append(time.perf_counter() - start)
+                statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(uploads // clients) for _ in range(clients)))
+        wall = time.perf_counter() - start
+    return {"wall_seconds": wall, "uploads_per_second": round(len(timings) / wall, 2), "status_codes": statuses, "upload": harness.summarize(timings)}
+
+
+async def _login(base_url: str) -> dict:
+    import httpx
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        return await harness.register_and_login(client)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads", type=int, default=40)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--megapixels", type=float, default=12)
+    args = parser.parse_args()
+
+    harness.setup_isolated_env()
+    import main as backend
+    import models
+    import photos
+    import security
+
+    lags = harness.install_loop_lag_probe(backend.app, PROBE_INTERVAL)
+    _install_legacy_route(backend.app, security, models)
+    payload = _sample_jpeg(args.megapixels)
+    pool_workers = photos.PHOTO_WORKERS or 2
+    report = {"photo_bytes": len(payload), "megapixels": args.megapixels}
+
+    with harness.ServerThread(backend.app) as api:
+        headers = asyncio.run(_login(api.url))
+        modes = (("legacy", "/bench/legacy-upload", None), ("threadpool", "/users/me/upload-photo", 0), ("process_pool", "/users/me/upload-photo", pool_workers))
+        for label, path, workers in modes:
+            if workers is not None:
+                photos.shutdown_pool()
+                photos.PHOTO_WORKERS = workers
+            # Calentamiento (arranque de los procesos del pool) fuera de la medición
+            asyncio.run(_burst(api.url, path, headers, payload, 1, 1))
+            lags.clear()
+            result = asyncio.run(_burst(api.url, path, headers, payload, args.uploads, args.clients))
+            result["loop_lag"] = harness.summarize(lags)
+            result["loop_blocked_ms_total"] = round(sum(lags) * 1000, 1)
+            # Fracción del tiempo de la ráfaga con el event loop ocupado
+            result["loop_blocked_pct"] = round(100 * sum(lags) / result.pop("wall_seconds"), 1)
+            report[label] = result
+        photos.shutdown_pool()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
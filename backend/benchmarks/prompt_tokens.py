@@ -0,0 +1,77 @@
+"""Tokens y tiempo de construcción del prompt de menú para despensas de 10, 100 y 1.000 ítems.
+
+Compara el prompt anterior (despensa completa incrustada en el prompt de sistema) con el
+prompt_builder actual (sistema estático + despensa comprimida si se pasa del presupuesto).
+
+    cd backend
+    python -m benchmarks.prompt_tokens --sizes 10 100 1000
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+from benchmarks import harness
+
+if harness.BACKEND_DIR not in sys.path:
+    sys.path.insert(0, harness.BACKEND_DIR)
+
+import prompt_builder  # noqa: E402
+
+UNITS = ["Unidades", "Kg", "g", "L", "ml"]
+
+
+def synthetic_inventory(size: int, seed: int = 42) -> list:
+    rng = random.Random(seed)
+    foods = sorted(prompt_builder._category_index())
+    items = []
+    for i in range(size):
+        name = foods[i % len(foods)] + (f" {i // len(foods)}" if i >= len(foods) else "")
+        unit = rng.choice(UNITS)
+        # ~10% casi vacíos para que la compresión tenga algo que descartar
+        quantity = 0 if rng.random() < 0.1 else round(rng.uniform(0.1, 20), 2)
+        items.append(SimpleNamespace(name=name, quantity=quantity, unit=unit))
+    return items
+
+
+def legacy_prompt_tokens(items, target_calories: int) -> int:
+    """Aproximación del prompt anterior: reglas + despensa completa en cada petición"""
+    inventory_txt = prompt_builder.format_inventory_full(items)
+    return prompt_builder.count_tokens(f"{prompt_builder.SYSTEM_PROMPT}\nLista: [{inventory_txt}]\nCalorías: {target_calories}")
+
+
+def run(sizes: list[int], repeats: int, budget: int) -> list[dict]:
+    rows = []
+    for size in sizes:
+        items = synthetic_inventory(size)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            user_prompt = prompt_builder.build_user_prompt("Bench", "energético", "", 2000, items, "Déficit", budget=budget)
+        build_ms = (time.perf_counter() - start) / repeats * 1000
+        static_tokens = prompt_builder.system_prompt_tokens()
+        user_tokens = prompt_builder.count_tokens(user_prompt)
+        rows.append({
+            "items": size,
+            "legacy_prompt_tokens": legacy_prompt_tokens(items, 2000),
+            "prompt_tokens": static_tokens + user_tokens,
+            "static_prefix_tokens": static_tokens,
+            "user_tokens": user_tokens,
+            "compressed": prompt_builder.format_inventory_full(items) not in user_prompt,
+            "build_ms": round(build_ms, 3),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--budget", type=int, default=prompt_builder.PROMPT_TOKEN_BUDGET)
+    args = parser.parse_args()
+    print(json.dumps({"budget": args.budget, "results": run(args.sizes, args.repeats, args.budget)}, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Rate limit y generaciones compartidas: cuántas llamadas caras llegan de verdad al upstream.
+
+1. Doble toque: N POST /generate-menu idénticos y simultáneos del mismo usuario contra un
+   OpenAI falso con latencia. Con MENU_COALESCE hay exactamente una completion y los N reciben
+   el mismo menú (se comprueba: el script termina con error si no). Sin él, cada petición es
+   una completion y gasta una ficha de RATE_LIMIT_MENU: pasan tantas como la capacidad.
+2. Ráfaga de logins: L POST /token simultáneos desde la misma IP. Cuántos responden 200 y
+   cuántos 429 (con Retry-After), y cuántas verificaciones de Argon2 se pagaron.
+3. Menús distintos seguidos (la despensa cambia entre uno y otro): a partir de la capacidad de
+   RATE_LIMIT_MENU responden 429 sin llamar a la IA.
+
+    cd backend
+    python -m benchmarks.rate_limit --concurrent 20 --logins 50
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+from benchmarks import harness
+
+
+def _count_statuses(responses) -> dict:
+    statuses = {}
+    for r in responses:
+        statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+    return statuses
+
+
+async def _double_tap(client, headers, fake, backend, concurrent: int, coalesce: bool) -> dict:
+    backend.menu_cache.backend.clear()
+    backend.rate_limit.limiter.backend.clear()
+    backend.menu_generations.enabled = coalesce
+    calls_before = fake.state.calls
+    responses = await asyncio.gather(*(client.post("/generate-menu", headers=headers) for _ in range(concurrent)))
+    bodies = {r.text for r in responses if r.status_code == 200}
+    return {
+        "requests": concurrent,
+        "statuses": _count_statuses(responses),
+        "distinct_bodies": len(bodies),
+        "upstream_calls": fake.state.calls - calls_before,
+    }
+
+
+async def _login_burst(client, security, logins: int) -> dict:
+    verified_before = security.password_pool_stats["submitted"]
+    responses = await asyncio.gather(*(
+        client.post("/token", data={"username": "rafaga@mealia.dev", "password": "bench-pass"}) for _ in range(logins)
+    ))
+    retry_after = sorted({r.headers.get("retry-after") for r in responses if r.status_code == 429})
+    return {
+        "requests": logins,
+        "statuses": _count_statuses(responses),
+        "retry_after": retry_after,
+        "argon2_verifications": security.password_pool_stats["submitted"] - verified_before,
+    }
+
+
+async def _distinct_menus(client, headers, fake, menus: int) -> dict:
+    statuses, calls_before = [], fake.state.calls
+    for i in range(menus):
+        # Otra despensa => otra clave de caché => otra completion
+        await client.post("/inventory", json={"name": f"extra {i}", "quantity": 1, "unit": "Kg"}, headers=headers)
+        r = await client.post("/generate-menu", headers=headers)
+        statuses.append(r.status_code if r.status_code != 429 else f"429 Retry-After {r.headers.get('retry-after')}")
+    return {"statuses": statuses, "upstream_calls": fake.state.calls - calls_before}
+
+
+async def _run(base_url: str, fake, backend, concurrent: int, logins: int, menus: int) -> dict:
+    import httpx
+    import security
+
+    limits = httpx.Limits(max_connections=max(concurrent, logins) + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        headers = await harness.register_and_login(client)
+        await client.post("/register", json={"email": "rafaga@mealia.dev", "first_name": "Bench", "password": "bench-pass"})
+
+        # Cada fase empieza con los cubos llenos (las altas de arriba ya gastan fichas por IP)
+        report = {
+            "double_tap": {
+                "coalesced": await _double_tap(client, headers, fake, backend, concurrent, coalesce=True),
+                "not_coalesced": await _double_tap(client, headers, fake, backend, concurrent, coalesce=False),
+            },
+        }
+        backend.menu_generations.enabled = True
+        backend.rate_limit.limiter.backend.clear()
+        report["login_burst"] = await _login_burst(client, security, logins)
+        backend.rate_limit.limiter.backend.clear()
+        report["distinct_menus"] = await _distinct_menus(client, headers, fake, menus)
+        report["limiter"] = backend.rate_limit.limiter.stats()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrent", type=int, default=20, help="menús idénticos simultáneos")
+    parser.add_argument("--logins", type=int, default=50, help="logins simultáneos desde una IP")
+    parser.add_argument("--menus", type=int, default=8, help="menús distintos seguidos")
+    parser.add_argument("--latency", type=float, default=1.0, help="latencia del OpenAI falso (s)")
+    args = parser.parse_args()
+
+    fake_port = harness.free_port()
+    harness.setup_isolated_env(
+        OPENAI_BASE_URL=f"http://127.0.0.1:{fake_port}/v1",
+        RATE_LIMIT_ENABLED=1,
+        MENU_LLM_SLO_SECONDS=max(20, args.latency * 4),
+    )
+    from benchmarks.fake_openai import create_app
+    import main as backend
+
+    fake = create_app(args.latency)
+    with harness.ServerThread(fake, port=fake_port), harness.ServerThread(backend.app) as api:
+        report = asyncio.run(_run(api.url, fake, backend, args.concurrent, args.logins, args.menus))
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+    coalesced = report["double_tap"]["coalesced"]
+    if coalesced["upstream_calls"] != 1 or coalesced["statuses"].get(200) != args.concurrent or coalesced["distinct_bodies"] != 1:
+        sys.exit(f"Se esperaba una sola completion compartida por {args.concurrent} peticiones: {coalesced}")
+
+
+if __name__ == "__main__":
+    main()
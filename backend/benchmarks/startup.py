@@ -0,0 +1,123 @@
+"""Arranque en frío: cuánto tarda un worker en importar main y serve.py en responder /health.
+
+1. `import main` en R procesos nuevos (lo que paga cada worker sin preload): mediana y mínimo.
+2. `python -X importtime`: los módulos importados directamente por main que más tardan, y lo
+   que añadiría cada dependencia que ahora se importa en el primer uso (openai, httpx, requests).
+3. serve.py con 1 y N workers (uvicorn y, si está instalado, gunicorn con preload): segundos
+   desde el lanzamiento hasta el primer 200 de /health, migraciones incluidas.
+
+    cd backend
+    python -m benchmarks.startup --repeats 5 --workers 4
+"""
+import argparse
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks import harness
+
+DEFERRED = ("requests",)
+
+_IMPORT_MAIN = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+_IMPORT_AFTER_MAIN = (
+    "import importlib, sys, time; import main; t = time.perf_counter(); "
+    "importlib.import_module(sys.argv[1]); print(time.perf_counter() - t)"
+)
+
+
+def _python(code: str, *args: str, flags: tuple = ()) -> subprocess.CompletedProcess:
+    env = {**os.environ, "PYTHONPATH": harness.BACKEND_DIR}
+    return subprocess.run([sys.executable, *flags, "-c", code, *args], env=env, capture_output=True, text=True, check=True)
+
+
+def import_main(repeats: int) -> dict:
+    samples = [float(_python(_IMPORT_MAIN).stdout) * 1000 for _ in range(repeats)]
+    return {"runs": repeats, "p50_ms": round(statistics.median(samples), 1), "min_ms": round(min(samples), 1)}
+
+
+def import_breakdown(top: int) -> list[dict]:
+    """Módulos a profundidad 1 bajo main (o ya cargados por el intérprete), por tiempo acumulado"""
+    stderr = _python("import main", flags=("-X", "importtime")).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth <= 1 and name.strip() != "main":
+            rows.append({"module": name.strip(), "cumulative_ms": round(int(cumulative) / 1000, 1)})
+    return sorted(rows, key=lambda row: row["cumulative_ms"], reverse=True)[:top]
+
+
+def deferred_imports() -> dict:
+    """Lo que cuesta cada import diferido una vez cargado main (lo que se ahorra el arranque)"""
+    return {name: round(float(_python(_IMPORT_AFTER_MAIN, name).stdout) * 1000, 1) for name in DEFERRED}
+
+
+def time_to_health(server: str, workers: int) -> float:
+    import httpx
+
+    port = harness.free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(harness.BACKEND_DIR, "serve.py"), "--server", server,
+         "--workers", str(workers), "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True,
+    )
+    try:
+        deadline = started + 120
+        while time.perf_counter() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"serve.py terminó al arrancar (código {process.returncode})")
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/health", timeout=2).status_code == 200:
+                    return round(time.perf_counter() - started, 2)
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.05)
+        raise RuntimeError("serve.py no arrancó a tiempo")
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        finally:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="N de la prueba con varios workers")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    harness.setup_isolated_env()
+    servers = ["uvicorn"]
+    try:
+        import gunicorn  # noqa: F401
+        servers.insert(0, "gunicorn")
+    except ImportError:
+        pass
+
+    report = {
+        "cpus": os.cpu_count(),
+        "import_main": import_main(args.repeats),
+        "slowest_imports": import_breakdown(args.top),
+        "deferred_imports_ms": deferred_imports(),
+        "time_to_health_s": {
+            server: {str(workers): time_to_health(server, workers) for workers in sorted({1, args.workers})}
+            for server in servers
+        },
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Benchmark de tiempo hasta la primera comida: /generate-menu vs /generate-menu/stream.
+
+Usa el OpenAI falso en modo streaming (primer token tras --ttft, resto repartido hasta
+--latency) y limpia la caché de menús entre corridas para medir siempre una generación real.
+
+    cd backend
+    python -m benchmarks.stream_generate_menu --runs 10 --latency 4
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks import harness
+
+
+async def _run(base_url: str, runs: int, cache) -> dict:
+    import httpx
+
+    blocking, first_meal, stream_total, first_token = [], [], [], []
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        headers = await harness.register_and_login(client)
+
+        for _ in range(runs):
+            cache.backend.clear()
+            start = time.perf_counter()
+            r = await client.post("/generate-menu", headers=headers)
+            r.raise_for_status()
+            blocking.append(time.perf_counter() - start)
+
+            cache.backend.clear()
+            start = time.perf_counter()
+            got_token = got_meal = False
+            event = None
+            async with client.stream("POST", "/generate-menu/stream", headers=headers) as r:
+                r.raise_for_status()
+                async for line in r.aiter_lines():
+                    if line.startswith("event: "):
+                        event = line[len("event: "):]
+                    elif line.startswith("data: "):
+                        if event == "token" and not got_token:
+                            got_token = True
+                            first_token.append(time.perf_counter() - start)
+                        elif event == "meal" and not got_meal:
+                            got_meal = True
+                            first_meal.append(time.perf_counter() - start)
+                        elif event == "error":
+                            raise RuntimeError(line)
+            stream_total.append(time.perf_counter() - start)
+
+    return {
+        "runs": runs,
+        "blocking_first_meal": harness.summarize(blocking),
+        "stream_first_token": harness.summarize(first_token),
+        "stream_first_meal": harness.summarize(first_meal),
+        "stream_total": harness.summarize(stream_total),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=4.0, help="duración total de la completion falsa (s)")
+    parser.add_argument("--ttft", type=float, default=0.3, help="tiempo hasta el primer token (s)")
+    args = parser.parse_args()
+
+    fake_port = harness.free_port()
+    harness.setup_isolated_env(OPENAI_BASE_URL=f"http://127.0.0.1:{fake_port}/v1")
+    from benchmarks.fake_openai import create_app
+    import main as backend
+
+    with harness.ServerThread(create_app(args.latency, ttft=args.ttft), port=fake_port), harness.ServerThread(backend.app) as api:
+        report = asyncio.run(_run(api.url, args.runs, backend.menu_cache))
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
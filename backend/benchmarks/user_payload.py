@@ -0,0 +1,81 @@
+"""Tamaño y coste de las respuestas: usuario sin despensa vs con ella, json vs orjson, GZip/Brotli.
+
+- /users/me antes devolvía siempre la despensa (igual que hoy ?include=inventory): bytes,
+  sentencias SQL y latencia de la versión ligera frente a la completa.
+- Serialización del mismo contenido con JSONResponse (json.dumps) y ORJSONResponse.
+- Bytes de /inventory sin comprimir, con GZip y con Brotli.
+
+    cd backend
+    python -m benchmarks.user_payload --pantry 300
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks import harness
+
+
+def _time_render(response_class, content, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response_class(content)
+        samples.append(time.perf_counter() - start)
+    return harness.summarize(samples)
+
+
+async def _run(base_url: str, pantry: int, requests: int, counter: dict) -> tuple[dict, dict]:
+    import httpx
+
+    report = {}
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        headers = await harness.register_and_login(client, pantry=())
+        operations = [{"op": "add", "name": f"ingrediente de prueba {i}", "quantity": 1 + i % 5, "unit": "Unidades"} for i in range(pantry)]
+        (await client.post("/inventory/batch", json={"operations": operations}, headers=headers)).raise_for_status()
+
+        identity = {**headers, "Accept-Encoding": "identity"}
+        for label, path in (("slim", "/users/me"), ("with_inventory", "/users/me?include=inventory")):
+            timings, statements = [], []
+            for _ in range(requests):
+                counter["n"] = 0
+                start = time.perf_counter()
+                r = await client.get(path, headers=identity)
+                timings.append(time.perf_counter() - start)
+                statements.append(counter["n"])
+            report[label] = {"bytes": len(r.content), "sql_statements": max(statements), "latency": harness.summarize(timings)}
+        full_user = r.json()
+
+        sizes = {}
+        for encoding in ("identity", "gzip", "br"):
+            r = await client.get("/inventory", headers={**headers, "Accept-Encoding": encoding})
+            sizes[encoding] = {"wire_bytes": len(r.content) if encoding == "identity" else int(r.headers["content-length"]), "content_encoding": r.headers.get("content-encoding")}
+        report["inventory_compression"] = sizes
+    return report, full_user
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pantry", type=int, default=300)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    harness.setup_isolated_env()
+    from fastapi.responses import JSONResponse, ORJSONResponse
+    import main as backend
+
+    counter = harness.count_statements()
+
+    with harness.ServerThread(backend.app) as api:
+        report, full_user = asyncio.run(_run(api.url, args.pantry, args.requests, counter))
+    report["pantry_items"] = args.pantry
+    report["serialization"] = {
+        "payload_bytes": len(json.dumps(full_user)),
+        "json": _time_render(JSONResponse, full_user, args.requests),
+        "orjson": _time_render(ORJSONResponse, full_user, args.requests),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Compresión de respuestas (Brotli o GZip) por encima de un tamaño mínimo.
+
+Solo se comprimen respuestas completas en un único mensaje (JSON de la API). Los streams
+(SSE de /generate-menu/stream), las respuestas parciales (Range) y las que ya traen
+Content-Encoding pasan sin tocar. Brotli se usa si el cliente lo acepta y está instalado
+el paquete 'brotli'; si no, GZip.
+"""
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:  # está en requirements.txt; sin él (instalación a mano) se usa GZip
+    brotli = None
+
+RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", 1024))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # buen equilibrio CPU/tamaño para respuestas dinámicas
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    accepted = {part.split(";")[0].strip().lower() for part in accept_encoding.split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = RESPONSE_COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None or b"range" in headers:
+            return await self.app(scope, receive, send)
+
+        start_message = None
+
+        async def compressing_send(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                # Se retiene hasta ver el cuerpo: si se comprime cambian las cabeceras
+                start_message = message
+                return
+            if start_message is None:
+                return await send(message)
+            start, start_message = start_message, None
+            body = message.get("body", b"")
+            if message.get("more_body") or not self._compressible(start, body):
+                await send(start)
+                return await send(message)
+            compressed = compress(body, encoding)
+            vary = [v for k, v in start["headers"] if k.lower() == b"vary"]
+            response_headers = [(k, v) for k, v in start["headers"] if k.lower() not in (b"content-length", b"vary")]
+            response_headers += [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(compressed)).encode()),
+                (b"vary", b", ".join(vary + [b"Accept-Encoding"])),
+            ]
+            await send({**start, "headers": response_headers})
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, compressing_send)
+
+    def _compressible(self, start: dict, body: bytes) -> bool:
+        if start["status"] in (204, 206, 304) or len(body) < self.minimum_size:
+            return False
+        headers = {k.lower(): v for k, v in start["headers"]}
+        if b"content-encoding" in headers:
+            return False
+        content_type = headers.get(b"content-type", b"").decode("latin-1")
+        return content_type.startswith(COMPRESSIBLE_TYPES)
@@ -1,7 +1,33 @@
+"""Engines y sesiones de SQLAlchemy, configurados según el dialecto de la URL.
+
+- SQLite: WAL (los lectores no bloquean al escritor ni al revés), synchronous=NORMAL
+  (seguro con WAL), mmap y busy_timeout para esperar al escritor en vez de fallar.
+- Postgres: QueuePool dimensionado, pre_ping (conexiones cortadas por el proveedor),
+  reciclado y statement_timeout por conexión.
+- Réplica de lectura opcional (SQLALCHEMY_READ_REPLICA_URL): la usan los GET que solo
+  leen (get_read_session). Sin réplica, se usa el mismo engine que para escribir.
+
+Sesiones de los endpoints (DB_SESSION_MODE):
+- "async": AsyncSession sobre aiosqlite/asyncpg. La lógica de BD sigue escrita con la API
+  síncrona del ORM y se ejecuta con run_db, que la corre en un greenlet de la sesión: la
+  E/S se espera en el event loop y ninguna petición ocupa un hilo.
+- "sync": Session clásica; run_db ejecuta la misma función en el threadpool de Starlette.
+- "auto" (por defecto): async con Postgres, sync con SQLite. aiosqlite no hace E/S async
+  de verdad (cada consulta salta a un hilo y vuelve al loop), así que con SQLite solo añade
+  saltos: con cientos de clientes rinde menos que el threadpool.
+
+SessionLocal (síncrona) sigue disponible para scripts, migraciones y tareas en lote.
+"""
 import os
-from sqlalchemy import create_engine
+from contextlib import asynccontextmanager
+from typing import Callable, TypeVar, Union
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 
 
@@ -9,16 +35,151 @@ load_dotenv()
 SQLALCHEMY_DATABASE_URL = os.getenv("SQLALCHEMY_DATABASE_URL")
 
 if SQLALCHEMY_DATABASE_URL is None:
-    
+
     SQLALCHEMY_DATABASE_URL = "sqlite:///./mealia.db"
 
+SQLALCHEMY_READ_REPLICA_URL = os.getenv("SQLALCHEMY_READ_REPLICA_URL") or None
+DB_SESSION_MODE = os.getenv("DB_SESSION_MODE", "auto")
+
+# Pool de Postgres (por proceso: con N workers de uvicorn hay N pools)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT_SECONDS = int(os.getenv("DB_POOL_TIMEOUT_SECONDS", 30))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", 1800))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 15000))  # 0 = sin límite
+# SQLite
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+SQLITE_MMAP_BYTES = int(os.getenv("SQLITE_MMAP_BYTES", 256 * 1024 * 1024))
+
+APPLICATION_NAME = "mealia-backend"
+# Driver async de cada dialecto (el síncrono es el de la URL)
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+T = TypeVar("T")
+DbSession = Union[AsyncSession, Session]
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        # journal_mode=WAL queda guardado en el archivo; el resto es por conexión
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_BYTES}")
+    finally:
+        cursor.close()
+
+
+def _normalize_url(url: str) -> str:
+    # Render/Heroku entregan postgres://, que SQLAlchemy 2 ya no acepta
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    return url
+
+
+def _is_sqlite_file(url) -> bool:
+    return make_url(url).database not in (None, "", ":memory:")
+
+
+def _postgres_pool_options() -> dict:
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": True,
+    }
+
+
+def create_db_engine(url: str) -> Engine:
+    """Engine con la configuración de producción de su dialecto"""
+    url = _normalize_url(url)
+    backend = make_url(url).get_backend_name()
+
+    if backend == "sqlite":
+        engine = create_engine(
+            url,
+            # El timeout del driver (segundos) y busy_timeout son el mismo mecanismo
+            connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+        )
+        if _is_sqlite_file(url):
+            event.listen(engine, "connect", _sqlite_pragmas)
+        return engine
+
+    if backend == "postgresql":
+        connect_args = {"application_name": APPLICATION_NAME}
+        if DB_STATEMENT_TIMEOUT_MS > 0:
+            connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+        return create_engine(url, connect_args=connect_args, **_postgres_pool_options())
+
+    return create_engine(url, pool_pre_ping=True)
+
+
+def create_async_db_engine(url: str) -> AsyncEngine:
+    """Equivalente async de create_db_engine (aiosqlite / asyncpg)"""
+    url = make_url(_normalize_url(url))
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(f"DB_SESSION_MODE=async no soporta {backend}; usa DB_SESSION_MODE=sync")
+    driver = ASYNC_DRIVERS[backend]
+    try:
+        __import__(driver)
+    except ImportError as e:
+        raise RuntimeError(f"DB_SESSION_MODE=async requiere el paquete '{driver}' (pip install {driver}) o usa DB_SESSION_MODE=sync") from e
+    url = url.set(drivername=f"{backend}+{driver}")
+
+    if backend == "sqlite":
+        engine = create_async_engine(url, connect_args={"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000})
+        if _is_sqlite_file(url):
+            event.listen(engine.sync_engine, "connect", _sqlite_pragmas)
+        return engine
+
+    server_settings = {"application_name": APPLICATION_NAME}
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        server_settings["statement_timeout"] = str(DB_STATEMENT_TIMEOUT_MS)
+    return create_async_engine(url, connect_args={"server_settings": server_settings}, **_postgres_pool_options())
+
+
+def dispose_engines(close: bool = True):
+    """Descarta las conexiones de todos los pools. Tras un fork, close=False: las conexiones
+    heredadas son del proceso padre y no se cierran desde el hijo"""
+    engines = {engine, read_engine}
+    if async_engine is not None:
+        engines |= {async_engine.sync_engine, async_read_engine.sync_engine}
+    for each in engines:
+        each.dispose(close=close)
+
+
+def pool_status() -> dict:
+    engines = {"primary": engine, "replica": read_engine}
+    if DB_SESSION_MODE == "async":
+        engines = {"primary": async_engine.sync_engine, "replica": async_read_engine.sync_engine}
+    status = {"mode": DB_SESSION_MODE, "primary": engines["primary"].pool.status()}
+    if engines["replica"] is not engines["primary"]:
+        status["replica"] = engines["replica"].pool.status()
+    return status
+
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, 
-    connect_args={"check_same_thread": False} 
-)
+engine = create_db_engine(SQLALCHEMY_DATABASE_URL)
+read_engine = create_db_engine(SQLALCHEMY_READ_REPLICA_URL) if SQLALCHEMY_READ_REPLICA_URL else engine
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+if DB_SESSION_MODE == "auto":
+    DB_SESSION_MODE = "async" if make_url(_normalize_url(SQLALCHEMY_DATABASE_URL)).get_backend_name() == "postgresql" else "sync"
+
+if DB_SESSION_MODE == "async":
+    async_engine = create_async_db_engine(SQLALCHEMY_DATABASE_URL)
+    async_read_engine = create_async_db_engine(SQLALCHEMY_READ_REPLICA_URL) if SQLALCHEMY_READ_REPLICA_URL else async_engine
+    # expire_on_commit=False: los objetos se siguen leyendo fuera del greenlet tras el commit
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
+elif DB_SESSION_MODE == "sync":
+    async_engine = async_read_engine = AsyncSessionLocal = AsyncReadSessionLocal = None
+else:
+    raise RuntimeError(f"DB_SESSION_MODE no soportado: {DB_SESSION_MODE} (usa auto, async o sync)")
 
 Base = declarative_base()
 
@@ -27,4 +188,52 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def get_read_db():
+    """Sesión síncrona de solo lectura: réplica si está configurada (puede ir algo retrasada)"""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# --- Sesiones de los endpoints (async o sync según DB_SESSION_MODE) ---
+
+@asynccontextmanager
+async def open_session(read_only: bool = False):
+    if DB_SESSION_MODE == "async":
+        async with (AsyncReadSessionLocal if read_only else AsyncSessionLocal)() as db:
+            yield db
+        return
+    # Mismo comportamiento que en modo async: los objetos no caducan al hacer commit
+    db = (ReadSessionLocal if read_only else SessionLocal)(expire_on_commit=False)
+    try:
+        yield db
+    finally:
+        await run_in_threadpool(db.close)
+
+async def get_session():
+    async with open_session() as db:
+        yield db
+
+async def get_read_session():
+    """Para endpoints de solo lectura: réplica si está configurada (puede ir algo retrasada)"""
+    async with open_session(read_only=True) as db:
+        yield db
+
+async def run_db(db: DbSession, fn: Callable[..., T], *args, **kwargs) -> T:
+    """Ejecuta fn(session, *args, **kwargs) sin bloquear el event loop.
+
+    Con AsyncSession, fn corre en su greenlet (E/S async, sin hilo); con Session, en el
+    threadpool. fn debe devolver datos ya cargados (esquemas o columnas): fuera de fn no
+    se puede hacer carga perezosa.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+def sync_session(db: DbSession) -> Session:
+    """La Session síncrona de db, para operaciones sin E/S (add, merge(load=False)...)"""
+    return db.sync_session if isinstance(db, AsyncSession) else db
@@ -0,0 +1,152 @@
+"""Verificación local de ID tokens de Google con las claves públicas (JWKS) en caché.
+
+Antes cada login con Google descargaba los certificados de Google (transporte nuevo, sin
+reutilizar conexiones) antes de verificar nada. Ahora las claves viven en memoria hasta
+que vence su Cache-Control max-age, se renuevan en segundo plano un poco antes, y la firma
+se verifica sin red. Un 'kid' desconocido (rotación de claves) fuerza una recarga.
+"""
+import logging
+import os
+import re
+import threading
+import time
+
+from jose import jwt, JWTError
+
+GOOGLE_JWKS_URL = os.getenv("GOOGLE_JWKS_URL", "https://www.googleapis.com/oauth2/v3/certs")
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+# Sin Cache-Control se guardan 1 h; se renuevan en segundo plano cuando queda menos de REFRESH_AHEAD
+DEFAULT_MAX_AGE_SECONDS = 3600
+REFRESH_AHEAD_SECONDS = 300
+# Un kid desconocido recarga las claves como mucho una vez por este intervalo (tokens basura)
+MIN_FORCED_REFRESH_SECONDS = 30
+FETCH_TIMEOUT_SECONDS = 5
+CLOCK_SKEW_SECONDS = 10
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+logger = logging.getLogger(__name__)
+
+
+class GoogleKeyStore:
+    """Claves públicas de Google por 'kid', con caducidad según Cache-Control"""
+
+    def __init__(self, url: str = GOOGLE_JWKS_URL):
+        self.url = url
+        self._keys: dict[str, dict] = {}
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._session = None  # requests.Session, creada en la primera recarga
+        self.stats = {"fetches": 0, "background_refreshes": 0, "fetch_errors": 0}
+
+    def _http(self):
+        # Sesión con pool de conexiones (keep-alive) reutilizada en cada recarga.
+        # requests se importa aquí: solo hace falta si hay login con Google
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+            self._session = session
+        return self._session
+
+    def refresh(self):
+        response = self._http().get(self.url, timeout=FETCH_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        keys = {key["kid"]: key for key in response.json()["keys"]}
+        match = _MAX_AGE_RE.search(response.headers.get("Cache-Control", ""))
+        max_age = int(match.group(1)) if match else DEFAULT_MAX_AGE_SECONDS
+        now = time.monotonic()
+        self._keys, self._fetched_at, self._expires_at = keys, now, now + max_age
+        self.stats["fetches"] += 1
+
+    def _refresh_locked(self, reason: str):
+        """reason: 'expired', 'unknown_kid' o 'ahead' (renovación anticipada en segundo plano)"""
+        with self._lock:
+            now = time.monotonic()
+            # Otro hilo pudo recargar mientras esperábamos el lock
+            if reason == "expired" and now < self._expires_at:
+                return
+            if reason == "unknown_kid" and self._fetched_at and now - self._fetched_at < MIN_FORCED_REFRESH_SECONDS:
+                return
+            try:
+                self.refresh()
+            # requests.RequestException hereda de OSError
+            except (OSError, ValueError, KeyError) as e:
+                self.stats["fetch_errors"] += 1
+                # Con claves (aunque vencidas) se sigue verificando: Google las rota con solapamiento
+                if not self._keys:
+                    raise RuntimeError(f"No se pudieron obtener las claves de Google: {e}")
+                logger.warning("Recarga de claves de Google fallida, se usan las anteriores: %s", e)
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self._refresh_locked("ahead")
+                self.stats["background_refreshes"] += 1
+            except RuntimeError as e:
+                logger.warning("%s", e)
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name="google-jwks-refresh", daemon=True).start()
+
+    def prefetch(self):
+        """Carga las claves en segundo plano (al arrancar) para que el primer login no espere"""
+        self._refresh_in_background()
+
+    def get_key(self, kid: str) -> dict:
+        now = time.monotonic()
+        if now >= self._expires_at:
+            self._refresh_locked("expired")
+        elif now >= self._expires_at - REFRESH_AHEAD_SECONDS:
+            self._refresh_in_background()
+        if kid not in self._keys:
+            self._refresh_locked("unknown_kid")
+        key = self._keys.get(kid)
+        if key is None:
+            raise ValueError(f"Clave de firma desconocida: {kid}")
+        return key
+
+    def clear(self):
+        with self._lock:
+            self._keys, self._expires_at, self._fetched_at = {}, 0.0, 0.0
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+key_store = GoogleKeyStore()
+
+
+def verify_google_id_token(token: str, audiences: list[str], store: GoogleKeyStore = key_store) -> dict:
+    """Verifica firma, emisor, audiencia y caducidad; devuelve los claims. ValueError si no es válido"""
+    try:
+        header = jwt.get_unverified_header(token)
+    except JWTError as e:
+        raise ValueError(f"Token mal formado: {e}")
+    if header.get("alg") != "RS256" or "kid" not in header:
+        raise ValueError("Algoritmo o kid inválidos")
+    key = store.get_key(header["kid"])
+    try:
+        claims = jwt.decode(
+            token, key, algorithms=["RS256"],
+            options={"verify_aud": False, "verify_at_hash": False, "leeway": CLOCK_SKEW_SECONDS},
+        )
+    except JWTError as e:
+        raise ValueError(str(e))
+    if claims.get("iss") not in GOOGLE_ISSUERS:
+        raise ValueError(f"Emisor inválido: {claims.get('iss')}")
+    if claims.get("aud") not in audiences:
+        raise ValueError(f"Audiencia inválida: {claims.get('aud')}")
+    return claims
@@ -0,0 +1,86 @@
+"""Operaciones de inventario en lote: una transacción y un puñado de sentencias para N ítems.
+
+Las operaciones se aplican en orden. Cada tramo consecutivo de la misma operación se
+resume por nombre (sumas para add/decrement, último valor para set) y se ejecuta como
+un solo executemany: INSERT ... ON CONFLICT (owner_id, name) DO UPDATE en SQLite y
+Postgres, y UPDATE/DELETE con parámetros para decrement/remove.
+
+Todo el lote comparte una versión de sincronización (sync.next_version): las filas
+escritas la llevan en `version` y las borradas dejan su lápida (ver sync.py).
+"""
+from itertools import groupby
+
+from sqlalchemy import and_, bindparam, delete, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+import models
+import schemas
+import sync
+
+_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+_table = models.InventoryItem.__table__
+
+
+def normalize_item_name(name: str) -> str:
+    return name.strip().lower()
+
+
+def _upsert(db: Session, owner_id: int, rows: list[dict], accumulate: bool, version: int):
+    dialect = db.get_bind().dialect.name
+    if dialect not in _INSERTS:
+        raise NotImplementedError(f"Upsert de inventario no soportado en {dialect}")
+    stmt = _INSERTS[dialect](_table)
+    # add: suma a lo que hubiera (mismo comportamiento que POST /inventory); set: reemplaza cantidad y unidad
+    set_ = {"quantity": _table.c.quantity + stmt.excluded.quantity} if accumulate else {"quantity": stmt.excluded.quantity, "unit": stmt.excluded.unit}
+    stmt = stmt.on_conflict_do_update(index_elements=[_table.c.owner_id, _table.c.name], set_={**set_, "version": stmt.excluded.version})
+    db.execute(stmt, [{"owner_id": owner_id, "version": version, **row} for row in rows])
+
+
+def _decrement(db: Session, owner_id: int, amounts: dict[str, float], version: int):
+    params = [{"b_owner": owner_id, "b_name": name, "b_qty": qty} for name, qty in amounts.items()]
+    match = and_(_table.c.owner_id == bindparam("b_owner"), _table.c.name == bindparam("b_name"))
+    # Lo que se queda en 0 o menos se elimina (igual que /inventory/decrement con la última unidad)
+    emptied = _table.c.quantity <= bindparam("b_qty")
+    sync.record_deletions(db, sync.INVENTORY, version, match, emptied, params=params)
+    db.execute(delete(_table).where(match, emptied), params)
+    db.execute(update(_table).where(match).values(quantity=_table.c.quantity - bindparam("b_qty"), version=version), params)
+
+
+def apply_inventory_batch(db: Session, owner_id: int, operations: list[schemas.InventoryOperation]) -> tuple[list[models.InventoryItem], list[str]]:
+    """Aplica las operaciones en una transacción. Devuelve (filas resultantes de los ítems tocados, nombres que ya no existen)."""
+    touched = []
+    version = sync.next_version(db, owner_id)
+    for op, run in groupby(operations, key=lambda o: o.op):
+        merged: dict[str, schemas.InventoryOperation] = {}
+        amounts: dict[str, float] = {}
+        for operation in run:
+            name = normalize_item_name(operation.name)
+            if not name:
+                raise ValueError("Nombre vacío")
+            touched.append(name)
+            if op in ("add", "decrement"):
+                amounts[name] = amounts.get(name, 0.0) + operation.quantity
+            merged.setdefault(name, operation)
+            if op == "set":
+                merged[name] = operation  # el último gana
+
+        if op == "add":
+            _upsert(db, owner_id, [{"name": n, "quantity": q, "unit": merged[n].unit or "Unidades"} for n, q in amounts.items()], accumulate=True, version=version)
+        elif op == "set":
+            _upsert(db, owner_id, [{"name": n, "quantity": o.quantity, "unit": o.unit} for n, o in merged.items()], accumulate=False, version=version)
+        elif op == "decrement":
+            _decrement(db, owner_id, amounts, version)
+        elif op == "remove":
+            match = (_table.c.owner_id == owner_id, _table.c.name.in_(list(merged)))
+            sync.record_deletions(db, sync.INVENTORY, version, *match)
+            db.execute(delete(_table).where(*match))
+
+    db.commit()
+    names = list(dict.fromkeys(touched))
+    items = (db.query(models.InventoryItem)
+             .filter(models.InventoryItem.owner_id == owner_id, models.InventoryItem.name.in_(names))
+             .order_by(models.InventoryItem.name)
+             .all())
+    present = {item.name for item in items}
+    return items, [name for name in names if name not in present]
@@ -0,0 +1,111 @@
+import os
+import asyncio
+from typing import AsyncIterator, Optional
+
+import httpx
+from dotenv import load_dotenv
+# Importado al cargar el módulo (~0,5-0,8 s): con serve.py/gunicorn (preload) lo paga una vez el
+# maestro y lo heredan los workers; importarlo en la primera petición bloqueaba el event loop
+from openai import AsyncOpenAI
+
+from metrics import LLMSpan
+
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '.env'))
+
+# --- Configuración del cliente LLM ---
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+# Máximo de completions simultáneas hacia OpenAI (el resto espera su turno)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 16))
+# Pool de conexiones HTTP compartido por todas las peticiones
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 32))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", 16))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", 60))
+
+_client: Optional[AsyncOpenAI] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def init_client() -> AsyncOpenAI:
+    """Crea el cliente compartido. main.lifespan lo llama al arrancar cada worker (nunca en el
+    maestro de gunicorn: el pool HTTP no sobrevive a un fork)"""
+    global _client
+    if _client is None:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_KEEPALIVE),
+            timeout=httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=5.0),
+        )
+        # OPENAI_BASE_URL permite apuntar a un servidor falso en benchmarks
+        client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_BASE_URL") or None,
+            http_client=http_client,
+        )
+        # openai carga los recursos (chat.completions...) en el primer acceso: que sea aquí
+        client.chat.completions
+        _client = client
+    return _client
+
+
+def get_client() -> AsyncOpenAI:
+    """Devuelve el cliente AsyncOpenAI compartido (scripts sin lifespan: se crea en el primer uso)"""
+    return _client or init_client()
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return _semaphore
+
+
+async def chat_completion(messages: list[dict], model: Optional[str] = None, **kwargs) -> str:
+    """Pide una completion sin bloquear el event loop y devuelve el texto de la respuesta"""
+    span = LLMSpan("chat")
+    try:
+        async with _get_semaphore():
+            span.acquired()
+            completion = await get_client().chat.completions.create(
+                model=model or OPENAI_MODEL,
+                messages=messages,
+                **kwargs,
+            )
+    except BaseException:
+        span.finish(error=True)
+        raise
+    span.usage(completion.usage)
+    span.finish()
+    return completion.choices[0].message.content
+
+
+async def stream_chat_completion(messages: list[dict], model: Optional[str] = None, **kwargs) -> AsyncIterator[str]:
+    """Igual que chat_completion pero va entregando los fragmentos de texto según llegan"""
+    span = LLMSpan("stream")
+    try:
+        async with _get_semaphore():
+            span.acquired()
+            stream = await get_client().chat.completions.create(
+                model=model or OPENAI_MODEL,
+                messages=messages,
+                stream=True,
+                # El último fragmento trae el uso de tokens (sin choices)
+                stream_options={"include_usage": True},
+                **kwargs,
+            )
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    span.usage(chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    span.first_token()
+                    yield chunk.choices[0].delta.content
+    except BaseException:
+        span.finish(error=True)
+        raise
+    span.finish()
+
+
+async def close_client():
+    """Cierra el pool HTTP compartido (al apagar la app)"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
@@ -0,0 +1,290 @@
+"""Motor de menús local (sin IA): recetas del corpus + recetas guardadas del usuario, filtradas
+contra la despensa con un índice invertido de ingredientes, y porciones ajustadas para llegar
+al objetivo de calorías (±CALORIE_TOLERANCE) con la tabla nutricional local.
+
+Se usa con /generate-menu?engine=local y como respaldo automático cuando la IA no responde
+dentro del SLO. Todo es CPU en memoria: un menú tarda unos pocos milisegundos.
+"""
+import os
+import json
+import random
+from collections import defaultdict
+from dataclasses import dataclass, replace
+from datetime import date
+from functools import lru_cache
+from typing import Optional
+
+import models
+import nutrition
+import schemas
+from menu_generation import CALORIE_TOLERANCE, calculate_target_calories
+from menu_stream import MEAL_NAMES
+from prompt_builder import DATA_DIR, categorize
+
+# --- Configuración ---
+# Si la IA no entrega el menú en este tiempo, /generate-menu responde con el motor local
+MENU_LLM_SLO_SECONDS = float(os.getenv("MENU_LLM_SLO_SECONDS", 20))
+MENU_LOCAL_FALLBACK = os.getenv("MENU_LOCAL_FALLBACK", "1") != "0"
+
+# Reparto del objetivo entre comidas (el almuerzo es la comida principal)
+MEAL_SHARES = {"breakfast": 0.25, "lunch": 0.40, "dinner": 0.35}
+MIN_SCALE, MAX_SCALE = 0.5, 2.5
+# Extras permitidos aunque no estén en la despensa (mismas reglas que el prompt de la IA)
+PANTRY_BASICS = {"sal", "pimienta", "aceite", "aceite de oliva", "agua"}
+# Lo que se puede omitir si falta (no cambia el plato)
+OPTIONAL_CATEGORY = "Condimentos y Especias"
+LIQUID_UNITS = {"ml", "cc", "l", "lt", "litro", "litros"}
+# Gramos por unidad de inventario (las "Unidades" dependen del alimento)
+STOCK_UNIT_GRAMS = {"kg": 1000, "g": 1, "l": 1000, "ml": 1, "oz": 28.35, "lb": 453.6}
+
+# Plantillas cuando ninguna receta encaja con la despensa: (categoría, gramos base)
+TEMPLATES = {
+    "breakfast": [("Lácteos y Derivados", 200), ("Granos, Cereales y Legumbres", 50), ("Frutas", 120)],
+    "lunch": [("Carnes y Proteínas", 150), ("Granos, Cereales y Legumbres", 80), ("Verduras y Hortalizas", 150)],
+    "dinner": [("Carnes y Proteínas", 130), ("Verduras y Hortalizas", 200), ("Granos, Cereales y Legumbres", 50)],
+}
+TEMPLATE_NAMES = {
+    "breakfast": "Bowl Matutino de {0}",
+    "lunch": "{0} Dorado con Guarnición de la Casa",
+    "dinner": "Cena Ligera de {0} Salteado",
+}
+
+
+@dataclass(frozen=True)
+class Portion:
+    text: str  # Ingrediente original ("2 cdas aceite de oliva")
+    label: str  # Nombre para mostrar ("aceite de oliva")
+    food: Optional[str]  # Clave de la tabla nutricional
+    grams: float
+    kind: str  # "g", "ml", "unidad" o "fixed" (no se escala)
+
+
+@dataclass(frozen=True)
+class Recipe:
+    name: str
+    meals: tuple[str, ...]
+    portions: tuple[Portion, ...]
+    steps: tuple[str, ...]
+    time: str
+    saved: bool = False
+
+
+def _family(food: str) -> str:
+    """'arroz integral' y 'arroz' son intercambiables a la hora de ver si hay stock"""
+    return food.split()[0]
+
+
+def _portion(text: str) -> Portion:
+    quantity, unit, label = nutrition.split_ingredient(text)
+    food, grams = nutrition.parse_ingredient(text)
+    if food is None or quantity is None or food in PANTRY_BASICS or categorize(food) == OPTIONAL_CATEGORY:
+        return Portion(text, label, food, grams, "fixed")
+    if unit in nutrition.PIECE_UNITS or (unit is None and quantity < 20):
+        return Portion(text, label, food, grams, "unidad")
+    return Portion(text, label, food, grams, "ml" if unit in LIQUID_UNITS else "g")
+
+
+def _recipe(name: str, meals, ingredients, steps, time: str = "", saved: bool = False) -> Recipe:
+    return Recipe(name, tuple(meals), tuple(_portion(i) for i in ingredients if isinstance(i, str)), tuple(steps or ()), time, saved)
+
+
+def _required_families(recipe: Recipe) -> set[str]:
+    return {_family(p.food) for p in recipe.portions if p.kind != "fixed"}
+
+
+@lru_cache(maxsize=1)
+def _corpus() -> tuple[list[Recipe], dict[str, list[int]]]:
+    """Recetas incluidas + índice invertido {familia de alimento: [índices de receta]}"""
+    with open(os.path.join(DATA_DIR, "recipes.json"), encoding="utf-8") as f:
+        recipes = [_recipe(r["name"], r["meals"], r["ingredients"], r["steps"], r.get("time", "")) for r in json.load(f)]
+    index = defaultdict(list)
+    for i, recipe in enumerate(recipes):
+        for family in _required_families(recipe):
+            index[family].append(i)
+    return recipes, dict(index)
+
+
+# --- Despensa ---
+
+def _pantry(inventory_items) -> dict[str, tuple[str, str, float]]:
+    """{familia: (alimento, nombre en la despensa, gramos en stock)}; el alimento exacto gana sobre la familia"""
+    pantry = {}
+    for item in inventory_items:
+        food = nutrition.lookup_food(item.name)
+        quantity = float(item.quantity or 0)
+        if food is None or quantity <= 0:
+            continue
+        unit = (item.unit or "").lower()
+        grams = quantity * (STOCK_UNIT_GRAMS[unit] if unit in STOCK_UNIT_GRAMS else nutrition.piece_grams(food))
+        for key in (food, _family(food)):
+            current = pantry.get(key)
+            if current is None or (key == food and current[0] != food) or (current[0] == food and grams > current[2]):
+                pantry[key] = (food, item.name.strip().lower(), grams)
+    return pantry
+
+
+def _fit_to_pantry(recipe: Recipe, pantry: dict) -> Optional[tuple[Recipe, float]]:
+    """Receta con los ingredientes de la despensa (sustituyendo por familia) y la escala máxima que permite el stock"""
+    portions = []
+    max_scale = MAX_SCALE
+    for p in recipe.portions:
+        if p.kind == "fixed":
+            # Condimentos que no hay: se omiten; básicos siempre
+            if p.food is None or p.food in PANTRY_BASICS or p.food in pantry or _family(p.food) in pantry:
+                portions.append(p)
+            continue
+        match = pantry.get(p.food) or pantry.get(_family(p.food))
+        if match is None:
+            return None
+        food, label, stock = match
+        if food != p.food:
+            p = replace(p, food=food, label=label)
+        max_scale = min(max_scale, stock / p.grams if p.grams else MAX_SCALE)
+        portions.append(p)
+    if max_scale < MIN_SCALE:
+        return None
+    return replace(recipe, portions=tuple(portions)), max_scale
+
+
+def _candidates(pantry: dict, saved: list) -> list[Recipe]:
+    recipes, index = _corpus()
+    # Índice invertido: cuántos ingredientes requeridos de cada receta hay en la despensa
+    hits = defaultdict(int)
+    for family in {_family(food) for food, _, _ in pantry.values()}:
+        for i in index.get(family, ()):
+            hits[i] += 1
+    found = [recipes[i] for i, n in hits.items() if n == len(_required_families(recipes[i]))]
+    # Recetas guardadas del usuario: valen para almuerzo y cena
+    found += [_recipe(r.name, ("lunch", "dinner"), r.ingredients or [], r.steps or [], saved=True) for r in saved]
+    return found
+
+
+def _template(meal_name: str, inventory_items, pantry: dict, used: set, rng: random.Random) -> tuple[Recipe, float]:
+    """Plato armado por categorías con lo que haya cuando ninguna receta encaja"""
+    by_category = defaultdict(list)
+    for food, label, stock in set(pantry.values()):
+        if label not in used:
+            by_category[categorize(food)].append((food, label, stock))
+    portions = []
+    for category, grams in TEMPLATES[meal_name]:
+        options = sorted(by_category.get(category, []))
+        if options:
+            food, label, stock = rng.choice(options)
+            portions.append(Portion(f"{grams}g {label}", label, food, float(grams), "g"))
+    if not portions:
+        # Nada encaja con las categorías: lo primero que haya en la despensa
+        for food, label, stock in sorted(set(pantry.values()))[:3]:
+            portions.append(Portion(f"100g {label}", label, food, 100.0, "g"))
+    if not portions:
+        # Ni siquiera hay alimentos reconocidos: se listan tal cual (la validación pone calorías de respaldo)
+        portions = [Portion(f"1 unidad {item.name}", item.name, None, 0.0, "fixed") for item in inventory_items[:3]]
+    portions.append(Portion("1 cda aceite de oliva", "aceite de oliva", "aceite de oliva", 15.0, "fixed"))
+    portions.append(Portion("Sal y pimienta al gusto", "sal y pimienta al gusto", "sal", 1.0, "fixed"))
+
+    main = portions[0].label.capitalize()
+    steps = [
+        "Lava y corta todos los ingredientes en piezas parejas de 2 cm",
+        f"Cocina {portions[0].label} 6 min a fuego medio-alto con el aceite hasta dorar",
+        "Agrega el resto de ingredientes y saltea 5 min hasta que estén tiernos; ajusta de sal y pimienta",
+        "Emplatado: sirve en plato hondo con el ingrediente principal al centro y un hilo de aceite",
+    ]
+    stock_scale = min((pantry[p.food][2] / p.grams for p in portions if p.kind == "g" and p.food in pantry), default=MAX_SCALE)
+    return Recipe(TEMPLATE_NAMES[meal_name].format(main), (meal_name,), tuple(portions), tuple(steps), "20 min"), max(min(stock_scale, MAX_SCALE), MIN_SCALE)
+
+
+# --- Porciones ---
+
+def _kcal(portion: Portion) -> float:
+    return portion.grams * nutrition.kcal_per_gram(portion.food) if portion.food else 0.0
+
+
+def _scaled_text(portion: Portion, scale: float) -> str:
+    if portion.kind == "fixed":
+        return portion.text
+    if portion.kind == "unidad":
+        units = max(round(portion.grams * scale / nutrition.piece_grams(portion.food) * 2) / 2, 0.5)
+        return f"{units:g} unidad {portion.label}"
+    grams = portion.grams * scale
+    grams = round(grams / 5) * 5 if grams >= 20 else round(grams)
+    return f"{max(grams, 1):g}{portion.kind} {portion.label}"
+
+
+def solve_portions(chosen: dict[str, tuple[Recipe, float]], target_calories: int) -> dict[str, list[str]]:
+    """Escala cada receta para que el total quede en target ±CALORIE_TOLERANCE (respetando stock y porciones lógicas)"""
+    fixed, scalable, scale, cap = {}, {}, {}, {}
+    for meal_name, (recipe, max_scale) in chosen.items():
+        fixed[meal_name] = sum(_kcal(p) for p in recipe.portions if p.kind == "fixed")
+        scalable[meal_name] = sum(_kcal(p) for p in recipe.portions if p.kind != "fixed")
+        cap[meal_name] = max_scale
+        wanted = (target_calories * MEAL_SHARES[meal_name] - fixed[meal_name]) / scalable[meal_name] if scalable[meal_name] else 1.0
+        scale[meal_name] = min(max(wanted, MIN_SCALE), cap[meal_name])
+
+    # Lo que no pudo absorber una comida (por tope) se reparte entre las demás
+    for _ in range(3):
+        residual = target_calories - sum(fixed[m] + scale[m] * scalable[m] for m in chosen)
+        if abs(residual) < 1:
+            break
+        free = [m for m in chosen if scalable[m] and (scale[m] < cap[m] if residual > 0 else scale[m] > MIN_SCALE)]
+        free_kcal = sum(scalable[m] for m in free)
+        if not free_kcal:
+            break
+        for m in free:
+            scale[m] = min(max(scale[m] + residual / free_kcal, MIN_SCALE), cap[m])
+
+    ingredients = {m: [_scaled_text(p, scale[m]) for p in recipe.portions] for m, (recipe, _) in chosen.items()}
+
+    # El redondeo (5 g, media unidad) puede sacar el total del margen: se corrige con el ingrediente más calórico en gramos
+    totals = {m: (nutrition.meal_nutrition(ingredients[m]) or {}).get("calories", 0) for m in chosen}
+    deviation = sum(totals.values()) - target_calories
+    if abs(deviation) > CALORIE_TOLERANCE:
+        adjustable = [
+            (nutrition.kcal_per_gram(p.food), m, i, p)
+            for m, (recipe, _) in chosen.items() for i, p in enumerate(recipe.portions)
+            if p.kind in ("g", "ml") and p.food
+        ]
+        if adjustable:
+            density, m, i, p = max(adjustable, key=lambda a: a[0])
+            current = p.grams * scale[m]
+            if density:
+                grams = max(round(current - deviation / density), 5)
+                ingredients[m][i] = f"{grams:g}{p.kind} {p.label}"
+    return ingredients
+
+
+# --- Motor ---
+
+def generate_local_menu(user: models.User, inventory_items: list, saved: list, menu_date: Optional[date] = None) -> dict:
+    """Menú completo (mismo esquema que el de la IA) sin llamar a la IA"""
+    menu_date = menu_date or date.today()
+    target_calories = calculate_target_calories(user)
+    rng = random.Random(f"local:{user.id}:{menu_date.isoformat()}")
+
+    pantry = _pantry(inventory_items)
+    candidates = _candidates(pantry, saved)
+    chosen: dict[str, tuple[Recipe, float]] = {}
+    used_names, used_labels = set(), set()
+    for meal_name in MEAL_NAMES:
+        options = []
+        for recipe in candidates:
+            if meal_name not in recipe.meals or recipe.name in used_names:
+                continue
+            fitted = _fit_to_pantry(recipe, pantry)
+            if fitted is not None:
+                options.append(fitted)
+        if options:
+            # Las recetas guardadas por el usuario tienen prioridad
+            favourites = [o for o in options if o[0].saved]
+            recipe, max_scale = rng.choice(favourites or options)
+        else:
+            recipe, max_scale = _template(meal_name, inventory_items, pantry, used_labels, rng)
+        used_names.add(recipe.name)
+        used_labels.update(p.label for p in recipe.portions if p.kind != "fixed")
+        chosen[meal_name] = (recipe, max_scale)
+
+    ingredients = solve_portions(chosen, target_calories)
+    menu = {
+        meal_name: {"name": recipe.name, "ingredients": ingredients[meal_name], "steps": list(recipe.steps), "time": recipe.time}
+        for meal_name, (recipe, _) in chosen.items()
+    }
+    menu["note"] = f"Menú preparado con lo que tienes en tu despensa para tus {target_calories} kcal de hoy."
+    return schemas.MenuGenerationResponse.model_validate(menu).model_dump()
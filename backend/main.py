@@ -1,45 +1,95 @@
 import os
-import json 
-import shutil 
+import gc
+import logging
 import uuid 
-import random 
+import time
+import asyncio
+import secrets
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from datetime import date, timedelta 
-from google.oauth2 import id_token
-from google.auth.transport import requests
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Request
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Request, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
+from fastapi.responses import JSONResponse, ORJSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles 
-from sqlalchemy.orm import Session
-from pydantic import BaseModel 
-from openai import OpenAI 
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload
+from pydantic import BaseModel, ValidationError
 
 # Cargar variables de entorno
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '.env'))
 
-<<<<<<< HEAD
-# Imports locales
-import models, schemas, security, database
-=======
 # Imports locales (sin imports relativos para uvicorn directo)
 import models
 import schemas
 import security
 import database
->>>>>>> f07a5d1764c53e5a13e8d8f232938d6fa0f8b50f
-from database import engine, get_db
-
-# Configuración OpenAI
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-# Crear tablas (Si cambiaste modelos, recuerda borrar mealia.db para regenerar)
-database.Base.metadata.create_all(bind=engine)
-
-app = FastAPI(title="Meal.IA Backend")
-print("--------------------------------------------------")
-print("MEAL.IA BACKEND STARTED - v3 (WITH ARGON2 & CORS)")
-print("--------------------------------------------------")
+import llm
+import batch_menus
+import migrations
+import google_auth
+import photos
+import photo_storage
+import compression
+import sync
+import metrics
+import rate_limit
+from menu_cache import menu_cache, menu_generations
+from menu_stream import MEAL_NAMES, IncrementalObjectParser, sse_event
+from menu_generation import calculate_target_calories, calorie_stats, build_menu_prompts, menu_messages, generate_menu, finalize_menu, menu_record
+from menu_parsing import MenuParseError, parse_stats
+from inventory_batch import apply_inventory_batch
+from local_menu import MENU_LLM_SLO_SECONDS, MENU_LOCAL_FALLBACK, generate_local_menu
+from database import DbSession, engine, get_db, get_session, get_read_session, open_session, run_db
+
+# Migraciones al arrancar cada worker (uvicorn main:app). serve.py las aplica una sola vez en el
+# proceso maestro y arranca los workers con MIGRATE_ON_STARTUP=0
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "1") == "1"
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Arranque y parada de cada worker. Importar main no abre conexiones ni crea clientes (con
+    gunicorn se importa en el maestro antes del fork): todo lo que es de cada worker se crea aquí"""
+    if MIGRATE_ON_STARTUP:
+        # Crear tablas nuevas y aplicar migraciones pendientes (ver migrations.py)
+        await run_in_threadpool(migrations.upgrade, engine)
+    os.makedirs(photos.UPLOAD_DIR, exist_ok=True)
+    # Cliente de OpenAI listo antes de la primera petición (crearlo dentro de una bloqueaba el loop)
+    llm.init_client()
+    # Claves de Google cargadas antes del primer login (solo si el login con Google está configurado)
+    if os.getenv("GOOGLE_WEB_CLIENT_ID"):
+        google_auth.key_store.prefetch()
+    # Lo cargado al arrancar (openai y sus miles de modelos pydantic) vive hasta el final: fuera
+    # del GC cíclico, cuyas pasadas de generación 2 lo recorrían entero (pausas de ~150 ms)
+    gc.freeze()
+    logger.info("Worker %s listo", os.getpid())
+    yield
+    await llm.close_client()
+    security.shutdown_password_pool()
+    photos.shutdown_pool()
+    google_auth.key_store.close()
+
+
+# orjson para todas las respuestas JSON (más rápido que json.dumps y sin pasar por jsonable_encoder)
+app = FastAPI(title="Meal.IA Backend", default_response_class=ORJSONResponse, lifespan=lifespan)
+
+@app.exception_handler(security.PasswordPoolBusy)
+async def password_pool_busy_handler(request: Request, exc: security.PasswordPoolBusy):
+    return JSONResponse(status_code=503, content={"detail": "Servidor ocupado, reintenta en unos segundos"}, headers={"Retry-After": "1"})
+
+@app.exception_handler(rate_limit.RateLimited)
+async def rate_limited_handler(request: Request, exc: rate_limit.RateLimited):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": f"Demasiadas peticiones, reintenta en {exc.retry_after_header} s"},
+        headers={"Retry-After": exc.retry_after_header},
+    )
 
 # --- CORS CONFIGURATION (CRITICAL FOR MOBILE/FLUTTER) ---
 from fastapi.middleware.cors import CORSMiddleware
@@ -85,9 +135,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Configuración de carpetas
-os.makedirs("uploads", exist_ok=True) 
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# Fotos subidas antes de photo_storage (las nuevas se sirven en /photos/...). La carpeta se crea
+# en lifespan: importar main no toca el disco
+app.mount("/uploads", StaticFiles(directory=photos.UPLOAD_DIR, check_dir=False), name="uploads")
+# Tope de tamaño aplicado mientras llega el cuerpo de la subida
+app.add_middleware(photos.UploadSizeLimitMiddleware, paths=("/users/me/upload-photo",))
+# Brotli/GZip para respuestas de más de RESPONSE_COMPRESS_MIN_BYTES (ver compression.py)
+app.add_middleware(compression.CompressionMiddleware)
+# El último añadido es el más externo: mide también la compresión (ver metrics.py)
+app.add_middleware(metrics.MetricsMiddleware)
 
 
 # --- CLASES AUXILIARES ---
@@ -96,369 +152,623 @@ class GoogleLoginResponse(schemas.Token):
 
 class PhotoResponse(BaseModel):
     photo_url: str
+    # URL de cada tamaño de avatar ("512", "128")
+    sizes: dict[str, str] = {}
 
 
 # --- ENDPOINT DE SALUD PARA DIAGNÓSTICO ---
 @app.get("/health")
-def health_check():
+async def health_check():
     """Endpoint simple para verificar que el servidor está corriendo"""
     return {
         "status": "ok",
         "message": "Backend is running",
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "db_pool": database.pool_status(),
     }
 
-# --- CÁLCULO DE CALORÍAS ---
-def calculate_target_calories(user: models.User) -> int:
-    weight = user.weight or 70
-    height_cm = (user.height * 100) if user.height else 170
-    age = 25
-    if user.birthdate:
-        today = date.today()
-        age = today.year - user.birthdate.year - ((today.month, today.day) < (user.birthdate.month, user.birthdate.day))
-    
-    # Mifflin-St Jeor
-    bmr = (10 * weight) + (6.25 * height_cm) - (5 * age) + 5 
-    tdee = bmr * 1.3 
-    target = int(tdee)
-    
-    if user.goal == "Déficit": target -= 400 
-    elif user.goal == "Aumentar masa": target += 400 
-    
-    return max(1200, min(target, 4000))
+
+# Endpoints internos (/admin/*, /metrics, contadores de pools y cachés): cabecera X-Admin-Key
+async def require_admin(x_admin_key: str | None = Header(None)):
+    admin_key = os.getenv("ADMIN_API_KEY")
+    if not admin_key: raise HTTPException(status_code=403, detail="Admin deshabilitado (ADMIN_API_KEY no configurada)")
+    if not x_admin_key or not secrets.compare_digest(x_admin_key, admin_key): raise HTTPException(status_code=403, detail="Clave de admin inválida")
+
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(require_admin)])
+async def prometheus_metrics():
+    """Métricas en formato de texto de Prometheus (latencias por ruta, SQL por petición, LLM).
+    Con clave de admin: exponen el tráfico por ruta y el estado de los pools de BD"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 
 # --- 1. ENDPOINTS DE AUTENTICACIÓN ---
 
-@app.post("/register", response_model=schemas.User)
-def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = security.get_user(db, email=user.email)
+@app.post("/register", response_model=schemas.User, dependencies=[Depends(rate_limit.per_ip("login_ip"))])
+async def register_user(user: schemas.UserCreate, db: DbSession = Depends(get_session)):
+    db_user = await run_db(db, security.get_user, email=user.email)
     if db_user: raise HTTPException(status_code=400, detail="Email ya registrado")
-    hashed_password = security.get_password_hash(user.password)
+    # Argon2 corre en el pool de procesos de security, no en el event loop ni en el threadpool
+    hashed_password = await security.hash_password_async(user.password)
     new_user = models.User(email=user.email, first_name=user.first_name, hashed_password=hashed_password)
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    return new_user
 
-@app.post("/token", response_model=schemas.Token)
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = security.get_user(db, email=form_data.username)
-    if not user or not security.verify_password(form_data.password, user.hashed_password):
+    def insert_user(session: Session) -> schemas.User:
+        session.add(new_user)
+        session.commit()
+        session.refresh(new_user)
+        return schemas.User.model_validate(new_user)
+    return await run_db(db, insert_user)
+
+def store_password_hash(db: Session, user: models.User, new_hash: str):
+    """Guarda un hash nuevo (cambio de contraseña o rehash en el login) y descarta el usuario cacheado"""
+    user.hashed_password = new_hash
+    db.commit()
+    security.invalidate_cached_user(user)
+
+@app.post("/token", response_model=schemas.Token, dependencies=[Depends(rate_limit.per_ip("login_ip"))])
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: DbSession = Depends(get_session)):
+    # Antes de Argon2: por IP (dependencia) y por cuenta
+    rate_limit.limiter.check("login_user", form_data.username.strip().lower())
+    user = await run_db(db, security.get_user, email=form_data.username)
+    verified, new_hash = await security.verify_password_async(form_data.password, user.hashed_password) if user else (False, None)
+    if not verified:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Credenciales incorrectas", headers={"WWW-Authenticate": "Bearer"})
+    if new_hash:
+        await run_db(db, store_password_hash, user, new_hash)
     access_token_expires = timedelta(minutes=security.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = security.create_access_token(data={"sub": user.email}, expires_delta=access_token_expires)
+    access_token = security.create_access_token(data=security.token_claims(user), expires_delta=access_token_expires)
     return {"access_token": access_token, "token_type": "bearer"}
 
-@app.get("/users/me", response_model=schemas.User)
-def read_users_me(current_user: models.User = Depends(security.get_current_user)):
-    return current_user
+@app.get("/auth/password-pool-stats", dependencies=[Depends(require_admin)])
+async def password_pool_stats():
+    return security.password_pool_snapshot()
+
+@app.get("/users/me", response_model=schemas.UserWithInventory | schemas.User)
+async def read_users_me(
+    include: str | None = Query(None, pattern="^inventory$", description="'inventory' añade la despensa del usuario"),
+    db: DbSession = Depends(get_session),
+    current_user: models.User = Depends(security.get_current_user),
+):
+    if include != "inventory":
+        return schemas.User.model_validate(current_user)
+
+    def load_with_inventory(session: Session) -> schemas.UserWithInventory:
+        # Usuario + despensa en dos SELECT (el segundo con IN), sin cargas perezosas al serializar
+        user = session.execute(
+            select(models.User).options(selectinload(models.User.inventory_items)).where(models.User.id == current_user.id)
+            .execution_options(populate_existing=True)
+        ).scalar_one()
+        return schemas.UserWithInventory.model_validate(user)
+    return await run_db(db, load_with_inventory)
 
 @app.put("/users/me/data", response_model=schemas.User)
-def update_user_data(data: schemas.UserDataUpdate, db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)):
-    if data.first_name: current_user.first_name = data.first_name
-    if data.last_name: current_user.last_name = data.last_name
-    if data.height: current_user.height = data.height
-    if data.weight: current_user.weight = data.weight
-    if data.birthdate: current_user.birthdate = data.birthdate
-    if data.goal: current_user.goal = data.goal
-    if data.photo_url: current_user.photo_url = data.photo_url
-    db.commit()
-    db.refresh(current_user)
-    return current_user
+async def update_user_data(data: schemas.UserDataUpdate, db: DbSession = Depends(get_session), current_user: models.User = Depends(security.get_current_user)):
+    def update_user(session: Session) -> schemas.User:
+        # current_user puede ser la copia cacheada de otro worker: decidir sobre los datos de la BD
+        session.refresh(current_user)
+        if data.first_name: current_user.first_name = data.first_name
+        if data.last_name: current_user.last_name = data.last_name
+        if data.height: current_user.height = data.height
+        if data.weight: current_user.weight = data.weight
+        if data.birthdate: current_user.birthdate = data.birthdate
+        if data.goal: current_user.goal = data.goal
+        if data.photo_url and data.photo_url != current_user.photo_url:
+            # URL externa: la foto subida anterior pierde esta referencia
+            if current_user.photo_key: photo_storage.assign_photo(session, current_user, None, None)
+            current_user.photo_url = data.photo_url
+        session.commit()
+        session.refresh(current_user)
+        return schemas.User.model_validate(current_user)
+
+    user = await run_db(db, update_user)
+    security.invalidate_cached_user(current_user)
+    menu_cache.invalidate_user(current_user.id)
+    return user
 
 @app.put("/users/me/password")
-def update_password(data: schemas.UserPasswordUpdate, db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)):
-    hashed_password = security.get_password_hash(data.password)
-    current_user.hashed_password = hashed_password
-    db.commit()
+async def update_password(data: schemas.UserPasswordUpdate, db: DbSession = Depends(get_session), current_user: models.User = Depends(security.get_current_user)):
+    hashed_password = await security.hash_password_async(data.password)
+    await run_db(db, store_password_hash, current_user, hashed_password)
     return {"detail": "Contraseña actualizada correctamente"}
 
 
 # --- 2. GESTIÓN DE FOTOS ---
 
+def photo_url_for(request: Request, key: str, size: int) -> str:
+    return str(request.url_for("get_photo", name=photos.avatar_name(key, size)))
+
 @app.post("/users/me/upload-photo", response_model=PhotoResponse)
-async def upload_profile_photo(request: Request, file: UploadFile = File(...), db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)):
-    allowed_types = ["image/jpeg", "image/png", "image/heic", "image/webp", "application/octet-stream"]
-    if file.content_type not in allowed_types: raise HTTPException(status_code=400, detail="Archivo no válido")
-    
-    file_extension = file.filename.split(".")[-1]
-    unique_filename = f"{uuid.uuid4()}.{file_extension}"
-    file_path = f"uploads/{unique_filename}"
-    
+async def upload_profile_photo(request: Request, file: UploadFile = File(...), db: DbSession = Depends(get_session), current_user: models.User = Depends(security.get_current_user)):
+    # Copia por trozos con E/S asíncrona, tipo detectado por contenido y avatares en el pool (photos.py);
+    # se guardan por contenido en photo_storage: una imagen ya subida (por cualquiera) no se vuelve a procesar
+    storage = photo_storage.get_storage()
+    stem = uuid.uuid4().hex
     try:
-        with open(file_path, "wb") as buffer: shutil.copyfileobj(file.file, buffer)
-    except: raise HTTPException(status_code=500, detail="Error al guardar")
-    finally: file.file.close()
-    
-    full_photo_url = f"{str(request.base_url)}{file_path}"
-    current_user.photo_url = full_photo_url
-    db.commit()
-    return {"photo_url": full_photo_url}
+        upload_path, content_sha256 = await photos.save_upload(file, stem, storage.work_dir)
+        key = photo_storage.photo_key(content_sha256)
+        size_bytes = 0
+        # Fila en la BD (sesión async) y objetos en el almacén (E/S bloqueante, al threadpool)
+        if await run_db(db, photo_storage.has_blob, key) and await run_in_threadpool(photo_storage.has_objects, storage, key):
+            os.remove(upload_path)
+        else:
+            avatars = await photos.render_avatars(upload_path, key, storage.work_dir)
+            size_bytes = await run_in_threadpool(photo_storage.store_avatars, storage, key, avatars)
+    except photos.PhotoRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    finally:
+        await file.close()
+
+    sizes = {str(size): photo_url_for(request, key, size) for size in photos.AVATAR_SIZES}
+    legacy_url = await run_db(db, photo_storage.assign_photo, current_user, key, sizes[str(max(photos.AVATAR_SIZES))], size_bytes)
+    security.invalidate_cached_user(current_user)
+    await run_in_threadpool(photos.delete_photo_files, legacy_url)
+    return {"photo_url": current_user.photo_url, "sizes": sizes}
 
 @app.delete("/users/me/delete-photo", response_model=schemas.User)
-async def delete_profile_photo(db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)):
-    if current_user.photo_url:
-        try:
-            filename = current_user.photo_url.split("/")[-1]
-            path = f"uploads/{filename}"
-            if os.path.exists(path): os.remove(path)
-        except Exception as e:
-            print(f"Error deleting photo: {e}")
-    current_user.photo_url = None
-    db.commit()
-    return current_user
+async def delete_profile_photo(db: DbSession = Depends(get_session), current_user: models.User = Depends(security.get_current_user)):
+    # La foto queda sin esta referencia; sus archivos los borra el recolector (photo_storage.collect_garbage)
+    legacy_url = await run_db(db, photo_storage.assign_photo, current_user, None, None)
+    security.invalidate_cached_user(current_user)
+    try:
+        await run_in_threadpool(photos.delete_photo_files, legacy_url)
+    except Exception as e:
+        logger.warning("Error borrando la foto: %s", e)
+    return schemas.User.model_validate(current_user)
+
+@app.api_route("/photos/{name}", methods=["GET", "HEAD"])
+def get_photo(name: str, range_header: str | None = Header(None, alias="Range"), if_none_match: str | None = Header(None), if_range: str | None = Header(None)):
+    """Avatar por contenido: ETag fuerte, caché immutable y peticiones Range (un solo rango)"""
+    if not photo_storage.OBJECT_NAME_RE.match(name): raise HTTPException(status_code=404, detail="Foto no encontrada")
+    storage = photo_storage.get_storage()
+    total = storage.size(name)
+    if total is None: raise HTTPException(status_code=404, detail="Foto no encontrada")
+    etag = f'"{name}"'
+    headers = {"ETag": etag, "Cache-Control": photo_storage.CACHE_CONTROL, "Accept-Ranges": "bytes"}
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = photo_storage.parse_range(range_header, total) if range_header and (not if_range or if_range.strip() == etag) else None
+    if byte_range == "invalid":
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{total}"})
+    media_type = photo_storage.content_type(name)
+    if byte_range is None:
+        return Response(storage.read(name), media_type=media_type, headers=headers)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{total}"
+    return Response(storage.read(name, start, end), status_code=206, media_type=media_type, headers=headers)
 
 
 # --- 3. ENDPOINTS DE INVENTARIO ---
+# Cada endpoint hace su trabajo de BD en una función síncrona ejecutada con run_db (ver database.py)
+# y devuelve esquemas ya construidos: nada de cargas perezosas al serializar.
 
 @app.post("/inventory", response_model=schemas.InventoryItem)
-def add_inventory_item(item: schemas.InventoryItemCreate, db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)):
-    normalized_name = item.name.strip().lower()
-    if not normalized_name: raise HTTPException(status_code=400, detail="Nombre vacío")
-    
-    db_item = db.query(models.InventoryItem).filter(models.InventoryItem.owner_id == current_user.id, models.InventoryItem.name == normalized_name).first()
-    
-    if db_item:
-        db_item.quantity += item.quantity # Suma si existe
-    else:
-        # Crea nuevo con unidad
-        db_item = models.InventoryItem(name=normalized_name, owner_id=current_user.id, quantity=item.quantity, unit=item.unit)
-        db.add(db_item)
-    
-    db.commit()
-    db.refresh(db_item)
-    return db_item
+async def add_inventory_item(item: schemas.InventoryItemCreate, db: DbSession = Depends(get_session), current_user: models.User = Depends(security.get_current_user)):
+    if not item.name.strip(): raise HTTPException(status_code=400, detail="Nombre vacío")
+
+    # Upsert atómico sobre (owner_id, name): suma si existe, crea con unidad si no (sin duplicados por altas concurrentes)
+    operation = schemas.InventoryOperation(op="add", name=item.name, quantity=item.quantity, unit=item.unit)
+    items, _ = await run_db(db, apply_inventory_batch, current_user.id, [operation])
+    menu_cache.invalidate_user(current_user.id)
+    return schemas.InventoryItem.model_validate(items[0])
 
 @app.put("/inventory/{item_name}", response_model=schemas.InventoryItem)
-def update_inventory_item(item_name: str, item_update: schemas.InventoryItemUpdate, db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)):
+async def update_inventory_item(item_name: str, item_update: schemas.InventoryItemUpdate, db: DbSession = Depends(get_session), current_user: models.User = Depends(security.get_current_user)):
     normalized_name = item_name.strip().lower()
-    db_item = db.query(models.InventoryItem).filter(models.InventoryItem.owner_id == current_user.id, models.InventoryItem.name == normalized_name).first()
-    
-    if not db_item: raise HTTPException(status_code=404, detail="Ítem no encontrado")
-    
-    # Actualiza valores
-    db_item.quantity = item_update.quantity
-    db_item.unit = item_update.unit
-    
-    db.commit()
-    db.refresh(db_item)
-    return db_item
+
+    def update_item(session: Session) -> schemas.InventoryItem:
+        db_item = session.query(models.InventoryItem).filter(models.InventoryItem.owner_id == current_user.id, models.InventoryItem.name == normalized_name).first()
+        if not db_item: raise HTTPException(status_code=404, detail="Ítem no encontrado")
+
+        # Actualiza valores
+        db_item.quantity = item_update.quantity
+        db_item.unit = item_update.unit
+        db_item.version = sync.next_version(session, current_user.id)
+        session.commit()
+        session.refresh(db_item)
+        return schemas.InventoryItem.model_validate(db_item)
+
+    updated = await run_db(db, update_item)
+    menu_cache.invalidate_user(current_user.id)
+    return updated
 
 @app.post("/inventory/decrement/{item_name}", response_model=schemas.InventoryItem)
-def decrement_inventory_item(item_name: str, db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)):
-    db_item = db.query(models.InventoryItem).filter(models.InventoryItem.owner_id == current_user.id, models.InventoryItem.name == item_name).first()
-    if not db_item: raise HTTPException(status_code=404, detail="No encontrado")
-    
-    if db_item.quantity > 1:
-        db_item.quantity -= 1
-        db.commit()
-        db.refresh(db_item)
-        return db_item
-    else:
-        db.delete(db_item)
-        db.commit()
+async def decrement_inventory_item(item_name: str, db: DbSession = Depends(get_session), current_user: models.User = Depends(security.get_current_user)):
+    def decrement(session: Session) -> schemas.InventoryItem | None:
+        db_item = session.query(models.InventoryItem).filter(models.InventoryItem.owner_id == current_user.id, models.InventoryItem.name == item_name).first()
+        if not db_item: raise HTTPException(status_code=404, detail="No encontrado")
+
+        version = sync.next_version(session, current_user.id)
+        if db_item.quantity > 1:
+            db_item.quantity -= 1
+            db_item.version = version
+            session.commit()
+            session.refresh(db_item)
+            return schemas.InventoryItem.model_validate(db_item)
+        sync.record_deletions(session, sync.INVENTORY, version, models.InventoryItem.id == db_item.id)
+        session.delete(db_item)
+        session.commit()
+        return None
+
+    remaining = await run_db(db, decrement)
+    menu_cache.invalidate_user(current_user.id)
+    if remaining is None:
         raise HTTPException(status_code=200, detail="Eliminado")
+    return remaining
 
 @app.delete("/inventory/remove/{item_name}")
-def remove_inventory_item(item_name: str, db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)):
-    db_item = db.query(models.InventoryItem).filter(models.InventoryItem.owner_id == current_user.id, models.InventoryItem.name == item_name).first()
-    if not db_item: raise HTTPException(status_code=404, detail="No encontrado")
-    
-    db.delete(db_item)
-    db.commit()
+async def remove_inventory_item(item_name: str, db: DbSession = Depends(get_session), current_user: models.User = Depends(security.get_current_user)):
+    def remove(session: Session):
+        db_item = session.query(models.InventoryItem).filter(models.InventoryItem.owner_id == current_user.id, models.InventoryItem.name == item_name).first()
+        if not db_item: raise HTTPException(status_code=404, detail="No encontrado")
+
+        sync.record_deletions(session, sync.INVENTORY, sync.next_version(session, current_user.id), models.InventoryItem.id == db_item.id)
+        session.delete(db_item)
+        session.commit()
+
+    await run_db(db, remove)
+    menu_cache.invalidate_user(current_user.id)
     return {"detail": "Eliminado"}
 
+@app.post("/inventory/batch", response_model=schemas.InventoryBatchResult)
+async def batch_inventory(batch: schemas.InventoryBatchRequest, db: DbSession = Depends(get_session), current_user: models.User = Depends(security.get_current_user)):
+    """Varias operaciones add/set/decrement/remove en una sola transacción (p. ej. sincronizar un ticket de compra)"""
+    def apply(session: Session) -> schemas.InventoryBatchResult:
+        try:
+            items, removed = apply_inventory_batch(session, current_user.id, batch.operations)
+        except ValueError as e:
+            session.rollback()
+            raise HTTPException(status_code=400, detail=str(e))
+        except NotImplementedError as e:
+            session.rollback()
+            raise HTTPException(status_code=501, detail=str(e))
+        return schemas.InventoryBatchResult.model_validate({"items": items, "removed": removed}, from_attributes=True)
+
+    result = await run_db(db, apply)
+    menu_cache.invalidate_user(current_user.id)
+    return result
+
+# Listas por usuario: cachés privadas y siempre revalidando con el ETag
+LIST_CACHE_CONTROL = "private, no-cache"
+
+def list_with_etag(session: Session, entity: str, model, schema, owner_id: int, if_none_match: str | None) -> tuple[str, list | None]:
+    """(ETag, filas como esquemas); None en lugar de filas si el cliente ya tiene esta versión"""
+    version, _ = sync.current_version(session, owner_id)
+    etag = sync.list_etag(entity, owner_id, version)
+    if sync.etag_matches(if_none_match, etag):
+        return etag, None
+    rows = session.query(model).filter(model.owner_id == owner_id).order_by(model.id).all()
+    return etag, [schema.model_validate(row) for row in rows]
+
 @app.get("/inventory", response_model=list[schemas.InventoryItem])
-def get_inventory(db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)):
-    return db.query(models.InventoryItem).filter(models.InventoryItem.owner_id == current_user.id).all()
+async def get_inventory(response: Response, if_none_match: str | None = Header(None), db: DbSession = Depends(get_read_session), current_user: models.User = Depends(security.get_current_user)):
+    """Despensa completa. Con If-None-Match del ETag anterior: 304 sin cuerpo si nada cambió (ver también /sync)"""
+    etag, items = await run_db(db, list_with_etag, sync.INVENTORY, models.InventoryItem, schemas.InventoryItem, current_user.id, if_none_match)
+    if items is None:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": LIST_CACHE_CONTROL})
+    response.headers.update({"ETag": etag, "Cache-Control": LIST_CACHE_CONTROL})
+    return items
+
+
+# --- 3b. SINCRONIZACIÓN INCREMENTAL ---
+
+def load_changes(session: Session, owner_id: int, since: int) -> schemas.SyncResponse:
+    return schemas.SyncResponse.model_validate(sync.changes_since(session, owner_id, since), from_attributes=True)
+
+@app.get("/sync", response_model=schemas.SyncResponse)
+async def sync_changes(since: int = Query(0, ge=0, description="`version` de la última sincronización (0: todo)"), db: DbSession = Depends(get_read_session), current_user: models.User = Depends(security.get_current_user)):
+    """Inventario y recetas cambiados desde `since`, con los ids borrados. Sin cambios: listas vacías"""
+    return await run_db(db, load_changes, current_user.id, since)
 
 
 # --- 4. ENDPOINT RECETAS ---
 
 @app.post("/save-recipe", response_model=schemas.SavedRecipe)
-def save_recipe(recipe: schemas.SavedRecipeCreate, db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)):
-    existing = db.query(models.SavedRecipe).filter(models.SavedRecipe.owner_id == current_user.id, models.SavedRecipe.name == recipe.name).first()
-    if existing: raise HTTPException(status_code=400, detail="Ya existe")
-    
-    new_recipe = models.SavedRecipe(name=recipe.name, ingredients=recipe.ingredients, steps=recipe.steps, calories=recipe.calories, owner_id=current_user.id)
-    db.add(new_recipe)
-    db.commit()
-    db.refresh(new_recipe)
-    return new_recipe
+async def save_recipe(recipe: schemas.SavedRecipeCreate, db: DbSession = Depends(get_session), current_user: models.User = Depends(security.get_current_user)):
+    def insert_recipe(session: Session) -> schemas.SavedRecipe:
+        existing = session.query(models.SavedRecipe).filter(models.SavedRecipe.owner_id == current_user.id, models.SavedRecipe.name == recipe.name).first()
+        if existing: raise HTTPException(status_code=400, detail="Ya existe")
+
+        new_recipe = models.SavedRecipe(name=recipe.name, ingredients=recipe.ingredients, steps=recipe.steps, calories=recipe.calories, owner_id=current_user.id)
+        new_recipe.version = sync.next_version(session, current_user.id)
+        session.add(new_recipe)
+        try:
+            session.commit()
+        except IntegrityError:
+            # Otra petición la guardó entre la búsqueda y el INSERT (ux_saved_recipes_owner_name)
+            session.rollback()
+            raise HTTPException(status_code=400, detail="Ya existe")
+        session.refresh(new_recipe)
+        return schemas.SavedRecipe.model_validate(new_recipe)
+
+    return await run_db(db, insert_recipe)
+
+@app.get("/saved-recipes", response_model=list[schemas.SavedRecipe])
+async def get_saved_recipes(response: Response, if_none_match: str | None = Header(None), db: DbSession = Depends(get_read_session), current_user: models.User = Depends(security.get_current_user)):
+    etag, recipes = await run_db(db, list_with_etag, sync.RECIPE, models.SavedRecipe, schemas.SavedRecipe, current_user.id, if_none_match)
+    if recipes is None:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": LIST_CACHE_CONTROL})
+    response.headers.update({"ETag": etag, "Cache-Control": LIST_CACHE_CONTROL})
+    return recipes
+
+@app.delete("/saved-recipes/{recipe_id}")
+async def delete_saved_recipe(recipe_id: int, db: DbSession = Depends(get_session), current_user: models.User = Depends(security.get_current_user)):
+    def delete_recipe(session: Session):
+        recipe = session.query(models.SavedRecipe).filter(models.SavedRecipe.owner_id == current_user.id, models.SavedRecipe.id == recipe_id).first()
+        if not recipe: raise HTTPException(status_code=404, detail="No encontrada")
+
+        sync.record_deletions(session, sync.RECIPE, sync.next_version(session, current_user.id), models.SavedRecipe.id == recipe.id)
+        session.delete(recipe)
+        session.commit()
+
+    await run_db(db, delete_recipe)
+    return {"detail": "Eliminada"}
 
 
 # --- 5. GENERACIÓN DE MENÚ (IA SUPREMA: LOGICA DE PORCIONES + MARKETING) ---
 
-@app.post("/generate-menu", response_model=schemas.MenuGenerationResponse)
-def generate_menu_with_ia(db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_user)):
+def load_menu_inputs(db: Session, current_user: models.User) -> tuple[list, list]:
+    """Lee inventario y gustos del usuario. Hace consultas síncronas a la BD."""
     # 1. Obtener inventario
     inventory_items = db.query(models.InventoryItem).filter(models.InventoryItem.owner_id == current_user.id).all()
     if not inventory_items: raise HTTPException(status_code=400, detail="Inventario vacío")
-    
-    # Formateamos lista legible: "2.5 Kg de Harina"
-    inventory_list_str = ", ".join([f"{item.quantity} {item.unit} de {item.name}" for item in inventory_items])
-    target_calories = calculate_target_calories(current_user)
-    
+
     # 2. Gustos previos
     saved = db.query(models.SavedRecipe).filter(models.SavedRecipe.owner_id == current_user.id).limit(10).all()
-    fav_txt = ""
-    if saved:
-        names = [r.name for r in saved]
-        fav_txt = f"GUSTOS PREVIOS: {', '.join(random.sample(names, min(len(names), 3)))}."
 
-    vibes = ["fresco y ligero", "reconfortante", "sabores intensos", "estilo mediterráneo", "energético"]
-    daily_vibe = random.choice(vibes)
+    # Liberamos la conexión antes de esperar a la IA (si no, cada menú en curso retiene una del pool)
+    db.close()
+    return inventory_items, saved
 
-    # --- PROMPT DEFINITIVO ---
-    prompt_del_sistema = f"""
-    Eres "Meal.IA", un Nutricionista experto y Chef Ejecutivo de alta cocina.
-    
-    === CONTEXTO DEL INVENTARIO (CRÍTICO) ===
-    Estás viendo la DESPENSA COMPLETA de la casa (STOCK TOTAL).
-    Lista: [{inventory_list_str}]
-    
-    REGLA DE LÓGICA DE PORCIONES (NO COMER 1 KG):
-    1. Si la lista dice "1 Kg de Avena", significa que hay una BOLSA guardada. NO mandes al usuario a comer 1 Kg.
-       -> Usa una porción lógica para 1 persona (Ej: 40g - 60g).
-    2. Si dice "2 Kg de Arroz", usa solo 80g-100g.
-    3. Si dice "5 Unidades de Tomate", usa 1 o 2.
-    
-    REGLAS DE ORDEN DE COMIDAS:
-    1. EL ALMUERZO ES LA COMIDA PRINCIPAL (MÁS CALORIAS).
-    
-    REGLAS DE DISPONIBILIDAD:
-    1. USA SOLO LO QUE HAY EN LA LISTA NO USES COSAS QUE NO ESTAN EN EL INVENTARIO. (Permitidos extras básicos: Sal, Pimienta, Aceite, Agua).
-    2. Si falta algo esencial para un plato, NO lo inventes. Cambia de receta.
-
-    REGLAS DE ESTILO (NO SEAS FLOJO):
-    1. **TÍTULOS:** Crea nombres de restaurante (Marketing). Ej: "Risotto Cremoso de..." en lugar de "Arroz con...".
-    2. **PASOS DETALLADOS:** - Prohibido decir "cocina hasta que esté listo". 
-       - DI: "Cocina por 5 minutos hasta dorar".
-       - DI: "Cuando huelas a nuez tostada, apaga el fuego".
-    3. **EMPLATADO:** El último paso siempre es cómo servirlo para que se vea bello.
-
-    OBJETIVO:
-    - Calorías totales: {target_calories} kcal (+/- 50).
-    - Idioma: Español.
-
-    INSTRUCCIONES DE DATOS "REALES" (NO INVENTAR):
-    - Calcula los MACROS (Carbohidratos, Proteína, Grasa) aproximados reales de los ingredientes.
-    - Calcula los MICROS:
-       - Fiber (g): Fibra dietética.
-       - Sugar (g): Azúcares totales.
-       - Sodium (mg): Sodio estimado.
-    - Calcula el TIEMPO de preparación real total (prep + cocción). Ej: "25 min".
-    - Si no estás seguro de un micro, haz una estimación educada basada en ingredientes, NO pongas 0.
-
-    INSTRUCCIONES TÉCNICAS JSON:
-    - Devuelve SOLO JSON válido.
-    - NO uses comas al final de las listas (trailing commas).
-    """
-    
-    prompt_del_usuario = f"""
-    Crea el plan para {current_user.first_name}. Vibe de hoy: {daily_vibe}. {fav_txt}
-    
-    FORMATO JSON OBLIGATORIO:
-    {{
-      "breakfast": {{ 
-        "name": "TÍTULO MARKETING", 
-        "ingredients": ["cant+unidad ing", ...], 
-        "steps": ["Paso 1 (tiempo)...", "Paso 2...", "Emplatado..."], 
-        "calories": int,
-        "carbs": int,
-        "protein": int,
-        "fat": int,
-        "fiber": float,
-        "sugar": float,
-        "sodium": int,
-        "time": "XX min"
-      }},
-      "lunch": {{ 
-        "name": "TÍTULO MARKETING", 
-        "ingredients": ["cant+unidad ing", ...], 
-        "steps": ["...", "Emplatado..."], 
-        "calories": int,
-        "carbs": int,
-        "protein": int,
-        "fat": int,
-        "fiber": float,
-        "sugar": float,
-        "sodium": int,
-        "time": "XX min"
-      }},
-      "dinner": {{ 
-        "name": "TÍTULO MARKETING", 
-        "ingredients": ["cant+unidad ing", ...], 
-        "steps": ["...", "Emplatado..."], 
-        "calories": int,
-        "carbs": int,
-        "protein": int,
-        "fat": int,
-        "fiber": float,
-        "sugar": float,
-        "sodium": int,
-        "time": "XX min"
-      }},
-      "note": "Nota del Chef motivadora para tus objetivos.",
-      "total_calories": int
-    }}
-    """
+def _insert_menu(db: Session, owner_id: int, cache_key: str | None, menu_data: dict, source: str):
+    db.add(menu_record(owner_id, date.today(), cache_key, menu_data, source=source))
+    db.commit()
 
-    try:
-        completion = client.chat.completions.create(
-            model="gpt-3.5-turbo", 
-            messages=[{"role": "system", "content": prompt_del_sistema}, {"role": "user", "content": prompt_del_usuario}],
-            temperature=0.7, 
-        )
-        
-        # Limpieza y parseo
-        content = completion.choices[0].message.content
-        menu_data = json.loads(content)
-        
-        # Recalcular total por seguridad
-        total = (menu_data.get("breakfast",{}).get("calories",0) + 
-                 menu_data.get("lunch",{}).get("calories",0) + 
-                 menu_data.get("dinner",{}).get("calories",0))
-        menu_data["total_calories"] = total
-
-        # --- SANITIZACIÓN DE DATOS (NO DEVOLVER 0) ---
-        for meal_name in ["breakfast", "lunch", "dinner"]:
-            meal = menu_data.get(meal_name)
-            if not meal: continue
-            
-            cal = meal.get("calories", 500)
-            
-            # Fallback Macros (50% Carbs, 20% Protein, 30% Fat)
-            if meal.get("carbs", 0) == 0: meal["carbs"] = int((cal * 0.50) / 4)
-            if meal.get("protein", 0) == 0: meal["protein"] = int((cal * 0.20) / 4)
-            if meal.get("fat", 0) == 0: meal["fat"] = int((cal * 0.30) / 9)
-
-            # Fallback Micros
-            if meal.get("sodium", 0) == 0: meal["sodium"] = int(cal * 0.5) # Aprox
-            if meal.get("sugar", 0) == 0: meal["sugar"] = round(cal * 0.02, 1)
-            if meal.get("fiber", 0) == 0: meal["fiber"] = round(cal * 0.015, 1)
-
-            # Fallback Time
-            if not meal.get("time") or meal.get("time") == "0 min":
-                step_count = len(meal.get("steps", []))
-                meal["time"] = f"{15 + (step_count * 5)} min"
-        # ---------------------------------------------
-        
+async def store_generated_menu(owner_id: int, cache_key: str | None, menu_data: dict, source: str = "api"):
+    """Guarda el menú del día en generated_menus (un INSERT + commit) en una sesión propia:
+    la de la petición se cerró antes de esperar a la IA"""
+    async with open_session() as db:
+        await run_db(db, _insert_menu, owner_id, cache_key, menu_data, source)
+
+async def serve_local_menu(response: Response, current_user: models.User, inventory_items: list, saved: list) -> dict:
+    """Menú del motor local (sin IA): recetas + despensa + porciones al objetivo de calorías"""
+    with metrics.timed("menu_local"):
+        menu_data = generate_local_menu(current_user, inventory_items, saved)
+    await store_generated_menu(current_user.id, None, menu_data, "local")
+    response.headers["X-Menu-Engine"] = "local"
+    return menu_data
+
+
+@app.post("/generate-menu", response_model=schemas.Menu)
+async def generate_menu_with_ia(
+    response: Response,
+    engine: str = Query("llm", pattern="^(llm|local)$"),
+    db: DbSession = Depends(get_session),
+    current_user: models.User = Depends(security.get_current_user),
+):
+    """engine=llm (por defecto) usa la IA y cae al motor local si no responde dentro del SLO; engine=local no llama a la IA"""
+    # Consultas con run_db (sesión async, sin hilo); la llamada a la IA es async y tampoco ocupa un hilo
+    inventory_items, saved = await run_db(db, load_menu_inputs, current_user)
+    if engine == "local":
+        return await serve_local_menu(response, current_user, inventory_items, saved)
+
+    with metrics.timed("menu_prompt_build"):
+        prompt_del_sistema, prompt_del_usuario, cache_key = await run_in_threadpool(build_menu_prompts, current_user, inventory_items, saved)
+
+    # Mismo inventario y perfil que la última vez: no pagamos otra completion
+    cached_menu = menu_cache.get(cache_key)
+    if cached_menu is not None:
+        return cached_menu
+
+    # Solo gasta ficha quien lanza una completion; quien se suma a una en curso, no
+    if cache_key not in menu_generations:
+        rate_limit.limiter.check("menu", current_user.id)
+    target_calories = calculate_target_calories(current_user)
+    owner_id = current_user.id
+
+    async def generate_and_store() -> dict:
+        with metrics.timed("menu_llm"):
+            menu_data = await asyncio.wait_for(
+                generate_menu(prompt_del_sistema, prompt_del_usuario, target_calories),
+                timeout=MENU_LLM_SLO_SECONDS,
+            )
+        await store_generated_menu(owner_id, cache_key, menu_data)
+        menu_cache.set(cache_key, menu_data)
         return menu_data
 
-    except json.JSONDecodeError:
-        print("Error: La IA generó un JSON inválido.")
-        raise HTTPException(status_code=500, detail="Error de formato en respuesta IA. Intenta de nuevo.")
+    try:
+        # Peticiones idénticas en curso (doble toque en "generar") comparten una sola completion
+        menu_data = await menu_generations.run(cache_key, generate_and_store)
     except Exception as e:
-        print(f"Error IA: {e}")
+        # IA lenta, caída o con respuesta irreparable: mejor un menú local que un 500
+        if MENU_LOCAL_FALLBACK:
+            logger.warning("IA no disponible a tiempo (%s: %s); usando el motor local", type(e).__name__, e)
+            return await serve_local_menu(response, current_user, inventory_items, saved)
+        if isinstance(e, MenuParseError):
+            logger.error("La IA generó un JSON inválido")
+            raise HTTPException(status_code=500, detail="Error de formato en respuesta IA. Intenta de nuevo.")
+        logger.exception("Error IA")
         raise HTTPException(status_code=500, detail=f"Error interno IA: {e}")
 
+    response.headers["X-Menu-Engine"] = "llm"
+    return menu_data
+
+
+async def _menu_event_stream(owner_id: int, messages: list[dict], cache_key: str, cached_menu: dict | None, target_calories: int):
+    # Caché: las tres comidas salen de inmediato
+    if cached_menu is not None:
+        for meal_name in MEAL_NAMES:
+            yield sse_event("meal", {"meal": meal_name, "data": cached_menu[meal_name]})
+        yield sse_event("done", cached_menu)
+        return
+
+    parser = IncrementalObjectParser()
+    sent = set()
+    try:
+        async for delta in llm.stream_chat_completion(messages, temperature=0.7):
+            yield sse_event("token", delta)
+            for key, value in parser.feed(delta):
+                # Cada comida se envía apenas su objeto JSON está completo y valida
+                if key in MEAL_NAMES and isinstance(value, dict):
+                    try:
+                        meal = schemas.MealDetail.model_validate(value)
+                    except ValidationError:
+                        continue
+                    sent.add(key)
+                    yield sse_event("meal", {"meal": key, "data": meal.model_dump()})
+
+        # Pasada final sobre el texto completo: repara y re-pregunta solo lo que faltó
+        menu_data = await finalize_menu(messages, parser.text, target_calories)
+        for meal_name in MEAL_NAMES:
+            if meal_name not in sent:
+                yield sse_event("meal", {"meal": meal_name, "data": menu_data[meal_name]})
+        await store_generated_menu(owner_id, cache_key, menu_data)
+        menu_cache.set(cache_key, menu_data)
+        yield sse_event("done", menu_data)
+
+    except MenuParseError:
+        logger.error("La IA generó un JSON inválido")
+        yield sse_event("error", {"detail": "Error de formato en respuesta IA. Intenta de nuevo."})
+    except Exception as e:
+        logger.exception("Error IA")
+        yield sse_event("error", {"detail": f"Error interno IA: {e}"})
+
+
+@app.post("/generate-menu/stream")
+async def generate_menu_stream(db: DbSession = Depends(get_session), current_user: models.User = Depends(security.get_current_user)):
+    """Versión streaming (SSE): eventos 'token', un 'meal' por comida completa, y 'done' o 'error' al final"""
+    inventory_items, saved = await run_db(db, load_menu_inputs, current_user)
+    with metrics.timed("menu_prompt_build"):
+        prompt_del_sistema, prompt_del_usuario, cache_key = await run_in_threadpool(build_menu_prompts, current_user, inventory_items, saved)
+    messages = menu_messages(prompt_del_sistema, prompt_del_usuario)
+    cached_menu = menu_cache.get(cache_key)
+    if cached_menu is None:
+        rate_limit.limiter.check("menu", current_user.id)
+    return StreamingResponse(
+        _menu_event_stream(current_user.id, messages, cache_key, cached_menu, calculate_target_calories(current_user)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/generate-menu/cache-stats", dependencies=[Depends(require_admin)])
+async def menu_cache_stats():
+    """Contadores de aciertos/fallos de la caché de menús, de las generaciones compartidas, del
+    rate limit, del parseo de respuestas y del objetivo de calorías"""
+    return {
+        **menu_cache.stats(), "coalescing": menu_generations.stats(), "rate_limit": rate_limit.limiter.stats(),
+        "parse": parse_stats, "calories": calorie_stats,
+    }
+
+
+# --- 5a. MENÚS GUARDADOS (SIN REGENERAR) ---
+
+@app.get("/menus/today", response_model=schemas.GeneratedMenu)
+async def get_today_menu(db: DbSession = Depends(get_read_session), current_user: models.User = Depends(security.get_current_user)):
+    def load_today(session: Session) -> schemas.GeneratedMenu | None:
+        menu = (session.query(models.GeneratedMenu)
+                .filter(models.GeneratedMenu.owner_id == current_user.id, models.GeneratedMenu.menu_date == date.today())
+                .order_by(models.GeneratedMenu.id.desc())
+                .first())
+        return schemas.GeneratedMenu.model_validate(menu) if menu else None
+
+    menu = await run_db(db, load_today)
+    if not menu: raise HTTPException(status_code=404, detail="Aún no hay menú para hoy")
+    return menu
+
+@app.get("/menus/history", response_model=schemas.GeneratedMenuPage)
+async def get_menu_history(
+    date_from: date | None = Query(None, alias="from"),
+    date_to: date | None = Query(None, alias="to"),
+    cursor: str | None = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: DbSession = Depends(get_read_session),
+    current_user: models.User = Depends(security.get_current_user),
+):
+    """Historial del más reciente al más antiguo, paginado por keyset (cursor = "fecha:id" de la última fila)"""
+    cursor_key = None
+    if cursor:
+        try:
+            cursor_date, cursor_id = cursor.split(":")
+            cursor_key = (date.fromisoformat(cursor_date), int(cursor_id))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+
+    def load_page(session: Session) -> schemas.GeneratedMenuPage:
+        query = session.query(models.GeneratedMenu).filter(models.GeneratedMenu.owner_id == current_user.id)
+        if date_from: query = query.filter(models.GeneratedMenu.menu_date >= date_from)
+        if date_to: query = query.filter(models.GeneratedMenu.menu_date <= date_to)
+        if cursor_key: query = query.filter(tuple_(models.GeneratedMenu.menu_date, models.GeneratedMenu.id) < cursor_key)
+
+        rows = query.order_by(models.GeneratedMenu.menu_date.desc(), models.GeneratedMenu.id.desc()).limit(limit + 1).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = f"{rows[-1].menu_date.isoformat()}:{rows[-1].id}"
+        return schemas.GeneratedMenuPage.model_validate({"items": rows, "next_cursor": next_cursor}, from_attributes=True)
+
+    return await run_db(db, load_page)
+
+
+# --- 5b. GENERACIÓN EN LOTE (ADMIN) ---
+
+# Informes de jobs terminados que se siguen pudiendo consultar (segundos)
+BATCH_JOB_TTL_SECONDS = int(os.getenv("BATCH_JOB_TTL_SECONDS", 86400))
+
+batch_jobs: dict[str, dict] = {}
+_batch_tasks: dict[str, asyncio.Task] = {}
+# job_id -> instante (monotonic) en que terminó
+_batch_finished: dict[str, float] = {}
+
+def _batch_done(job_id: str, task: asyncio.Task):
+    _batch_tasks.pop(job_id, None)
+    _batch_finished[job_id] = time.monotonic()
+    # Recuperar la excepción: si no, asyncio solo la avisa al recolectar la tarea, sin el job_id
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Batch %s falló", job_id, exc_info=task.exception())
+
+def _prune_batch_jobs():
+    cutoff = time.monotonic() - BATCH_JOB_TTL_SECONDS
+    for job_id, finished_at in list(_batch_finished.items()):
+        if finished_at < cutoff:
+            del _batch_finished[job_id]
+            batch_jobs.pop(job_id, None)
+
+@app.post("/admin/batch-menus", status_code=202, dependencies=[Depends(require_admin)])
+async def start_batch_menus(batch: schemas.BatchMenuRequest):
+    """Lanza la generación en lote en segundo plano; el progreso se consulta con el job_id"""
+    menu_date = batch.menu_date or date.today() + timedelta(days=1)
+    _prune_batch_jobs()
+    job_id = uuid.uuid4().hex
+    report = batch_menus.new_report(menu_date)
+    batch_jobs[job_id] = report
+    _batch_tasks[job_id] = asyncio.create_task(batch_menus.run_batch(
+        menu_date,
+        user_ids=batch.user_ids,
+        concurrency=batch.concurrency or batch_menus.BATCH_CONCURRENCY,
+        requests_per_minute=batch.requests_per_minute or batch_menus.BATCH_REQUESTS_PER_MINUTE,
+        report=report,
+    ))
+    _batch_tasks[job_id].add_done_callback(lambda task: _batch_done(job_id, task))
+    return {"job_id": job_id, **report}
+
+@app.get("/admin/batch-menus/{job_id}", dependencies=[Depends(require_admin)])
+async def get_batch_menus(job_id: str):
+    _prune_batch_jobs()
+    if job_id not in batch_jobs: raise HTTPException(status_code=404, detail="Job no encontrado")
+    return {"job_id": job_id, **batch_jobs[job_id]}
+
+@app.post("/admin/photos/gc", dependencies=[Depends(require_admin)])
+def collect_photo_garbage(db: Session = Depends(get_db)):
+    """Borra las fotos que ningún usuario usa (pasado PHOTO_GC_GRACE_SECONDS) y los objetos huérfanos.
+    Se queda síncrono (threadpool, sesión síncrona): mezcla BD con E/S bloqueante de disco o S3"""
+    return photo_storage.collect_garbage(db)
+
 
 # --- 6. ENDPOINT GOOGLE ---
 
-@app.post("/auth/google", response_model=GoogleLoginResponse) 
-def auth_google(google_token: schemas.GoogleToken, db: Session = Depends(get_db)):
+@app.post("/auth/google", response_model=GoogleLoginResponse, dependencies=[Depends(rate_limit.per_ip("login_ip"))])
+async def auth_google(google_token: schemas.GoogleToken, db: DbSession = Depends(get_session)):
     WEB_CLIENT_ID = os.getenv("GOOGLE_WEB_CLIENT_ID")
     ANDROID_CLIENT_ID = os.getenv("GOOGLE_ANDROID_CLIENT_ID")
     if not WEB_CLIENT_ID or not ANDROID_CLIENT_ID: raise HTTPException(status_code=500, detail="IDs de Google no configurados")
@@ -466,32 +776,35 @@ def auth_google(google_token: schemas.GoogleToken, db: Session = Depends(get_db)
     CLIENT_IDS = [WEB_CLIENT_ID, ANDROID_CLIENT_ID]
     
     try:
-        id_info = id_token.verify_oauth2_token(google_token.token, requests.Request())
-        if id_info['aud'] not in CLIENT_IDS: raise ValueError(f"Audiencia inválida: {id_info['aud']}")
+        # Verificación local con las claves de Google en caché (ver google_auth.py)
+        # (al threadpool: si la clave no está en caché hay que descargarla)
+        id_info = await run_in_threadpool(google_auth.verify_google_id_token, google_token.token, CLIENT_IDS)
         
         email = id_info['email']
         first_name = id_info.get('given_name', 'Usuario')
         last_name = id_info.get('family_name') 
         
-        user = security.get_user(db, email=email)
-        is_new_user = False 
-        
-        if not user:
-            is_new_user = True 
-            fake_password = security.get_password_hash(os.urandom(16).hex()) 
-            user = models.User(email=email, first_name=first_name, last_name=last_name, hashed_password=fake_password)
-            db.add(user)
-            db.commit()
-            db.refresh(user)
+        def find_or_create_user(session: Session) -> tuple[models.User, bool]:
+            user = security.get_user(session, email=email)
+            if user:
+                return user, False
+            # Sin contraseña local: marcador que nunca verifica (no hace falta hashear nada)
+            user = models.User(email=email, first_name=first_name, last_name=last_name, hashed_password=security.unusable_password())
+            session.add(user)
+            session.commit()
+            session.refresh(user)
+            return user, True
+
+        user, is_new_user = await run_db(db, find_or_create_user)
         
         access_token_expires = timedelta(minutes=security.ACCESS_TOKEN_EXPIRE_MINUTES)
-        app_token = security.create_access_token(data={"sub": user.email}, expires_delta=access_token_expires)
+        app_token = security.create_access_token(data=security.token_claims(user), expires_delta=access_token_expires)
         
         return {"access_token": app_token, "token_type": "bearer", "is_new_user": is_new_user}
         
     except ValueError as e:
-        print(f"Error token Google: {e}")
+        logger.warning("Error token Google: %s", e)
         raise HTTPException(status_code=401, detail=f"Token inválido: {e}")
     except Exception as e:
-        print(f"Error auth/google: {e}")
+        logger.exception("Error auth/google")
         raise HTTPException(status_code=500, detail="Error interno servidor")
\ No newline at end of file
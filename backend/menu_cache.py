@@ -0,0 +1,172 @@
+import os
+import json
+import asyncio
+import hashlib
+import threading
+from typing import Optional
+
+from cachetools import TTLCache
+
+import metrics
+
+# --- Configuración de la caché de menús ---
+MENU_CACHE_TTL_SECONDS = int(os.getenv("MENU_CACHE_TTL_SECONDS", 6 * 60 * 60))
+MENU_CACHE_MAX_ENTRIES = int(os.getenv("MENU_CACHE_MAX_ENTRIES", 2048))
+# Si se define (redis://...), la caché se comparte entre procesos/instancias
+MENU_CACHE_URL = os.getenv("MENU_CACHE_URL")
+# Peticiones idénticas simultáneas comparten una sola generación (ver SingleFlight)
+MENU_COALESCE = os.getenv("MENU_COALESCE", "1") == "1"
+
+
+def menu_cache_key(user_id: int, inventory_items, target_calories: int, goal: Optional[str], vibe: str, model: str) -> str:
+    """Clave por contenido: mismo inventario + perfil + vibe + modelo => mismo menú"""
+    canonical = {
+        "inventory": sorted((item.name, float(item.quantity or 0), item.unit or "") for item in inventory_items),
+        "target_calories": target_calories,
+        "goal": goal or "",
+        "vibe": vibe,
+        "model": model,
+    }
+    digest = hashlib.sha256(json.dumps(canonical, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+    return f"menu:{user_id}:{digest}"
+
+
+class InProcessBackend:
+    """TTL + LRU en memoria del proceso (por defecto)"""
+
+    def __init__(self, maxsize: int, ttl: int):
+        self._data = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            return self._data.get(key)
+
+    def set(self, key: str, value: dict):
+        with self._lock:
+            self._data[key] = value
+
+    def delete_prefix(self, prefix: str):
+        with self._lock:
+            for key in [k for k in self._data.keys() if k.startswith(prefix)]:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisBackend:
+    """Backend compartido; Redis aplica el TTL y la política de expulsión (maxmemory-policy allkeys-lru)"""
+
+    def __init__(self, url: str, ttl: int):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("MENU_CACHE_URL requiere el paquete 'redis' (pip install redis)") from e
+        self._redis = redis.Redis.from_url(url)
+        self._ttl = ttl
+
+    def get(self, key: str) -> Optional[dict]:
+        raw = self._redis.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: dict):
+        self._redis.set(key, json.dumps(value, ensure_ascii=False), ex=self._ttl)
+
+    def delete_prefix(self, prefix: str):
+        keys = list(self._redis.scan_iter(match=f"{prefix}*"))
+        if keys:
+            self._redis.delete(*keys)
+
+    def clear(self):
+        self.delete_prefix("menu:")
+
+
+class MenuCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: str) -> Optional[dict]:
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, menu: dict):
+        self.backend.set(key, menu)
+
+    def invalidate_user(self, user_id: int):
+        """Descarta todos los menús cacheados del usuario (su inventario o perfil cambió)"""
+        self.invalidations += 1
+        self.backend.delete_prefix(f"menu:{user_id}:")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class SingleFlight:
+    """Una sola ejecución por clave en curso: quien llega con la misma clave mientras la primera
+    sigue corriendo espera ese mismo resultado (o excepción) en vez de lanzar otra.
+
+    Complementa a la caché: un doble toque en "generar" llega antes de que haya nada cacheado.
+    Es por proceso (event loop); entre workers la caché compartida cubre las repeticiones.
+    """
+
+    def __init__(self, name: str, enabled: bool = True):
+        self.name = name
+        self.enabled = enabled
+        self._in_flight: dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def run(self, key: str, factory):
+        """factory() crea la corrutina; solo se llama si no hay otra en curso para `key`"""
+        if not self.enabled:
+            return await factory()
+        task = self._in_flight.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(factory())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.followers += 1
+            metrics.coalesced.inc(call=self.name)
+        # shield: si un cliente se va, los demás siguen esperando la misma tarea
+        return await asyncio.shield(task)
+
+    def _finished(self, key: str, task: asyncio.Task):
+        self._in_flight.pop(key, None)
+        # Si todos los que esperaban se fueron, la excepción no la recoge nadie: sin aviso en el log
+        if not task.cancelled():
+            task.exception()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._in_flight
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._in_flight), "leaders": self.leaders, "followers": self.followers}
+
+
+def _build_cache() -> MenuCache:
+    if MENU_CACHE_URL:
+        return MenuCache(RedisBackend(MENU_CACHE_URL, MENU_CACHE_TTL_SECONDS))
+    return MenuCache(InProcessBackend(MENU_CACHE_MAX_ENTRIES, MENU_CACHE_TTL_SECONDS))
+
+
+menu_cache = _build_cache()
+# Menús en generación por clave de caché (mismo usuario, despensa y perfil)
+menu_generations = SingleFlight("generate_menu", MENU_COALESCE)
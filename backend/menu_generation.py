@@ -0,0 +1,133 @@
+import random
+from datetime import date
+from typing import Optional
+
+import llm
+import models
+import schemas
+from menu_cache import menu_cache_key
+from menu_parsing import parse_menu, parse_meal, parse_stats
+from prompt_builder import SYSTEM_PROMPT, build_user_prompt
+
+
+# --- CÁLCULO DE CALORÍAS ---
+def calculate_target_calories(user: models.User) -> int:
+    weight = user.weight or 70
+    height_cm = (user.height * 100) if user.height else 170
+    age = 25
+    if user.birthdate:
+        today = date.today()
+        age = today.year - user.birthdate.year - ((today.month, today.day) < (user.birthdate.month, user.birthdate.day))
+    
+    # Mifflin-St Jeor
+    bmr = (10 * weight) + (6.25 * height_cm) - (5 * age) + 5 
+    tdee = bmr * 1.3 
+    target = int(tdee)
+    
+    if user.goal == "Déficit": target -= 400 
+    elif user.goal == "Aumentar masa": target += 400 
+    
+    return max(1200, min(target, 4000))
+
+
+# Margen aceptado entre el total calculado con la tabla local y el objetivo
+CALORIE_TOLERANCE = 50
+# Cuántos menús caen dentro/fuera del objetivo (calculado localmente, no lo que diga la IA)
+calorie_stats = {"checked": 0, "on_target": 0, "off_target": 0, "abs_deviation_sum": 0}
+
+
+def verify_calorie_target(menu_data: dict, target_calories: int) -> Optional[int]:
+    """Compara el total calculado con la tabla nutricional contra el objetivo; devuelve la desviación en kcal.
+
+    `menu_data` debe venir de MenuGenerationResponse; sin total no se registra nada (un 0 contaría
+    como desviación de -objetivo)."""
+    total = menu_data.get("total_calories")
+    if total is None:
+        return None
+    deviation = int(total) - target_calories
+    calorie_stats["checked"] += 1
+    calorie_stats["abs_deviation_sum"] += abs(deviation)
+    calorie_stats["on_target" if abs(deviation) <= CALORIE_TOLERANCE else "off_target"] += 1
+    return deviation
+
+
+# --- PROMPTS Y SANITIZACIÓN DEL MENÚ ---
+
+def build_menu_prompts(current_user: models.User, inventory_items: list, saved: list, menu_date: Optional[date] = None) -> tuple[str, str, str]:
+    """Arma los prompts (sistema, usuario) y la clave de caché a partir del inventario, recetas guardadas y perfil (sin tocar la BD)"""
+    menu_date = menu_date or date.today()
+
+    target_calories = calculate_target_calories(current_user)
+    
+    # Semilla por usuario y día: el "vibe de hoy" es estable durante el día y el menú se puede cachear
+    rng = random.Random(f"{current_user.id}:{menu_date.isoformat()}")
+
+    # Gustos previos
+    fav_txt = ""
+    if saved:
+        names = [r.name for r in saved]
+        fav_txt = f"GUSTOS PREVIOS: {', '.join(rng.sample(names, min(len(names), 3)))}."
+
+    vibes = ["fresco y ligero", "reconfortante", "sabores intensos", "estilo mediterráneo", "energético"]
+    daily_vibe = rng.choice(vibes)
+    cache_key = menu_cache_key(current_user.id, inventory_items, target_calories, current_user.goal, daily_vibe, llm.OPENAI_MODEL)
+
+    # Sistema estático (cacheable por el proveedor) + usuario con la despensa dentro del presupuesto de tokens
+    prompt_del_sistema = SYSTEM_PROMPT
+    prompt_del_usuario = build_user_prompt(current_user.first_name, daily_vibe, fav_txt, target_calories, inventory_items, current_user.goal)
+
+    return prompt_del_sistema, prompt_del_usuario, cache_key
+
+
+def menu_messages(prompt_del_sistema: str, prompt_del_usuario: str) -> list[dict]:
+    return [{"role": "system", "content": prompt_del_sistema}, {"role": "user", "content": prompt_del_usuario}]
+
+
+async def reask_meal(messages: list[dict], meal_name: str) -> schemas.MealDetail:
+    """Pide de nuevo SOLO la comida que vino rota, en vez de regenerar todo el menú"""
+    parse_stats["meal_reasks"] += 1
+    reask = messages + [{
+        "role": "user",
+        "content": f'Tu respuesta anterior tenía "{meal_name}" incompleto o inválido. Devuelve SOLO el objeto JSON de "{meal_name}" con la estructura del formato obligatorio, sin texto adicional.',
+    }]
+    content = await llm.chat_completion(messages=reask, temperature=0.7)
+    return parse_meal(content, meal_name)
+
+
+async def finalize_menu(messages: list[dict], content: str, target_calories: Optional[int] = None) -> dict:
+    """Respuesta cruda de la IA -> menú validado (reparando y re-preguntando comidas sueltas si hace falta).
+
+    Las calorías y macros salen de la tabla nutricional local; si se pasa `target_calories`
+    se registra la desviación del total respecto al objetivo.
+    """
+    menu_data, failed = parse_menu(content)
+    for meal_name in failed:
+        menu_data[meal_name] = await reask_meal(messages, meal_name)
+    # Las comidas llegan como MealDetail ya validados y pydantic no los revalida (ni recalcula su
+    # nutrición): aquí solo se monta el menú y su total_calories
+    menu_data = schemas.MenuGenerationResponse.model_validate(menu_data).model_dump()
+    if target_calories:
+        verify_calorie_target(menu_data, target_calories)
+    return menu_data
+
+
+async def generate_menu(prompt_del_sistema: str, prompt_del_usuario: str, target_calories: Optional[int] = None) -> dict:
+    """Una completion + parseo/validación. Propaga MenuParseError y errores del cliente."""
+    messages = menu_messages(prompt_del_sistema, prompt_del_usuario)
+    content = await llm.chat_completion(messages=messages, temperature=0.7)
+    return await finalize_menu(messages, content, target_calories)
+
+
+def menu_record(owner_id: int, menu_date: date, cache_key: Optional[str], menu_data: dict, source: str = "api") -> models.GeneratedMenu:
+    """Fila de generated_menus para un menú ya validado"""
+    return models.GeneratedMenu(
+        owner_id=owner_id,
+        menu_date=menu_date,
+        input_hash=cache_key.rsplit(":", 1)[-1] if cache_key else None,
+        breakfast=menu_data["breakfast"],
+        lunch=menu_data["lunch"],
+        dinner=menu_data["dinner"],
+        note=menu_data.get("note"),
+        total_calories=menu_data.get("total_calories"),
+        source=source,
+    )
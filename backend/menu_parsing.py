@@ -0,0 +1,141 @@
+import orjson
+from pydantic import ValidationError
+
+import schemas
+from menu_stream import MEAL_NAMES
+
+
+class MenuParseError(ValueError):
+    """La respuesta de la IA no se pudo convertir en menú ni reparándola"""
+
+
+# Contadores del proceso (cuántas respuestas necesitaron reparación o re-pregunta)
+parse_stats = {"fast_path": 0, "repaired": 0, "meal_reasks": 0, "failed": 0}
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def strip_fences(text: str) -> str:
+    """Quita vallas ```json y cualquier texto antes de la primera llave"""
+    start = text.find("{")
+    if start == -1:
+        return text
+    end = text.rfind("}")
+    fenced = text.rstrip().endswith("```")
+    # Solo recortamos por la derecha si hay texto/valla después del cierre
+    if end > start and (fenced or text[end + 1:].strip()):
+        return text[start:end + 1]
+    return text[start:]
+
+
+def repair_json(text: str) -> str:
+    """Repara en una pasada los defectos típicos: vallas markdown, comas finales y cola truncada.
+
+    Si el texto se corta a mitad (límite de tokens), se descarta el último miembro
+    incompleto y se cierran las llaves/corchetes abiertos.
+    """
+    text = strip_fences(text)
+    out = []
+    stack = []
+    in_string = False
+    escape = False
+    # Último punto seguro para cortar: (longitud de out, pila en ese momento)
+    safe_cut = (0, [])
+    for ch in text:
+        if in_string:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append(ch)
+            out.append(ch)
+            safe_cut = (len(out), list(stack))
+            continue
+        elif ch in "}]":
+            # Coma final antes del cierre: la quitamos
+            while out and out[-1] in " \t\r\n":
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            if stack:
+                stack.pop()
+            out.append(ch)
+            if not stack:
+                return "".join(out)
+            safe_cut = (len(out), list(stack))
+            continue
+        elif ch == ",":
+            safe_cut = (len(out), list(stack))
+        out.append(ch)
+
+    if not stack and not in_string:
+        return "".join(out)
+    # Truncado: volvemos al último punto seguro y cerramos lo que quedó abierto
+    cut, open_stack = safe_cut
+    repaired = "".join(out[:cut]).rstrip()
+    if repaired.endswith(","):
+        repaired = repaired[:-1]
+    return repaired + "".join(_CLOSERS[opener] for opener in reversed(open_stack))
+
+
+def _loads_repaired(content: str):
+    stripped = strip_fences(content)
+    try:
+        # Muchas veces basta con quitar las vallas/texto extra
+        return orjson.loads(stripped)
+    except orjson.JSONDecodeError:
+        pass
+    try:
+        return orjson.loads(repair_json(stripped))
+    except orjson.JSONDecodeError as e:
+        parse_stats["failed"] += 1
+        raise MenuParseError(f"JSON irreparable: {e}") from e
+
+
+def parse_menu(content: str) -> tuple[dict, list[str]]:
+    """Convierte la respuesta de la IA en las partes de un menú validado.
+
+    Devuelve (partes, comidas_fallidas): "note" y cada comida como schemas.MealDetail ya
+    validado, para montar el menú sin volver a validarlas. Camino rápido: una sola pasada de
+    pydantic-core (parseo + reglas de respaldo + validación). Si falla, se repara el JSON
+    localmente y se valida comida por comida; las que sigan mal se devuelven para re-preguntar.
+    """
+    try:
+        menu = schemas.MenuGenerationResponse.model_validate_json(content)
+        parse_stats["fast_path"] += 1
+        return dict(menu), []
+    except ValidationError:
+        pass
+
+    data = _loads_repaired(content)
+    if not isinstance(data, dict):
+        parse_stats["failed"] += 1
+        raise MenuParseError("La respuesta no es un objeto JSON")
+
+    menu, failed = {"note": data.get("note") or ""}, []
+    for meal_name in MEAL_NAMES:
+        try:
+            menu[meal_name] = schemas.MealDetail.model_validate(data.get(meal_name))
+        except ValidationError:
+            failed.append(meal_name)
+    parse_stats["repaired"] += 1
+    return menu, failed
+
+
+def parse_meal(content: str, meal_name: str) -> schemas.MealDetail:
+    """Parsea la respuesta de una re-pregunta: el objeto de la comida (o envuelto en {meal_name: ...})"""
+    data = _loads_repaired(content)
+    if isinstance(data, dict) and isinstance(data.get(meal_name), dict):
+        data = data[meal_name]
+    try:
+        return schemas.MealDetail.model_validate(data)
+    except ValidationError as e:
+        parse_stats["failed"] += 1
+        raise MenuParseError(f"'{meal_name}' inválido tras re-preguntar") from e
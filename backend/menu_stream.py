@@ -0,0 +1,91 @@
+import json
+from typing import Any
+
+MEAL_NAMES = ("breakfast", "lunch", "dinner")
+
+_WHITESPACE = " \t\r\n"
+
+
+class IncrementalObjectParser:
+    """Parser incremental del objeto JSON de nivel superior que devuelve la IA.
+
+    Se le pasan los fragmentos de texto según llegan (feed) y devuelve cada par
+    (clave, valor) de primer nivel en cuanto ese valor está completo, sin esperar
+    al cierre del objeto. Cada carácter se recorre una sola vez. Lo que venga antes
+    de la primera llave (p. ej. una valla ```json) se ignora.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._key = None
+        self._colon = False
+        self._value_start = None
+
+    def _reset_member(self):
+        self._key = None
+        self._colon = False
+        self._value_start = None
+
+    def _emit(self, raw: str, out: list):
+        try:
+            out.append((self._key, json.loads(raw)))
+        except json.JSONDecodeError:
+            pass # Miembro defectuoso: se repara al final con el texto completo
+        self._reset_member()
+
+    def feed(self, chunk: str) -> list[tuple[str, Any]]:
+        self.text += chunk
+        out = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        if self._key is None:
+                            self._key = json.loads(text[self._string_start:i + 1])
+                        elif self._value_start == self._string_start:
+                            self._emit(text[self._value_start:i + 1], out)
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+                if self._depth == 1 and self._colon and self._value_start is None:
+                    self._value_start = i
+            elif ch in "{[":
+                if self._depth == 1 and self._colon and self._value_start is None:
+                    self._value_start = i
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._value_start is not None:
+                    self._emit(text[self._value_start:i + 1], out)
+                elif self._depth == 0 and self._value_start is not None:
+                    # Último miembro escalar: termina con el cierre del objeto
+                    self._emit(text[self._value_start:i].strip(), out)
+            elif self._depth == 1:
+                if ch == ":" and self._key is not None and not self._colon:
+                    self._colon = True
+                elif ch == ",":
+                    if self._value_start is not None:
+                        self._emit(text[self._value_start:i].strip(), out)
+                elif ch not in _WHITESPACE and self._colon and self._value_start is None:
+                    self._value_start = i  # número, true/false/null
+        self._pos = len(text)
+        return out
+
+
+def sse_event(event: str, data: Any) -> str:
+    """Formatea un evento server-sent events con el payload en JSON"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
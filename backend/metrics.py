@@ -0,0 +1,287 @@
+"""Métricas de la app en formato Prometheus (GET /metrics), sin dependencias externas.
+
+- MetricsMiddleware: latencia por ruta (plantilla de la ruta, no la URL: /inventory/{item_name}),
+  método y código de estado, y peticiones en curso.
+- Consultas SQL por petición: eventos de SQLAlchemy sobre todos los Engine (también el
+  sync_engine de los AsyncEngine) acumulan número de consultas y tiempo en la petición en curso
+  (contextvar). Solo en una fracción METRICS_SAMPLE_RATE de las peticiones: el resto no paga
+  más que una lectura del contextvar por consulta.
+- LLM (llm.py): duración, espera por el semáforo de concurrencia, tiempo hasta el primer token
+  (streaming) y tokens de prompt/completion.
+- Fases sueltas (timed("menu_prompt_build")...): para ver en qué se va el tiempo de una ruta.
+
+Cada proceso tiene su registro: con varios workers de uvicorn, Prometheus debe scrapear cada uno
+(o se ve solo el que atienda la petición a /metrics).
+"""
+import bisect
+import contextvars
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# Fracción de peticiones con contabilidad de consultas SQL (0-1)
+METRICS_SAMPLE_RATE = float(os.getenv("METRICS_SAMPLE_RATE", 1.0))
+
+PREFIX = "mealia_"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.label_names = labels
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.label_names)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines += self._samples(key, value)
+        return lines
+
+    def _samples(self, key: tuple, value) -> list[str]:
+        return [f"{self.name}{_labels_text(self.label_names, key)} {_number(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # [conteo por bucket (no acumulado)..., +Inf, suma]
+                series = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def _samples(self, key: tuple, series: list) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), series):
+            cumulative += count
+            le = 'le="' + _number(bound) + '"'
+            lines.append(f"{self.name}_bucket{_labels_text(self.label_names, key, le)} {cumulative}")
+        labels = _labels_text(self.label_names, key)
+        lines.append(f"{self.name}_sum{labels} {_number(series[-1])}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_duration = registry.register(Histogram("http_request_duration_seconds", "Latencia de las peticiones HTTP", ("method", "route", "status")))
+http_in_progress = registry.register(Gauge("http_requests_in_progress", "Peticiones HTTP en curso"))
+db_queries = registry.register(Histogram("db_queries_per_request", "Consultas SQL por petición (muestreado)", ("method", "route"), COUNT_BUCKETS))
+db_seconds = registry.register(Histogram("db_seconds_per_request", "Tiempo en consultas SQL por petición (muestreado)", ("method", "route")))
+llm_duration = registry.register(Histogram("llm_request_duration_seconds", "Duración de las llamadas al LLM (sin la espera por el semáforo)", ("call", "outcome")))
+llm_queue_wait = registry.register(Histogram("llm_queue_wait_seconds", "Espera por un hueco de LLM_MAX_CONCURRENCY", ("call",)))
+llm_first_token = registry.register(Histogram("llm_time_to_first_token_seconds", "Tiempo hasta el primer fragmento de texto (streaming)", ("call",)))
+llm_tokens = registry.register(Counter("llm_tokens_total", "Tokens consumidos según el uso que informa la API", ("call", "type")))
+phase_duration = registry.register(Histogram("phase_duration_seconds", "Duración de fases concretas dentro de una petición", ("phase",)))
+rate_limited = registry.register(Counter("rate_limited_total", "Peticiones rechazadas con 429 por regla de rate_limit.py", ("rule",)))
+coalesced = registry.register(Counter("coalesced_calls_total", "Llamadas que esperaron el resultado de otra idéntica en curso en vez de repetirla", ("call",)))
+
+
+# --- Consultas SQL por petición ---
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds", "_started")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self._started = 0.0
+
+
+_request_stats: contextvars.ContextVar[RequestStats | None] = contextvars.ContextVar("request_stats", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _request_stats.get()
+    if stats is not None:
+        stats._started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - stats._started
+
+
+def _route_of(scope) -> str:
+    # FastAPI deja la ruta encontrada en el scope; sin ella (404, /uploads) no se usa la URL
+    route = scope.get("route")
+    return getattr(route, "path", "<unmatched>")
+
+
+class MetricsMiddleware:
+    """Mide cada petición HTTP hasta que la app termina (en streaming, hasta el último evento)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats() if random.random() < METRICS_SAMPLE_RATE else None
+        token = _request_stats.set(stats)
+        status = 500
+
+        async def tracking_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, tracking_send)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_in_progress.dec()
+            _request_stats.reset(token)
+            route = _route_of(scope)
+            method = scope["method"]
+            http_duration.observe(elapsed, method=method, route=route, status=status)
+            if stats is not None:
+                db_queries.observe(stats.queries, method=method, route=route)
+                db_seconds.observe(stats.db_seconds, method=method, route=route)
+
+
+# --- Fases y llamadas al LLM ---
+
+@contextmanager
+def timed(phase: str):
+    """Mide un bloque (síncrono o con awaits dentro) en phase_duration_seconds{phase}"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if METRICS_ENABLED:
+            phase_duration.observe(time.perf_counter() - start, phase=phase)
+
+
+class LLMSpan:
+    """Una llamada al LLM: espera por el semáforo, primer token, tokens y resultado.
+
+        span = LLMSpan("chat")
+        async with semaphore:
+            span.acquired()
+            ...
+            span.first_token()       # solo streaming
+            span.usage(completion.usage)
+        span.finish()                # o span.finish(error=True)
+    """
+
+    __slots__ = ("call", "_created", "_start", "_first_token")
+
+    def __init__(self, call: str):
+        self.call = call
+        self._created = self._start = time.perf_counter()
+        self._first_token = None
+
+    def acquired(self):
+        self._start = time.perf_counter()
+        if METRICS_ENABLED:
+            llm_queue_wait.observe(self._start - self._created, call=self.call)
+
+    def first_token(self):
+        if self._first_token is None:
+            self._first_token = time.perf_counter()
+            if METRICS_ENABLED:
+                llm_first_token.observe(self._first_token - self._start, call=self.call)
+
+    def usage(self, usage):
+        if usage is None or not METRICS_ENABLED:
+            return
+        llm_tokens.inc(usage.prompt_tokens or 0, call=self.call, type="prompt")
+        llm_tokens.inc(usage.completion_tokens or 0, call=self.call, type="completion")
+
+    def finish(self, error: bool = False):
+        if METRICS_ENABLED:
+            llm_duration.observe(time.perf_counter() - self._start, call=self.call, outcome="error" if error else "ok")
+
+
+def render() -> str:
+    return registry.render()
@@ -0,0 +1,120 @@
+"""Migraciones de esquema versionadas (sin tener que borrar mealia.db).
+
+create_all solo crea tablas que no existen; todo cambio sobre una tabla existente
+(índices, columnas, limpieza de datos) va como migración en MIGRATIONS, en orden.
+Cada una se aplica una sola vez, en su propia transacción, y queda registrada en
+schema_migrations. Escribirlas idempotentes (IF NOT EXISTS): en una BD nueva
+create_all ya deja el esquema final y la migración no debe fallar.
+
+    cd backend
+    python migrations.py            # aplica las pendientes
+    python migrations.py status     # aplicadas / pendientes
+"""
+import sys
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+
+import database
+import models  # noqa: F401  (registra los modelos en Base.metadata)
+
+_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations", _metadata,
+    Column("id", String, primary_key=True),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def _inventory_owner_name_unique(conn: Connection):
+    # Duplicados previos (altas concurrentes): se suman en la fila más antigua y se borran las demás.
+    # Índice provisional para que la limpieza no recorra la tabla entera por cada duplicado.
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_inventory_owner_name_tmp ON inventory_items (owner_id, name)"))
+    conn.execute(text("""
+        UPDATE inventory_items SET quantity = (
+            SELECT SUM(d.quantity) FROM inventory_items d
+            WHERE d.owner_id = inventory_items.owner_id AND d.name = inventory_items.name)
+        WHERE id IN (SELECT MIN(id) FROM inventory_items GROUP BY owner_id, name HAVING COUNT(*) > 1)
+    """))
+    conn.execute(text("DELETE FROM inventory_items WHERE id NOT IN (SELECT MIN(id) FROM inventory_items GROUP BY owner_id, name)"))
+    conn.execute(text("DROP INDEX ix_inventory_owner_name_tmp"))
+    conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ux_inventory_owner_name ON inventory_items (owner_id, name)"))
+    # El índice solo por nombre queda cubierto por el compuesto
+    conn.execute(text("DROP INDEX IF EXISTS ix_inventory_items_name"))
+
+
+def _saved_recipes_owner_name_unique(conn: Connection):
+    conn.execute(text("DELETE FROM saved_recipes WHERE id NOT IN (SELECT MIN(id) FROM saved_recipes GROUP BY owner_id, name)"))
+    conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ux_saved_recipes_owner_name ON saved_recipes (owner_id, name)"))
+
+
+def _users_photo_key(conn: Connection):
+    # ALTER TABLE no tiene IF NOT EXISTS en SQLite: en una BD nueva create_all ya creó la columna
+    if "photo_key" not in {column["name"] for column in inspect(conn).get_columns("users")}:
+        conn.execute(text("ALTER TABLE users ADD COLUMN photo_key VARCHAR"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_photo_key ON users (photo_key)"))
+
+
+def _add_column(conn: Connection, table: str, column: str, ddl: str):
+    # ALTER TABLE no tiene IF NOT EXISTS en SQLite: en una BD nueva create_all ya creó la columna
+    if column not in {c["name"] for c in inspect(conn).get_columns(table)}:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def _sync_versions(conn: Connection):
+    # Las filas existentes quedan en versión 0: la primera sincronización (since=0) es completa
+    _add_column(conn, "users", "sync_version", "INTEGER NOT NULL DEFAULT 0")
+    _add_column(conn, "users", "sync_floor", "INTEGER NOT NULL DEFAULT 0")
+    _add_column(conn, "inventory_items", "version", "INTEGER NOT NULL DEFAULT 0")
+    _add_column(conn, "saved_recipes", "version", "INTEGER NOT NULL DEFAULT 0")
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_inventory_owner_version ON inventory_items (owner_id, version)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_saved_recipes_owner_version ON saved_recipes (owner_id, version)"))
+
+
+# (id, función) en orden de aplicación. No reordenar ni renombrar las ya publicadas.
+MIGRATIONS = [
+    ("0001_inventory_owner_name_unique", _inventory_owner_name_unique),
+    ("0002_saved_recipes_owner_name_unique", _saved_recipes_owner_name_unique),
+    ("0003_users_photo_key", _users_photo_key),
+    ("0004_sync_versions", _sync_versions),
+]
+
+
+def applied_migrations(engine: Engine) -> set[str]:
+    _metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        return set(conn.execute(select(schema_migrations.c.id)).scalars())
+
+
+def upgrade(engine: Engine = None) -> list[str]:
+    """Crea las tablas nuevas y aplica las migraciones pendientes; devuelve las aplicadas ahora"""
+    engine = engine or database.engine
+    database.Base.metadata.create_all(bind=engine)
+    done = applied_migrations(engine)
+    applied = []
+    for migration_id, migrate in MIGRATIONS:
+        if migration_id in done:
+            continue
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.execute(schema_migrations.insert().values(id=migration_id, applied_at=datetime.utcnow()))
+        applied.append(migration_id)
+    return applied
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "upgrade"
+    if command == "status":
+        done = applied_migrations(database.engine)
+        for migration_id, _ in MIGRATIONS:
+            print(f"{'[x]' if migration_id in done else '[ ]'} {migration_id}")
+    elif command == "upgrade":
+        applied = upgrade()
+        print("\n".join(f"aplicada {m}" for m in applied) or "Esquema al día")
+    else:
+        sys.exit(f"Comando desconocido: {command} (usa upgrade o status)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,7 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Float, DateTime, JSON 
+from sqlalchemy import Column, Integer, String, ForeignKey, Float, Date, DateTime, JSON, Index 
+from datetime import datetime
 from sqlalchemy.orm import relationship
-<<<<<<< HEAD
-from database import Base # Crearemos este archivo en el siguiente paso
-=======
 from database import Base
->>>>>>> f07a5d1764c53e5a13e8d8f232938d6fa0f8b50f
 
 class User(Base):
     __tablename__ = "users"
@@ -21,21 +18,39 @@ class User(Base):
     birthdate = Column(DateTime, nullable=True)
     goal = Column(String, default="Mantenimiento") 
     photo_url = Column(String, nullable=True)
+    # Foto subida a photo_storage (clave por contenido); None si no hay o es una URL externa/antigua
+    photo_key = Column(String, nullable=True, index=True)
+    # Versión de sincronización: sube en cada cambio de su inventario o recetas (ver sync.py)
+    sync_version = Column(Integer, nullable=False, default=0, server_default="0")
+    # Lápidas con versión <= sync_floor ya se purgaron: un ?since= anterior recibe la lista completa
+    sync_floor = Column(Integer, nullable=False, default=0, server_default="0")
     inventory_items = relationship("InventoryItem", back_populates="owner")
     saved_recipes = relationship("SavedRecipe", back_populates="owner")
+    generated_menus = relationship("GeneratedMenu", back_populates="owner")
 
 
 class InventoryItem(Base):
     __tablename__ = "inventory_items"
+    # Un ítem por nombre y usuario; también es el destino del ON CONFLICT de /inventory/batch
+    __table_args__ = (
+        Index("ux_inventory_owner_name", "owner_id", "name", unique=True),
+        Index("ix_inventory_owner_version", "owner_id", "version"),
+    )
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, index=True, nullable=False) 
+    name = Column(String, nullable=False) # Buscado siempre junto con owner_id (ux_inventory_owner_name)
     quantity = Column(Float, default=1.0)
     unit = Column(String, default="Unidades")
     owner_id = Column(Integer, ForeignKey("users.id"))
+    version = Column(Integer, nullable=False, default=0, server_default="0") # sync_version del dueño en su último cambio
     owner = relationship("User", back_populates="inventory_items")
     
 class SavedRecipe(Base):
     __tablename__ = "saved_recipes"
+    # Una receta por nombre y usuario (save_recipe busca por ambos)
+    __table_args__ = (
+        Index("ux_saved_recipes_owner_name", "owner_id", "name", unique=True),
+        Index("ix_saved_recipes_owner_version", "owner_id", "version"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
@@ -44,5 +59,50 @@ class SavedRecipe(Base):
     steps = Column(JSON)
     calories = Column(Integer)
     owner_id = Column(Integer, ForeignKey("users.id"))
+    version = Column(Integer, nullable=False, default=0, server_default="0")
 
-    owner = relationship("User", back_populates="saved_recipes")
\ No newline at end of file
+    owner = relationship("User", back_populates="saved_recipes")
+
+class GeneratedMenu(Base):
+    __tablename__ = "generated_menus"
+    # /menus/today y /menus/history: una sola búsqueda por índice (owner_id, menu_date, id)
+    __table_args__ = (Index("ix_generated_menus_owner_date", "owner_id", "menu_date", "id"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    menu_date = Column(Date, nullable=False)
+    # Hash de las entradas (inventario, calorías, objetivo...) con que se generó
+    input_hash = Column(String, nullable=True)
+    breakfast = Column(JSON)
+    lunch = Column(JSON)
+    dinner = Column(JSON)
+    note = Column(String, nullable=True)
+    total_calories = Column(Integer)
+    source = Column(String, default="api") # "api", "batch" o "local"
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    owner = relationship("User", back_populates="generated_menus")
+
+
+class PhotoBlob(Base):
+    """Foto guardada por contenido (todos sus tamaños de avatar), compartida entre usuarios"""
+    __tablename__ = "photo_blobs"
+    key = Column(String, primary_key=True)  # sha256 del original + parámetros de los avatares
+    refcount = Column(Integer, nullable=False, default=0)  # usuarios con photo_key = key
+    size_bytes = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # Último cambio de refcount: el recolector respeta un margen antes de borrar
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class SyncTombstone(Base):
+    """Fila borrada de inventory_items o saved_recipes, para que /sync se la comunique a los clientes"""
+    __tablename__ = "sync_tombstones"
+    __table_args__ = (Index("ix_sync_tombstones_owner_version", "owner_id", "version"),)
+
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    entity = Column(String, nullable=False) # "inventory" o "recipe"
+    entity_id = Column(Integer, nullable=False)
+    version = Column(Integer, nullable=False) # sync_version del dueño en el borrado
+    created_at = Column(DateTime, default=datetime.utcnow)
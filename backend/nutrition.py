@@ -0,0 +1,167 @@
+"""Motor de nutrición local: calcula macros y micros de una comida a partir de sus ingredientes.
+
+La tabla (data/nutrition.csv) tiene valores por 100 g y, para lo que se cuenta por piezas,
+los gramos de una unidad. Los ingredientes vienen como "cant+unidad ing" ("50g avena",
+"1 unidad plátano", "2 cdas aceite de oliva") y se convierten a gramos.
+"""
+import os
+import re
+import csv
+from functools import lru_cache
+from typing import Optional
+
+from prompt_builder import DATA_DIR, normalize_name
+
+NUTRIENTS = ("kcal", "carbs", "protein", "fat", "fiber", "sugar", "sodium")
+
+# Gramos por unidad de medida (los líquidos se aproximan a 1 g/ml)
+UNIT_GRAMS = {
+    "g": 1, "gr": 1, "grs": 1, "gramo": 1, "gramos": 1,
+    "kg": 1000, "kilo": 1000, "kilos": 1000,
+    "mg": 0.001,
+    "ml": 1, "cc": 1, "l": 1000, "lt": 1000, "litro": 1000, "litros": 1000,
+    "oz": 28.35, "lb": 453.6,
+    "cda": 15, "cdas": 15, "cucharada": 15, "cucharadas": 15,
+    "cdta": 5, "cdtas": 5, "cucharadita": 5, "cucharaditas": 5,
+    "taza": 200, "tazas": 200, "vaso": 200, "vasos": 200,
+    "pizca": 0.5, "pizcas": 0.5, "chorrito": 10,
+    "puñado": 30, "punado": 30, "puñados": 30, "punados": 30,
+    "rebanada": 30, "rebanadas": 30, "lonja": 15, "lonjas": 15, "loncha": 15, "lonchas": 15,
+    "lata": 160, "latas": 160,
+    "diente": 5, "dientes": 5,
+}
+# Unidades que cuentan piezas: los gramos salen de la columna unit_g del alimento
+PIECE_UNITS = {"u", "ud", "uds", "unidad", "unidades", "pieza", "piezas", "filete", "filetes", "trozo", "trozos"}
+# Peso de una pieza cuando la tabla no lo trae
+DEFAULT_PIECE_GRAMS = 100
+# Cantidad de lo que va "al gusto" (sal, pimienta...)
+TO_TASTE_GRAMS = 1
+
+_FRACTIONS = {"½": 0.5, "¼": 0.25, "¾": 0.75, "⅓": 1 / 3, "⅔": 2 / 3}
+_QUANTITY_RE = re.compile(r"^\s*(\d+\s*[½¼¾⅓⅔]|\d+\s+\d+/\d+|\d+/\d+|\d+(?:[.,]\d+)?|[½¼¾⅓⅔])\s*")
+_UNIT_RE = re.compile(r"^([^\W\d_]+)\.?\s*")
+_STOP_WORDS = {"de", "del", "la", "el", "los", "las", "en", "con", "a", "al", "y"}
+
+
+@lru_cache(maxsize=1)
+def _food_table() -> dict[str, tuple]:
+    """{nombre normalizado: (kcal, carbs, protein, fat, fiber, sugar, sodium, unit_g)} por 100 g"""
+    with open(os.path.join(DATA_DIR, "nutrition.csv"), encoding="utf-8") as f:
+        return {
+            normalize_name(row["name"]): tuple(float(row[field]) for field in (*NUTRIENTS, "unit_g"))
+            for row in csv.DictReader(f)
+        }
+
+
+def _singular(word: str) -> str:
+    if word.endswith("es") and len(word) > 4:
+        return word[:-2]
+    if word.endswith("s") and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+@lru_cache(maxsize=4096)
+def lookup_food(name: str) -> Optional[str]:
+    """Alimento de la tabla para un nombre libre: exacto, o la frase más larga que coincida
+    ('pechuga de pollo a la plancha' -> pollo, 'huevos' -> huevo)"""
+    table = _food_table()
+    words = normalize_name(name).split()
+    for candidate in (" ".join(words), " ".join(_singular(w) for w in words)):
+        if candidate in table:
+            return candidate
+    for size in range(min(len(words), 4), 0, -1):
+        for start in range(len(words) - size + 1):
+            chunk = words[start:start + size]
+            if chunk[0] in _STOP_WORDS or chunk[-1] in _STOP_WORDS:
+                continue
+            for candidate in (" ".join(chunk), " ".join(_singular(w) for w in chunk)):
+                if candidate in table:
+                    return candidate
+    return None
+
+
+def _parse_quantity(text: str) -> tuple[Optional[float], str]:
+    match = _QUANTITY_RE.match(text)
+    if not match:
+        return None, text
+    raw = match.group(1)
+    if raw[-1] in _FRACTIONS:
+        whole = raw[:-1].strip()
+        value = (float(whole) if whole else 0) + _FRACTIONS[raw[-1]]
+    elif "/" in raw:
+        whole, _, frac = raw.rpartition(" ")
+        num, den = frac.split("/")
+        value = (float(whole) if whole else 0) + (float(num) / float(den) if float(den) else 0)
+    else:
+        value = float(raw.replace(",", "."))
+    return value, text[match.end():]
+
+
+def split_ingredient(text: str) -> tuple[Optional[float], Optional[str], str]:
+    """"2 cdas de aceite de oliva" -> (2.0, "cdas", "aceite de oliva"); unidad None si no hay una conocida"""
+    quantity, rest = _parse_quantity(text.strip().lower())
+    unit = None
+    match = _UNIT_RE.match(rest)
+    if match and (match.group(1) in UNIT_GRAMS or match.group(1) in PIECE_UNITS):
+        unit = match.group(1)
+        rest = rest[match.end():]
+    if rest.startswith("de "):
+        rest = rest[3:]
+    return quantity, unit, rest
+
+
+@lru_cache(maxsize=4096)
+def parse_ingredient(text: str) -> tuple[Optional[str], float]:
+    """"cant+unidad ing" -> (alimento de la tabla o None, gramos)"""
+    quantity, unit, rest = split_ingredient(text)
+    food = lookup_food(rest)
+    if food is None:
+        return None, 0.0
+    unit_grams = UNIT_GRAMS.get(unit)
+    if quantity is None:
+        # "Sal y pimienta al gusto", "Aceite de oliva"
+        return food, float(unit_grams or TO_TASTE_GRAMS)
+    if unit_grams is not None:
+        return food, quantity * unit_grams
+    # "2 huevos" o "1 unidad plátano": piezas
+    return food, quantity * piece_grams(food) if unit in PIECE_UNITS or quantity < 20 else quantity
+
+
+def piece_grams(food: str) -> float:
+    """Gramos de una unidad del alimento (columna unit_g de la tabla)"""
+    return _food_table()[food][-1] or DEFAULT_PIECE_GRAMS
+
+
+def kcal_per_gram(food: str) -> float:
+    return _food_table()[food][0] / 100
+
+
+def meal_nutrition(ingredients: list[str]) -> Optional[dict]:
+    """Calorías, macros y micros de la lista de ingredientes; None si no se reconoce ninguno"""
+    table = _food_table()
+    totals = [0.0] * len(NUTRIENTS)
+    resolved = 0
+    for ingredient in ingredients:
+        if not isinstance(ingredient, str):
+            continue
+        food, grams = parse_ingredient(ingredient)
+        if food is None:
+            continue
+        resolved += 1
+        factor = grams / 100
+        values = table[food]
+        for i in range(len(NUTRIENTS)):
+            totals[i] += values[i] * factor
+    if not resolved:
+        return None
+    kcal, carbs, protein, fat, fiber, sugar, sodium = totals
+    return {
+        "calories": int(round(kcal)),
+        "carbs": int(round(carbs)),
+        "protein": int(round(protein)),
+        "fat": int(round(fat)),
+        "fiber": round(fiber, 1),
+        "sugar": round(sugar, 1),
+        "sodium": int(round(sodium)),
+    }
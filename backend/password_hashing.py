@@ -0,0 +1,44 @@
+"""Contexto de hashing de contraseñas y funciones que corren en los procesos del pool.
+
+Módulo mínimo a propósito: los procesos del pool (arranque 'spawn') solo importan esto,
+no la app ni la BD. El pool, la admisión y las métricas están en security.py.
+"""
+import os
+import secrets
+
+from passlib.context import CryptContext
+
+# Costos de Argon2 (argon2id). Al cambiarlos, los hashes viejos se rehacen en el siguiente login.
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", 3))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", 65536))  # KiB
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", 4))
+
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__time_cost=ARGON2_TIME_COST,
+    argon2__memory_cost=ARGON2_MEMORY_COST,
+    argon2__parallelism=ARGON2_PARALLELISM,
+)
+
+# Prefijo de las contraseñas inutilizables (cuentas creadas con Google): nunca verifican
+UNUSABLE_PREFIX = "!"
+
+
+def unusable_password() -> str:
+    return UNUSABLE_PREFIX + secrets.token_hex(16)
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_and_update(password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """(coincide, hash nuevo si los parámetros cambiaron o el esquema está obsoleto)"""
+    if not hashed_password or hashed_password.startswith(UNUSABLE_PREFIX):
+        return False, None
+    try:
+        return pwd_context.verify_and_update(password, hashed_password)
+    except ValueError:
+        # Hash con formato desconocido
+        return False, None
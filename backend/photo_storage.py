@@ -0,0 +1,302 @@
+"""Fotos de perfil guardadas por contenido, con deduplicación y conteo de referencias.
+
+Cada foto subida se identifica por una clave = sha256(contenido original + parámetros de
+los avatares). Sus avatares se guardan como objetos `<clave>_<lado>.<ext>` en un backend
+intercambiable: disco local en subdirectorios por prefijo (ab/cd/...) o un bucket S3
+(o compatible: MinIO, moto). La misma imagen subida por varios usuarios se guarda una vez;
+photo_blobs cuenta cuántos usuarios la usan. Como el nombre depende del contenido, un
+objeto nunca cambia: se sirve con ETag fuerte y Cache-Control immutable.
+
+Las fotos que nadie referencia no se borran en el momento (otra subida simultánea podría
+estar reutilizándolas): las recoge collect_garbage pasado PHOTO_GC_GRACE_SECONDS.
+
+    cd backend
+    python photo_storage.py gc      # recolecta fotos sin referencias y objetos huérfanos
+"""
+import hashlib
+import os
+import re
+import sys
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Iterator, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+import models
+import photos
+
+# Vacío: disco local en PHOTO_STORAGE_DIR. s3://bucket/prefijo: S3 o compatible (requiere boto3)
+PHOTO_STORAGE_URL = os.getenv("PHOTO_STORAGE_URL", "")
+PHOTO_STORAGE_DIR = os.getenv("PHOTO_STORAGE_DIR", "photo_store")
+# Endpoint de un servicio compatible con S3 (MinIO, moto...); vacío = AWS
+PHOTO_S3_ENDPOINT_URL = os.getenv("PHOTO_S3_ENDPOINT_URL") or None
+PHOTO_GC_GRACE_SECONDS = int(os.getenv("PHOTO_GC_GRACE_SECONDS", 3600))
+
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+CONTENT_TYPES = {"webp": "image/webp", "jpg": "image/jpeg"}
+OBJECT_NAME_RE = re.compile(r"^([0-9a-f]{64})_(\d+)\.(webp|jpg)$")
+
+_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+_blobs = models.PhotoBlob.__table__
+
+
+def photo_key(content_sha256: str) -> str:
+    return hashlib.sha256(f"{photos.RENDER_SIGNATURE}|{content_sha256}".encode()).hexdigest()
+
+
+def object_names(key: str) -> list[str]:
+    return [photos.avatar_name(key, size) for size in photos.AVATAR_SIZES]
+
+
+def content_type(name: str) -> str:
+    return CONTENT_TYPES.get(name.rsplit(".", 1)[-1], "application/octet-stream")
+
+
+# --- Backends ---
+
+class LocalPhotoStorage:
+    """Objetos en disco: <root>/ab/cd/<nombre> (evita directorios con millones de archivos)"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.work_dir = os.path.join(root, "tmp")
+        os.makedirs(self.work_dir, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name[:2], name[2:4], name)
+
+    def put_file(self, name: str, src_path: str):
+        """Mueve src_path al almacén (el archivo temporal desaparece)"""
+        dest = self._path(name)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(src_path, dest)
+
+    def size(self, name: str) -> Optional[int]:
+        try:
+            return os.path.getsize(self._path(name))
+        except FileNotFoundError:
+            return None
+
+    def read(self, name: str, start: int = 0, end: Optional[int] = None) -> bytes:
+        """Bytes [start, end] (end incluido, como en Range)"""
+        with open(self._path(name), "rb") as f:
+            f.seek(start)
+            return f.read() if end is None else f.read(end - start + 1)
+
+    def delete(self, name: str):
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+    def list_objects(self) -> Iterator[tuple[str, datetime]]:
+        for directory, subdirs, files in os.walk(self.root):
+            if directory == self.root:
+                subdirs[:] = [d for d in subdirs if d != "tmp"]
+            for name in files:
+                yield name, datetime.utcfromtimestamp(os.path.getmtime(os.path.join(directory, name)))
+
+
+class S3PhotoStorage:
+    """Objetos en un bucket S3 o compatible, bajo un prefijo"""
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None, work_dir: str = PHOTO_STORAGE_DIR):
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError as e:
+            raise RuntimeError("PHOTO_STORAGE_URL=s3://... requiere el paquete 'boto3' (pip install boto3)") from e
+        self._client = boto3.client("s3", endpoint_url=endpoint_url)
+        self._client_error = ClientError
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        # Los avatares se generan en disco antes de subirlos
+        self.work_dir = os.path.join(work_dir, "tmp")
+        os.makedirs(self.work_dir, exist_ok=True)
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}{name[:2]}/{name[2:4]}/{name}"
+
+    def put_file(self, name: str, src_path: str):
+        extra = {"ContentType": content_type(name), "CacheControl": CACHE_CONTROL}
+        try:
+            self._client.upload_file(src_path, self.bucket, self._key(name), ExtraArgs=extra)
+        finally:
+            os.remove(src_path)
+
+    def size(self, name: str) -> Optional[int]:
+        try:
+            return self._client.head_object(Bucket=self.bucket, Key=self._key(name))["ContentLength"]
+        except self._client_error as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def read(self, name: str, start: int = 0, end: Optional[int] = None) -> bytes:
+        byte_range = f"bytes={start}-{'' if end is None else end}"
+        return self._client.get_object(Bucket=self.bucket, Key=self._key(name), Range=byte_range)["Body"].read()
+
+    def delete(self, name: str):
+        self._client.delete_object(Bucket=self.bucket, Key=self._key(name))
+
+    def list_objects(self) -> Iterator[tuple[str, datetime]]:
+        for page in self._client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get("Contents", []):
+                yield obj["Key"].rsplit("/", 1)[-1], obj["LastModified"].replace(tzinfo=None)
+
+
+def build_storage(url: str = PHOTO_STORAGE_URL):
+    if url.startswith("s3://"):
+        bucket, _, prefix = url[len("s3://"):].partition("/")
+        return S3PhotoStorage(bucket, prefix, endpoint_url=PHOTO_S3_ENDPOINT_URL)
+    if url:
+        raise RuntimeError(f"PHOTO_STORAGE_URL no soportada: {url} (vacía para disco local o s3://bucket/prefijo)")
+    return LocalPhotoStorage(PHOTO_STORAGE_DIR)
+
+
+@lru_cache(maxsize=1)
+def get_storage():
+    return build_storage()
+
+
+def parse_range(header: str, total: int):
+    """(inicio, fin) de una cabecera Range de un solo rango; None para ignorarla; "invalid" si no se puede servir"""
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None  # varios rangos: se responde el objeto completo (permitido por RFC 9110)
+    first, _, last = spec.strip().partition("-")
+    try:
+        if not first:
+            suffix = int(last)
+            if suffix <= 0:
+                return "invalid"
+            return max(total - suffix, 0), total - 1
+        start = int(first)
+        end = min(int(last), total - 1) if last else total - 1
+    except ValueError:
+        return None
+    if start >= total or end < start:
+        return "invalid"
+    return start, end
+
+
+# --- Referencias ---
+
+def has_blob(db: Session, key: str) -> bool:
+    """Otro usuario ya subió la misma imagen (solo BD; comprobar también has_objects)"""
+    return db.get(models.PhotoBlob, key) is not None
+
+
+def has_objects(storage, key: str) -> bool:
+    """Todos los avatares de la foto están en el almacén (E/S de disco o S3: llamar en el threadpool)"""
+    return all(storage.size(name) is not None for name in object_names(key))
+
+
+def has_photo(db: Session, storage, key: str) -> bool:
+    """La foto ya está guardada (otro usuario subió la misma imagen): no hace falta generarla"""
+    return has_blob(db, key) and has_objects(storage, key)
+
+
+def _add_reference(db: Session, key: str, size_bytes: int):
+    dialect = db.get_bind().dialect.name
+    if dialect not in _INSERTS:
+        raise NotImplementedError(f"Upsert de fotos no soportado en {dialect}")
+    now = datetime.utcnow()
+    stmt = _INSERTS[dialect](_blobs).values(key=key, refcount=1, size_bytes=size_bytes, created_at=now, updated_at=now)
+    db.execute(stmt.on_conflict_do_update(index_elements=[_blobs.c.key], set_={"refcount": _blobs.c.refcount + 1, "updated_at": now}))
+
+
+def _drop_reference(db: Session, key: str):
+    db.execute(update(_blobs).where(_blobs.c.key == key, _blobs.c.refcount > 0).values(refcount=_blobs.c.refcount - 1, updated_at=datetime.utcnow()))
+
+
+def assign_photo(db: Session, user: models.User, key: Optional[str], photo_url: Optional[str], size_bytes: int = 0) -> Optional[str]:
+    """Cambia la foto del usuario (None la quita) y ajusta las referencias; hace commit.
+
+    Devuelve la photo_url anterior si no venía de photo_storage (archivo antiguo en uploads/ a borrar aparte).
+    """
+    # `user` puede venir de la caché de auth, que otro worker no invalida: la foto actual se lee
+    # de la BD (bloqueando la fila) o se restaría la referencia a un blob que ya no es el suyo
+    db.refresh(user, with_for_update=True)
+    previous_key, previous_url = user.photo_key, user.photo_url
+    if key != previous_key:
+        if key is not None:
+            _add_reference(db, key, size_bytes)
+        if previous_key is not None:
+            _drop_reference(db, previous_key)
+    user.photo_key = key
+    user.photo_url = photo_url
+    db.commit()
+    return previous_url if previous_key is None and previous_url != photo_url else None
+
+
+def store_avatars(storage, key: str, avatars: dict[int, str]) -> int:
+    """Sube los avatares generados en storage.work_dir; devuelve los bytes guardados"""
+    total = 0
+    for name in avatars.values():
+        path = os.path.join(storage.work_dir, name)
+        total += os.path.getsize(path)
+        storage.put_file(name, path)
+    return total
+
+
+# --- Recolección ---
+
+def collect_garbage(db: Session, storage=None, grace_seconds: int = PHOTO_GC_GRACE_SECONDS) -> dict:
+    """Corrige los contadores, borra fotos sin usuarios y objetos sin fila en photo_blobs"""
+    storage = storage or get_storage()
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    stats = {"refcounts_fixed": 0, "blobs_deleted": 0, "objects_deleted": 0, "bytes_freed": 0}
+
+    # Contadores desviados (p. ej. un proceso que murió entre commit y commit): se recalculan
+    counts = dict(db.execute(select(models.User.photo_key, func.count()).where(models.User.photo_key.is_not(None)).group_by(models.User.photo_key)).all())
+    for blob in db.scalars(select(models.PhotoBlob)):
+        actual = counts.get(blob.key, 0)
+        if blob.refcount != actual:
+            blob.refcount = actual
+            blob.updated_at = datetime.utcnow()
+            stats["refcounts_fixed"] += 1
+    db.commit()
+
+    dead = db.execute(select(_blobs.c.key, _blobs.c.size_bytes).where(_blobs.c.refcount == 0, _blobs.c.updated_at < cutoff)).all()
+    for key, size_bytes in dead:
+        # Primero la fila (con la condición repetida: otra subida pudo reutilizarla), luego los objetos
+        deleted = db.execute(_blobs.delete().where(_blobs.c.key == key, _blobs.c.refcount == 0)).rowcount
+        db.commit()
+        if not deleted:
+            continue
+        for name in object_names(key):
+            storage.delete(name)
+        stats["blobs_deleted"] += 1
+        stats["bytes_freed"] += size_bytes or 0
+
+    known = set(db.scalars(select(models.PhotoBlob.key)))
+    for name, modified_at in list(storage.list_objects()):
+        match = OBJECT_NAME_RE.match(name)
+        if modified_at >= cutoff or (match and match.group(1) in known):
+            continue
+        storage.delete(name)
+        stats["objects_deleted"] += 1
+    return stats
+
+
+def main():
+    import database
+    import migrations
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "gc"
+    if command != "gc":
+        sys.exit(f"Comando desconocido: {command} (usa gc)")
+    migrations.upgrade(database.engine)
+    db = database.SessionLocal()
+    try:
+        print(collect_garbage(db))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
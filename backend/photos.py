@@ -0,0 +1,224 @@
+"""Subida de fotos de perfil: escritura por trozos sin bloquear el event loop y avatares con Pillow.
+
+- El cuerpo se copia a disco en trozos de PHOTO_CHUNK_BYTES con E/S asíncrona (anyio), con
+  tope de tamaño (PHOTO_MAX_BYTES) aplicado también mientras llega la petición (middleware).
+- El tipo se detecta por los primeros bytes (firma del formato), no por el content_type.
+- Los avatares (AVATAR_SIZES, WebP o JPEG) se generan en un pool de procesos; el original
+  a resolución completa no se guarda.
+
+Este módulo no importa la app ni la BD: los procesos del pool solo cargan esto y Pillow.
+"""
+import asyncio
+import hashlib
+import importlib.util
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+import anyio
+from starlette.responses import JSONResponse
+
+UPLOAD_DIR = "uploads"
+PHOTO_MAX_BYTES = int(os.getenv("PHOTO_MAX_BYTES", 10 * 1024 * 1024))
+PHOTO_CHUNK_BYTES = 256 * 1024
+# Margen para las cabeceras multipart al limitar el cuerpo completo de la petición
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+# Lados (px) de los avatares cuadrados; el mayor es el que se guarda en photo_url
+AVATAR_SIZES = (512, 128)
+PHOTO_AVATAR_FORMAT = os.getenv("PHOTO_AVATAR_FORMAT", "webp").lower()
+AVATAR_QUALITY = 82
+# Imágenes más grandes se rechazan (protección contra "decompression bombs")
+MAX_IMAGE_PIXELS = 40_000_000
+# 0 = generar los avatares en el threadpool del servidor
+PHOTO_WORKERS = int(os.getenv("PHOTO_WORKERS", min(2, os.cpu_count() or 1)))
+
+# HEIC (fotos de iPhone) solo si está instalado pillow-heif
+HEIF_SUPPORTED = importlib.util.find_spec("pillow_heif") is not None
+
+_FORMATS = {"webp": ("WEBP", "webp"), "jpeg": ("JPEG", "jpg")}
+# Cambia si cambia cómo se generan los avatares: entra en la clave por contenido de photo_storage
+RENDER_SIGNATURE = f"v1|{AVATAR_SIZES}|{PHOTO_AVATAR_FORMAT}|{AVATAR_QUALITY}"
+_AVATAR_NAME_RE = re.compile(r"^([0-9a-f]{32})_\d+\.(?:webp|jpg)$")
+
+
+def _max_size_text() -> str:
+    return f"{round(PHOTO_MAX_BYTES / (1024 * 1024), 1):g} MB"
+
+
+class PhotoRejected(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def sniff_image(head: bytes) -> Optional[str]:
+    """Formato según la firma de los primeros bytes (None si no es una imagen aceptada)"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"heic", b"heix", b"mif1", b"msf1"):
+        return "heic"
+    return None
+
+
+async def save_upload(upload, stem: str, work_dir: str = UPLOAD_DIR) -> tuple[str, str]:
+    """Copia el archivo subido a work_dir por trozos; devuelve (ruta temporal, sha256 del contenido)"""
+    path = os.path.join(work_dir, f"{stem}.upload")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with await anyio.open_file(path, "wb") as out:
+            while chunk := await upload.read(PHOTO_CHUNK_BYTES):
+                if size == 0:
+                    kind = sniff_image(chunk)
+                    if kind is None or (kind == "heic" and not HEIF_SUPPORTED):
+                        raise PhotoRejected(415, "Formato de imagen no soportado (usa JPEG, PNG o WebP)")
+                size += len(chunk)
+                if size > PHOTO_MAX_BYTES:
+                    raise PhotoRejected(413, f"La foto supera {_max_size_text()}")
+                digest.update(chunk)
+                await out.write(chunk)
+        if size == 0:
+            raise PhotoRejected(400, "Archivo vacío")
+    except BaseException:
+        await anyio.Path(path).unlink(missing_ok=True)
+        raise
+    return path, digest.hexdigest()
+
+
+def _render_avatars(src: str, dest_dir: str, stem: str, sizes: tuple, fmt: str) -> dict[int, str]:
+    """Corre en el pool: recorta al cuadrado, reescala y guarda cada tamaño. Borra el original"""
+    from PIL import Image, ImageOps
+
+    if HEIF_SUPPORTED:
+        import pillow_heif
+        pillow_heif.register_heif_opener()
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    pil_format, extension = _FORMATS.get(fmt, _FORMATS["webp"])
+    names = {}
+    try:
+        with Image.open(src) as img:
+            # JPEG: decodifica directamente a una escala reducida (mucho menos trabajo)
+            img.draft("RGB", (max(sizes) * 2, max(sizes) * 2))
+            img = ImageOps.exif_transpose(img).convert("RGB")
+            for size in sorted(sizes, reverse=True):
+                avatar = ImageOps.fit(img, (size, size), Image.Resampling.LANCZOS)
+                name = f"{stem}_{size}.{extension}"
+                avatar.save(os.path.join(dest_dir, name), pil_format, quality=AVATAR_QUALITY)
+                names[size] = name
+                # El siguiente tamaño sale del anterior (ya reducido)
+                img = avatar
+    except (OSError, Image.DecompressionBombError):
+        for name in names.values():
+            os.remove(os.path.join(dest_dir, name))
+        raise ValueError("Imagen dañada o demasiado grande")
+    finally:
+        os.remove(src)
+    return names
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PHOTO_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def render_avatars(src: str, stem: str, work_dir: str = UPLOAD_DIR) -> dict[int, str]:
+    """{lado: nombre de archivo en work_dir} de los avatares generados a partir de src"""
+    args = (src, work_dir, stem, AVATAR_SIZES, PHOTO_AVATAR_FORMAT)
+    try:
+        if PHOTO_WORKERS <= 0:
+            return await asyncio.to_thread(_render_avatars, *args)
+        return await asyncio.get_running_loop().run_in_executor(_get_pool(), _render_avatars, *args)
+    except BrokenProcessPool:
+        shutdown_pool()
+        raise
+    except ValueError as e:
+        raise PhotoRejected(400, str(e))
+
+
+def avatar_name(stem: str, size: int) -> str:
+    return f"{stem}_{size}.{_FORMATS.get(PHOTO_AVATAR_FORMAT, _FORMATS['webp'])[1]}"
+
+
+def delete_photo_files(photo_url: Optional[str]):
+    """Borra de UPLOAD_DIR los archivos de una foto anterior a photo_storage (todos sus tamaños)"""
+    if not photo_url:
+        return
+    filename = os.path.basename(photo_url.split("?")[0])
+    match = _AVATAR_NAME_RE.match(filename)
+    if match:
+        _, extension = os.path.splitext(filename)
+        candidates = [f"{match.group(1)}_{size}{extension}" for size in AVATAR_SIZES]
+    else:
+        candidates = [filename]
+    for name in candidates:
+        path = os.path.join(UPLOAD_DIR, name)
+        if name and os.path.isfile(path):
+            os.remove(path)
+
+
+class UploadSizeLimitMiddleware:
+    """Corta con 413 las subidas a `paths` que superan el tope, sin esperar a leer todo el cuerpo"""
+
+    # BaseException: FastAPI convierte cualquier Exception al leer el formulario en un 400
+    class _TooLarge(BaseException):
+        pass
+
+    def __init__(self, app, paths: tuple, max_bytes: int = PHOTO_MAX_BYTES + MULTIPART_OVERHEAD_BYTES):
+        self.app = app
+        self.paths = paths
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+        too_large = JSONResponse({"detail": f"La foto supera {_max_size_text()}"}, status_code=413)
+        declared = dict(scope["headers"]).get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > self.max_bytes:
+            return await too_large(scope, receive, send)
+
+        received = 0
+        started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise self._TooLarge()
+            return message
+
+        async def tracking_send(message):
+            nonlocal started
+            started = started or message["type"] == "http.response.start"
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except self._TooLarge:
+            if not started:
+                await too_large(scope, receive, send)
@@ -0,0 +1,195 @@
+import os
+import re
+import json
+import math
+import unicodedata
+from functools import lru_cache
+from typing import Optional
+
+# --- Configuración ---
+# Presupuesto de tokens para el prompt completo (sistema + usuario)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", 2500))
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+# Prompt de sistema 100% estático: mismo prefijo en todas las peticiones para que el
+# proveedor pueda cachearlo. Todo lo que depende del usuario va en build_user_prompt.
+SYSTEM_PROMPT = """Eres "Meal.IA", un Nutricionista experto y Chef Ejecutivo de alta cocina.
+
+=== CONTEXTO DEL INVENTARIO (CRÍTICO) ===
+En el mensaje del usuario verás la DESPENSA COMPLETA de la casa (STOCK TOTAL) y su objetivo de calorías.
+La despensa puede venir como lista ("2.5 Kg de Harina") o agrupada por categoría ("Categoría: harina 2.5kg, ...").
+
+REGLA DE LÓGICA DE PORCIONES (NO COMER 1 KG):
+1. Si la lista dice "1 Kg de Avena", significa que hay una BOLSA guardada. NO mandes al usuario a comer 1 Kg.
+   -> Usa una porción lógica para 1 persona (Ej: 40g - 60g).
+2. Si dice "2 Kg de Arroz", usa solo 80g-100g.
+3. Si dice "5 Unidades de Tomate", usa 1 o 2.
+
+REGLAS DE ORDEN DE COMIDAS:
+1. EL ALMUERZO ES LA COMIDA PRINCIPAL (MÁS CALORIAS).
+
+REGLAS DE DISPONIBILIDAD:
+1. USA SOLO LO QUE HAY EN LA LISTA NO USES COSAS QUE NO ESTAN EN EL INVENTARIO. (Permitidos extras básicos: Sal, Pimienta, Aceite, Agua).
+2. Si falta algo esencial para un plato, NO lo inventes. Cambia de receta.
+
+REGLAS DE ESTILO (NO SEAS FLOJO):
+1. **TÍTULOS:** Crea nombres de restaurante (Marketing). Ej: "Risotto Cremoso de..." en lugar de "Arroz con...".
+2. **PASOS DETALLADOS:** - Prohibido decir "cocina hasta que esté listo".
+   - DI: "Cocina por 5 minutos hasta dorar".
+   - DI: "Cuando huelas a nuez tostada, apaga el fuego".
+3. **EMPLATADO:** El último paso siempre es cómo servirlo para que se vea bello.
+
+OBJETIVO:
+- Calorías totales: las indicadas por el usuario (+/- 50).
+- Idioma: Español.
+
+INSTRUCCIONES DE INGREDIENTES (CRÍTICO):
+- Cada ingrediente como "cantidad+unidad ingrediente" con cantidades exactas para 1 persona.
+  Ej: "50g avena", "1 unidad plátano", "200ml leche", "1 cda aceite de oliva".
+- NO calcules calorías, macros ni micros: se calculan automáticamente a partir de los ingredientes.
+- Calcula el TIEMPO de preparación real total (prep + cocción). Ej: "25 min".
+
+INSTRUCCIONES TÉCNICAS JSON:
+- Devuelve SOLO JSON válido.
+- NO uses comas al final de las listas (trailing commas).
+
+FORMATO JSON OBLIGATORIO (breakfast, lunch y dinner con la misma estructura):
+{
+  "breakfast": {
+    "name": "TÍTULO MARKETING",
+    "ingredients": ["cant+unidad ing", ...],
+    "steps": ["Paso 1 (tiempo)...", "Paso 2...", "Emplatado..."],
+    "time": "XX min"
+  },
+  "lunch": { ... },
+  "dinner": { ... },
+  "note": "Nota del Chef motivadora para tus objetivos."
+}
+"""
+
+OTHER_CATEGORY = "Otros"
+
+# Orden de relevancia de cada categoría según el objetivo del usuario
+GOAL_PRIORITIES = {
+    "Déficit": ["Verduras y Hortalizas", "Carnes y Proteínas", "Frutas", "Lácteos y Derivados", "Granos, Cereales y Legumbres",
+                "Frutos Secos y Semillas", "Condimentos y Especias", "Aceites y Grasas", "Bebidas", OTHER_CATEGORY],
+    "Aumentar masa": ["Carnes y Proteínas", "Granos, Cereales y Legumbres", "Lácteos y Derivados", "Frutos Secos y Semillas",
+                      "Frutas", "Verduras y Hortalizas", "Aceites y Grasas", "Condimentos y Especias", "Bebidas", OTHER_CATEGORY],
+    "Mantenimiento": ["Carnes y Proteínas", "Verduras y Hortalizas", "Granos, Cereales y Legumbres", "Frutas", "Lácteos y Derivados",
+                      "Frutos Secos y Semillas", "Aceites y Grasas", "Condimentos y Especias", "Bebidas", OTHER_CATEGORY],
+}
+
+UNIT_ABBREVIATIONS = {"unidades": "u", "kg": "kg", "g": "g", "l": "L", "ml": "ml", "oz": "oz", "lb": "lb"}
+# Por debajo de esto (en su unidad) el ítem se considera casi agotado
+NEAR_EMPTY_THRESHOLDS = {"unidades": 1, "kg": 0.05, "g": 50, "l": 0.05, "ml": 50, "oz": 2, "lb": 0.1}
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def normalize_name(name: str) -> str:
+    """minúsculas, sin tildes y con espacios simples: 'Plátano  Verde' -> 'platano verde'"""
+    decomposed = unicodedata.normalize("NFKD", name.strip().lower())
+    return " ".join("".join(ch for ch in decomposed if not unicodedata.combining(ch)).split())
+
+
+@lru_cache(maxsize=1)
+def _category_index() -> dict[str, str]:
+    with open(os.path.join(DATA_DIR, "food_categories.json"), encoding="utf-8") as f:
+        categories = json.load(f)
+    return {normalize_name(food): category for category, foods in categories.items() for food in foods}
+
+
+def categorize(name: str) -> str:
+    """Categoría del alimento: nombre exacto, o la primera palabra que coincida ('pechuga de pollo' -> pollo)"""
+    index = _category_index()
+    normalized = normalize_name(name)
+    if normalized in index:
+        return index[normalized]
+    for word in normalized.split():
+        if word in index:
+            return index[word]
+    return OTHER_CATEGORY
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    # tiktoken es opcional: si no está instalado usamos la estimación local
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Tokens del texto (tiktoken si está disponible; si no, ~4 caracteres por token de palabra)"""
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return sum(math.ceil(len(piece) / 4) if piece[0].isalnum() else 1 for piece in _TOKEN_RE.findall(text))
+
+
+@lru_cache(maxsize=1)
+def system_prompt_tokens() -> int:
+    return count_tokens(SYSTEM_PROMPT)
+
+
+def _format_quantity(quantity: float) -> str:
+    return f"{round(float(quantity or 0), 2):g}"
+
+
+def _is_near_empty(item) -> bool:
+    quantity = float(item.quantity or 0)
+    return quantity <= 0 or quantity < NEAR_EMPTY_THRESHOLDS.get((item.unit or "").lower(), 0)
+
+
+def format_inventory_full(inventory_items) -> str:
+    """Lista legible completa: "2.5 Kg de Harina" """
+    return ", ".join([f"{item.quantity} {item.unit} de {item.name}" for item in inventory_items])
+
+
+def format_inventory_compact(inventory_items, goal: Optional[str], max_tokens: int) -> str:
+    """Despensa comprimida: sin ítems casi vacíos, agrupada por categoría y recortada por relevancia al objetivo"""
+    priorities = GOAL_PRIORITIES.get(goal or "", GOAL_PRIORITIES["Mantenimiento"])
+    rank = {category: i for i, category in enumerate(priorities)}
+
+    candidates = [(categorize(item.name), item) for item in inventory_items if not _is_near_empty(item)]
+    # Más relevante primero; dentro de la categoría, lo que más hay
+    candidates.sort(key=lambda c: (rank.get(c[0], len(rank)), -float(c[1].quantity or 0), c[1].name))
+
+    groups: dict[str, list[str]] = {}
+    # Reservamos espacio para el aviso de ítems omitidos
+    used = count_tokens(" (+9999 ítems menos relevantes omitidos)") + 2
+    kept = 0
+    for category, item in candidates:
+        unit = UNIT_ABBREVIATIONS.get((item.unit or "").lower(), item.unit or "")
+        entry = f"{item.name} {_format_quantity(item.quantity)}{unit}"
+        cost = count_tokens(entry) + 1
+        if category not in groups:
+            cost += count_tokens(category) + 2
+        if used + cost > max_tokens:
+            break
+        groups.setdefault(category, []).append(entry)
+        used += cost
+        kept += 1
+
+    text = "; ".join(f"{category}: {', '.join(entries)}" for category, entries in groups.items())
+    omitted = len(candidates) - kept
+    if omitted:
+        text += f" (+{omitted} ítems menos relevantes omitidos)"
+    return text
+
+
+def build_user_prompt(first_name: Optional[str], daily_vibe: str, fav_txt: str, target_calories: int,
+                      inventory_items, goal: Optional[str], budget: int = PROMPT_TOKEN_BUDGET) -> str:
+    """Mensaje de usuario con la parte variable; comprime la despensa si el prompt pasa el presupuesto"""
+    header = (
+        f"Crea el plan para {first_name}. Vibe de hoy: {daily_vibe}. {fav_txt}\n"
+        f"OBJETIVO: {target_calories} kcal totales (+/- 50).\n"
+        "DESPENSA (STOCK TOTAL): "
+    )
+    inventory_budget = budget - system_prompt_tokens() - count_tokens(header)
+    inventory_txt = format_inventory_full(inventory_items)
+    if count_tokens(inventory_txt) > inventory_budget:
+        inventory_txt = format_inventory_compact(inventory_items, goal, max(inventory_budget, 0))
+    return f"{header}[{inventory_txt}]"
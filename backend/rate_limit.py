@@ -0,0 +1,179 @@
+"""Límites de peticiones por usuario y por IP (token bucket) para los endpoints caros.
+
+Cada regla es "capacidad/segundos": se admiten ráfagas de `capacidad` peticiones y el cubo se
+rellena a razón de capacidad/segundos fichas por segundo. Sin fichas, RateLimited lleva los
+segundos hasta la siguiente y main.py responde 429 con Retry-After.
+
+- menu: /generate-menu y /generate-menu/stream, por usuario (cada uno paga una completion).
+- login_ip: /token, /register y /auth/google, por IP (Argon2 o verificación de Google).
+- login_user: /token, por email (adivinar la contraseña de una cuenta desde muchas IPs).
+
+Los cubos viven en memoria de cada proceso (con N workers el límite efectivo es hasta N veces
+mayor) o en Redis con RATE_LIMIT_URL, compartidos entre workers e instancias.
+"""
+import math
+import os
+import threading
+import time
+
+from cachetools import LRUCache
+from fastapi import Request
+
+import metrics
+
+# --- Configuración de los límites ---
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+# Si se define (redis://...), los cubos se comparten entre procesos/instancias
+RATE_LIMIT_URL = os.getenv("RATE_LIMIT_URL")
+# Claves (usuarios, IPs) en memoria; una expulsada vuelve con el cubo lleno
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100_000))
+
+RULES = {
+    "menu": os.getenv("RATE_LIMIT_MENU", "5/60"),
+    "login_ip": os.getenv("RATE_LIMIT_LOGIN_IP", "20/60"),
+    "login_user": os.getenv("RATE_LIMIT_LOGIN_USER", "10/300"),
+}
+
+
+class RateLimited(Exception):
+    """El cubo de la regla está vacío para esta clave; retry_after en segundos"""
+
+    def __init__(self, rule: str, retry_after: float):
+        super().__init__(f"{rule}: reintentar en {retry_after:.1f} s")
+        self.rule = rule
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+def parse_rule(spec: str) -> tuple[int, float] | None:
+    """'5/60' -> (capacidad 5, 5/60 fichas por segundo); '' o '0' desactivan la regla"""
+    if not spec or spec.strip() == "0":
+        return None
+    try:
+        capacity, seconds = spec.split("/")
+        capacity, seconds = int(capacity), float(seconds)
+    except ValueError as e:
+        raise RuntimeError(f"Regla de rate limit inválida '{spec}': usa capacidad/segundos (p. ej. 5/60)") from e
+    if capacity <= 0 or seconds <= 0:
+        return None
+    return capacity, capacity / seconds
+
+
+class InProcessBuckets:
+    """Cubos en memoria del proceso (por defecto): {clave: (fichas, instante de la última recarga)}"""
+
+    def __init__(self, maxsize: int):
+        self._buckets = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: int, rate: float) -> float:
+        """Gasta una ficha; devuelve 0 si había, o los segundos hasta la siguiente"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / rate
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+# Recarga y gasto atómicos en el servidor: dos workers no pueden gastar la misma ficha
+_TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+else
+  wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisBuckets:
+    """Cubos compartidos en Redis; expiran cuando se habrían rellenado del todo"""
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("RATE_LIMIT_URL requiere el paquete 'redis' (pip install redis)") from e
+        self._redis = redis.Redis.from_url(url)
+        self._take = self._redis.register_script(_TAKE_SCRIPT)
+
+    def take(self, key: str, capacity: int, rate: float) -> float:
+        # Reloj de pared: los workers comparten cubo y no comparten time.monotonic()
+        return float(self._take(keys=[f"ratelimit:{key}"], args=[capacity, rate, time.time()]))
+
+    def clear(self):
+        keys = list(self._redis.scan_iter(match="ratelimit:*"))
+        if keys:
+            self._redis.delete(*keys)
+
+
+class RateLimiter:
+    def __init__(self, backend, rules: dict[str, str]):
+        self.backend = backend
+        self.rules = {name: parse_rule(spec) for name, spec in rules.items()}
+        self.allowed = 0
+        self.rejected = 0
+
+    def check(self, rule: str, key) -> None:
+        """Gasta una ficha de `rule` para `key` (id de usuario, IP, email) o lanza RateLimited"""
+        limit = self.rules.get(rule)
+        if not RATE_LIMIT_ENABLED or limit is None:
+            return
+        retry_after = self.backend.take(f"{rule}:{key}", *limit)
+        if retry_after > 0:
+            self.rejected += 1
+            metrics.rate_limited.inc(rule=rule)
+            raise RateLimited(rule, retry_after)
+        self.allowed += 1
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "enabled": RATE_LIMIT_ENABLED,
+            "rules": {name: list(limit) if limit else None for name, limit in self.rules.items()},
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+        }
+
+
+def _build_limiter() -> RateLimiter:
+    if RATE_LIMIT_URL:
+        return RateLimiter(RedisBuckets(RATE_LIMIT_URL), RULES)
+    return RateLimiter(InProcessBuckets(RATE_LIMIT_MAX_KEYS), RULES)
+
+
+limiter = _build_limiter()
+
+
+def client_ip(request: Request) -> str:
+    # Detrás de un proxy, uvicorn/gunicorn ponen aquí la IP de X-Forwarded-For si el proxy
+    # está en FORWARDED_ALLOW_IPS; si no, todos los clientes comparten la IP del proxy
+    return request.client.host if request.client else "unknown"
+
+
+def per_ip(rule: str):
+    """Dependencia de FastAPI: una ficha de `rule` por IP antes de ejecutar el endpoint"""
+    async def dependency(request: Request):
+        limiter.check(rule, client_ip(request))
+    return dependency
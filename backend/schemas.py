@@ -1,6 +1,8 @@
-from pydantic import BaseModel, EmailStr
-from typing import List, Optional, Dict
-from datetime import datetime
+from pydantic import BaseModel, EmailStr, Field, model_validator
+from typing import List, Literal, Optional, Dict
+from datetime import date, datetime
+
+import nutrition
 
 # --- Inventory ---
 class InventoryItemBase(BaseModel):
@@ -23,6 +25,31 @@ class InventoryItem(InventoryItemBase):
     class Config:
         from_attributes = True # Permite a Pydantic leer modelos de SQLAlchemy
 
+class InventoryOperation(BaseModel):
+    op: Literal["add", "set", "decrement", "remove"]
+    name: str
+    quantity: Optional[float] = None # add/decrement: 1 por defecto; set: obligatoria
+    unit: Optional[str] = None # add: "Unidades" si es nuevo; set: obligatoria
+
+    @model_validator(mode="after")
+    def check_fields(self):
+        if self.op == "set" and (self.quantity is None or not self.unit):
+            raise ValueError("'set' requiere quantity y unit")
+        if self.op in ("add", "decrement") and self.quantity is None:
+            self.quantity = 1.0
+        if self.op in ("add", "decrement") and self.quantity <= 0:
+            raise ValueError(f"'{self.op}' requiere una cantidad positiva")
+        if self.op == "set" and self.quantity < 0:
+            raise ValueError("'set' requiere una cantidad de 0 o más")
+        return self
+
+class InventoryBatchRequest(BaseModel):
+    operations: List[InventoryOperation] = Field(..., min_length=1, max_length=500)
+
+class InventoryBatchResult(BaseModel):
+    items: List[InventoryItem] # Estado final de los ítems tocados
+    removed: List[str] = [] # Ítems tocados que ya no existen (decrement a 0 o remove)
+
 # --- User ---
 class UserBase(BaseModel):
     email: EmailStr
@@ -50,12 +77,15 @@ class User(UserBase):
     weight: Optional[float] = None
     birthdate: Optional[datetime] = None
     goal: Optional[str] = None
-    inventory_items: List[InventoryItem] = []
     photo_url: str | None = None
 
     class Config:
         from_attributes = True
 
+class UserWithInventory(User):
+    """/users/me?include=inventory: el usuario con su despensa (cargada con selectinload)"""
+    inventory_items: List[InventoryItem] = []
+
 # --- Auth ---
 class Token(BaseModel):
     access_token: str
@@ -66,28 +96,106 @@ class TokenData(BaseModel):
 
 # --- IA Menu Generation ---
 # Define la estructura JSON que esperamos de OpenAI
-class MealDetail(BaseModel):
+class Meal(BaseModel):
+    """Comida tal como se guarda y se devuelve: la nutrición ya viene calculada (ver MealDetail)"""
     name: str
     ingredients: List[str]
     steps: List[str]
-    calories: int
+    # Calorías, macros y micros se calculan localmente a partir de los ingredientes (nutrition.py)
+    calories: int = 0
     # Macros
-    carbs: int
-    protein: int
-    fat: int
+    carbs: int = 0
+    protein: int = 0
+    fat: int = 0
     # Micros
-    fiber: float
-    sugar: float
-    sodium: int
+    fiber: float = 0
+    sugar: float = 0
+    sodium: int = 0
     # Time
-    time: str
-
-class MenuGenerationResponse(BaseModel):
+    time: str = ""
+
+class MealDetail(Meal):
+    """Comida recién generada (IA o motor local): la nutrición se calcula aquí una sola vez y se
+    guarda con el menú; leer un menú guardado (Meal) no la recalcula"""
+
+    @model_validator(mode="before")
+    @classmethod
+    def apply_fallbacks(cls, data):
+        """Nutrición calculada con la tabla local; si ningún ingrediente se reconoce, valores de la IA
+        o reglas de respaldo. Nunca devolver macros/micros en 0 ni tiempo vacío"""
+        if not isinstance(data, dict):
+            return data
+        meal = dict(data)
+        computed = nutrition.meal_nutrition(meal.get("ingredients") or [])
+        if computed is not None:
+            # Valores reales de la tabla (un 0 es un 0 de verdad, p. ej. carbs del pollo)
+            meal.update(computed)
+        else:
+            try:
+                cal = float(meal.get("calories") or 500)
+            except (TypeError, ValueError):
+                cal = 500
+            if not meal.get("calories"): meal["calories"] = int(cal)
+
+            # Fallback Macros (50% Carbs, 20% Protein, 30% Fat)
+            if not meal.get("carbs"): meal["carbs"] = int((cal * 0.50) / 4)
+            if not meal.get("protein"): meal["protein"] = int((cal * 0.20) / 4)
+            if not meal.get("fat"): meal["fat"] = int((cal * 0.30) / 9)
+
+            # Fallback Micros
+            if not meal.get("sodium"): meal["sodium"] = int(cal * 0.5) # Aprox
+            if not meal.get("sugar"): meal["sugar"] = round(cal * 0.02, 1)
+            if not meal.get("fiber"): meal["fiber"] = round(cal * 0.015, 1)
+
+        # Fallback Time
+        if not meal.get("time") or meal.get("time") == "0 min":
+            step_count = len(meal.get("steps") or [])
+            meal["time"] = f"{15 + (step_count * 5)} min"
+        return meal
+
+class Menu(BaseModel):
+    """Menú ya generado (caché, respuesta de /generate-menu)"""
+    breakfast: Meal
+    lunch: Meal
+    dinner: Meal
+    note: str = ""
+    total_calories: int = 0
+
+class MenuGenerationResponse(Menu):
+    """Validación de un menú recién generado: nutrición de cada comida y total"""
     breakfast: MealDetail
     lunch: MealDetail
     dinner: MealDetail
-    note: str
+
+    @model_validator(mode="after")
+    def recompute_total(self):
+        # Recalcular total por seguridad
+        self.total_calories = self.breakfast.calories + self.lunch.calories + self.dinner.calories
+        return self
+    
+class GeneratedMenu(BaseModel):
+    id: int
+    menu_date: date
+    breakfast: Meal
+    lunch: Meal
+    dinner: Meal
+    note: Optional[str] = None
     total_calories: int
+    source: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class GeneratedMenuPage(BaseModel):
+    items: List[GeneratedMenu]
+    next_cursor: Optional[str] = None # Pasar como ?cursor= para la siguiente página
+
+class BatchMenuRequest(BaseModel):
+    menu_date: Optional[date] = None # Por defecto: mañana
+    user_ids: Optional[List[int]] = None # Por defecto: todos
+    concurrency: Optional[int] = Field(None, ge=1)
+    requests_per_minute: Optional[int] = Field(None, ge=1)
     
 class GoogleToken(BaseModel):
     token: str
@@ -103,4 +211,12 @@ class SavedRecipe(SavedRecipeCreate):
     owner_id: int
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class SyncResponse(BaseModel):
+    version: int # Pasar como ?since= en la siguiente sincronización
+    full: bool # True: listas completas (reemplazar todo lo local); False: solo cambios desde `since`
+    inventory: List[InventoryItem] = [] # Ítems creados o modificados
+    recipes: List[SavedRecipe] = []
+    deleted_inventory: List[int] = [] # ids borrados (aplicar antes que las listas de arriba)
+    deleted_recipes: List[int] = []
@@ -1,42 +1,125 @@
 from dotenv import load_dotenv
+import asyncio
+import multiprocessing
 import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta
 from typing import Optional
-from passlib.context import CryptContext
+from cachetools import TTLCache
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, make_transient_to_detached
 
-<<<<<<< HEAD
-# --- CORRECCIÓN DE IMPORTACIONES RELATIVAS ---
-from database import get_db
-import models, schemas
-=======
 # --- CORRECCIÓN DE IMPORTACIONES ---
-from database import get_db
+from database import DbSession, get_session, run_db, sync_session
 import models
 import schemas
->>>>>>> f07a5d1764c53e5a13e8d8f232938d6fa0f8b50f
+import password_hashing
 
 load_dotenv() # Carga las variables de .env
 SECRET_KEY = os.getenv("SECRET_KEY")
-print(f"DEBUG: SECRET_KEY cargada es de tipo: {type(SECRET_KEY)}")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+# Incluir el id del usuario (claim "uid") en el JWT: la caché de usuarios usa la clave primaria
+JWT_INCLUDE_UID = os.getenv("JWT_INCLUDE_UID", "1") != "0"
+
+# --- Caché de usuarios autenticados ---
+# 0 desactiva la caché (cada petición vuelve a leer el usuario de la BD)
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", 60))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", 10000))
+
+# --- Pool de hashing de contraseñas ---
+# 0 workers = hashear en el threadpool del servidor (comportamiento anterior)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+# Operaciones admitidas a la vez (en curso + en cola); por encima se responde 503
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 64))
 
 # --- Password Hashing ---
-pwd_context = CryptContext(schemes=["argon2", "bcrypt"], deprecated="auto")
+# Costos de Argon2 configurables en password_hashing.py (ARGON2_*)
+pwd_context = password_hashing.pwd_context
+unusable_password = password_hashing.unusable_password
+
+class PasswordPoolBusy(Exception):
+    """El pool de hashing tiene PASSWORD_HASH_MAX_PENDING operaciones pendientes"""
+
+_password_pool: Optional[ProcessPoolExecutor] = None
+_password_pool_lock = threading.Lock()
+password_pool_stats = {"submitted": 0, "completed": 0, "rejected": 0, "in_flight": 0, "max_in_flight": 0}
+
+def _get_password_pool() -> ProcessPoolExecutor:
+    global _password_pool
+    with _password_pool_lock:
+        if _password_pool is None:
+            # 'spawn': los workers solo importan password_hashing, no heredan la app ni sus conexiones
+            _password_pool = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _password_pool
+
+def shutdown_password_pool():
+    global _password_pool
+    with _password_pool_lock:
+        pool, _password_pool = _password_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def password_pool_snapshot() -> dict:
+    stats = dict(password_pool_stats)
+    stats["workers"] = PASSWORD_HASH_WORKERS
+    stats["max_pending"] = PASSWORD_HASH_MAX_PENDING
+    # Lo que espera worker libre (lo que excede a los procesos ocupados)
+    stats["queue_depth"] = max(stats["in_flight"] - max(PASSWORD_HASH_WORKERS, 1), 0)
+    return stats
+
+async def _run_password_job(func, *args):
+    with _password_pool_lock:
+        if password_pool_stats["in_flight"] >= PASSWORD_HASH_MAX_PENDING:
+            password_pool_stats["rejected"] += 1
+            raise PasswordPoolBusy()
+        password_pool_stats["in_flight"] += 1
+        password_pool_stats["submitted"] += 1
+        password_pool_stats["max_in_flight"] = max(password_pool_stats["max_in_flight"], password_pool_stats["in_flight"])
+    try:
+        if PASSWORD_HASH_WORKERS <= 0:
+            return await asyncio.to_thread(func, *args)
+        return await asyncio.get_running_loop().run_in_executor(_get_password_pool(), func, *args)
+    except BrokenProcessPool:
+        # Un worker murió (p. ej. sin memoria para ARGON2_MEMORY_COST): la siguiente petición crea otro pool
+        shutdown_password_pool()
+        raise
+    finally:
+        with _password_pool_lock:
+            password_pool_stats["in_flight"] -= 1
+            password_pool_stats["completed"] += 1
+
+async def hash_password_async(password: str) -> str:
+    return await _run_password_job(password_hashing.hash_password, password)
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    """(coincide, hash nuevo a guardar si los parámetros de Argon2 cambiaron)"""
+    if not hashed_password or hashed_password.startswith(password_hashing.UNUSABLE_PREFIX):
+        # Cuentas sin contraseña (Google): no ocupan el pool
+        return False, None
+    return await _run_password_job(password_hashing.verify_and_update, plain_password, hashed_password)
+
+# Versiones síncronas (scripts y código fuera del event loop)
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_hashing.verify_and_update(plain_password, hashed_password)[0]
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return password_hashing.hash_password(password)
 
 # --- JWT (Tokens) ---
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+def token_claims(user: models.User) -> dict:
+    """Claims del JWT de sesión: el email en 'sub' y, si está activado, el id estable en 'uid'"""
+    claims = {"sub": user.email}
+    if JWT_INCLUDE_UID:
+        claims["uid"] = user.id
+    return claims
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -47,13 +130,48 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+# --- Caché de usuarios ---
+# Guarda una copia desacoplada de las columnas del usuario (TTL + LRU). En cada petición se
+# adjunta a la sesión con merge(load=False), sin SELECT: los cambios se siguen guardando
+# con db.commit() y las relaciones (inventario...) se cargan de la BD como siempre.
+_user_cache = TTLCache(maxsize=USER_CACHE_MAX_ENTRIES, ttl=max(USER_CACHE_TTL_SECONDS, 1))
+_user_cache_lock = threading.Lock()
+user_cache_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+def _user_cache_keys(user: models.User) -> tuple[str, str]:
+    return f"uid:{user.id}", f"email:{user.email}"
+
+def _cache_user(user: models.User):
+    snapshot = models.User(**{column.key: getattr(user, column.key) for column in models.User.__table__.columns})
+    make_transient_to_detached(snapshot)
+    with _user_cache_lock:
+        for key in _user_cache_keys(user):
+            _user_cache[key] = snapshot
+
+def invalidate_cached_user(user: models.User):
+    """Llamar tras cualquier escritura sobre el usuario (datos, contraseña, foto)"""
+    with _user_cache_lock:
+        for key in _user_cache_keys(user):
+            _user_cache.pop(key, None)
+    user_cache_stats["invalidations"] += 1
+
+def clear_user_cache():
+    with _user_cache_lock:
+        _user_cache.clear()
+
 # --- Dependencia de Usuario Actual ---
 # Esta función es la que protege nuestros endpoints
 def get_user(db: Session, email: str):
     # 'models.User' funciona porque 'models' ahora fue importado correctamente arriba
     return db.query(models.User).filter(models.User.email == email).first()
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def _load_user(db: Session, uid, email: str) -> Optional[models.User]:
+    if isinstance(uid, int):
+        user = db.get(models.User, uid)
+        return user if user is not None and user.email == email else None
+    return get_user(db, email=email)
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: DbSession = Depends(get_session)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="No se pudieron validar las credenciales",
@@ -65,10 +183,23 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         if email is None:
             raise credentials_exception
         token_data = schemas.TokenData(email=email)
+        uid = payload.get("uid")
     except JWTError:
         raise credentials_exception
-    
-    user = get_user(db, email=token_data.email)
+
+    cache_key = f"uid:{uid}" if isinstance(uid, int) else f"email:{token_data.email}"
+    if USER_CACHE_TTL_SECONDS > 0:
+        with _user_cache_lock:
+            cached = _user_cache.get(cache_key)
+        if cached is not None and cached.email == token_data.email:
+            user_cache_stats["hits"] += 1
+            # Sin E/S: se adjunta la copia a la sesión de la petición
+            return sync_session(db).merge(cached, load=False)
+        user_cache_stats["misses"] += 1
+
+    user = await run_db(db, _load_user, uid, token_data.email)
     if user is None:
         raise credentials_exception
-    return user
\ No newline at end of file
+    if USER_CACHE_TTL_SECONDS > 0:
+        _cache_user(user)
+    return user
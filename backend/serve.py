@@ -0,0 +1,133 @@
+"""Arranque de producción: migraciones una sola vez y N workers (uno por núcleo por defecto).
+
+    cd backend
+    python serve.py                          # WEB_CONCURRENCY workers, 0.0.0.0:$PORT
+    python serve.py --workers 4 --port 8000
+    python serve.py --server uvicorn         # sin gunicorn (p. ej. en Windows)
+
+1. El proceso maestro aplica las migraciones pendientes y suelta sus conexiones; los workers
+   arrancan con MIGRATE_ON_STARTUP=0 (ver lifespan en main.py).
+2. Con gunicorn (Linux/macOS, si está instalado) la app se importa una vez en el maestro
+   (preload_app) y cada worker nace por fork con todo ya importado; tras el fork descarta
+   los pools de BD heredados. gunicorn reemplaza los workers que mueren.
+3. Sin gunicorn, uvicorn --workers: cada worker importa main por su cuenta.
+
+Lo que es de cada worker (cliente de OpenAI, pools de procesos, claves de Google) se crea en
+su lifespan o en el primer uso, nunca en el maestro. El estado en memoria también es por
+worker: la caché de menús (salvo con MENU_CACHE_URL) y los trabajos de /admin/batch-menus.
+"""
+import argparse
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def default_workers() -> int:
+    """WEB_CONCURRENCY o los núcleos disponibles para este proceso (afinidad/cgroups incluidos)"""
+    if os.getenv("WEB_CONCURRENCY"):
+        return max(1, int(os.getenv("WEB_CONCURRENCY")))
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return os.cpu_count() or 1
+
+
+def migrate_once():
+    import database
+    import migrations
+
+    applied = migrations.upgrade(database.engine)
+    database.dispose_engines()
+    # Los workers heredan el entorno: ninguno vuelve a migrar
+    os.environ["MIGRATE_ON_STARTUP"] = "0"
+    return applied
+
+
+def _uvicorn_worker_class() -> str:
+    # uvicorn.workers quedó obsoleto en favor del paquete uvicorn-worker
+    try:
+        import uvicorn_worker  # noqa: F401
+        return "uvicorn_worker.UvicornWorker"
+    except ImportError:
+        return "uvicorn.workers.UvicornWorker"
+
+
+def _post_fork(server, worker):
+    import database
+
+    database.dispose_engines(close=False)
+
+
+def run_gunicorn(host: str, port: int, workers: int, log_level: str):
+    from gunicorn.app.base import BaseApplication
+
+    options = {
+        "bind": f"{host}:{port}",
+        "workers": workers,
+        "worker_class": _uvicorn_worker_class(),
+        "preload_app": True,
+        "post_fork": _post_fork,
+        "graceful_timeout": 30,
+        "keepalive": 5,
+        "loglevel": log_level,
+    }
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            import gc
+            import main
+
+            # Objetos importados en el maestro fuera del GC: los workers los comparten por
+            # copy-on-write sin que una pasada del GC los toque (y los copie)
+            gc.freeze()
+            return main.app
+
+    Server().run()
+
+
+def run_uvicorn(host: str, port: int, workers: int, log_level: str):
+    import uvicorn
+
+    uvicorn.run("main:app", app_dir=BACKEND_DIR, host=host, port=port, workers=workers, log_level=log_level)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=None, help="por defecto WEB_CONCURRENCY o un worker por núcleo")
+    parser.add_argument("--server", choices=("auto", "gunicorn", "uvicorn"), default="auto",
+                        help="auto: gunicorn si está instalado y no es Windows")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--skip-migrations", action="store_true", help="las aplica otro paso del despliegue")
+    args = parser.parse_args()
+
+    server = args.server
+    if server == "auto":
+        try:
+            import gunicorn  # noqa: F401
+            server = "uvicorn" if os.name == "nt" else "gunicorn"
+        except ImportError:
+            server = "uvicorn"
+
+    if args.skip_migrations:
+        os.environ["MIGRATE_ON_STARTUP"] = "0"
+    else:
+        migrate_once()
+
+    workers = args.workers or default_workers()
+    (run_gunicorn if server == "gunicorn" else run_uvicorn)(args.host, args.port, workers, args.log_level)
+
+
+if __name__ == "__main__":
+    main()
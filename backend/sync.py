@@ -0,0 +1,143 @@
+"""Sincronización incremental de inventario y recetas guardadas (GET /sync?since=N).
+
+Cada usuario tiene un contador users.sync_version. Toda escritura sobre su inventario o sus
+recetas reserva la siguiente versión (next_version) y la anota en las filas que cambia; los
+borrados dejan una lápida en sync_tombstones con esa misma versión. Con eso, "qué cambió
+desde N" es una búsqueda por índice (owner_id, version) en cada tabla.
+
+El UPDATE que reserva la versión bloquea la fila del usuario hasta el commit, así que los
+cambios de un mismo usuario se serializan y sus versiones se confirman en orden: un cliente
+que ya vio la versión N nunca se pierde después un cambio con versión <= N.
+
+Las lápidas se purgan pasado SYNC_TOMBSTONE_RETENTION_DAYS; un cliente con un ?since= más
+antiguo que lo purgado (users.sync_floor) recibe la lista completa.
+
+    cd backend
+    python sync.py prune      # purga lápidas antiguas
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, literal, select, update
+from sqlalchemy.orm import Session
+
+import models
+
+SYNC_TOMBSTONE_RETENTION_DAYS = int(os.getenv("SYNC_TOMBSTONE_RETENTION_DAYS", 90))
+
+INVENTORY = "inventory"
+RECIPE = "recipe"
+
+_users = models.User.__table__
+_tombstones = models.SyncTombstone.__table__
+_tables = {INVENTORY: models.InventoryItem.__table__, RECIPE: models.SavedRecipe.__table__}
+
+
+def current_version(db: Session, owner_id: int) -> tuple[int, int]:
+    """(sync_version, sync_floor) leídos de la BD (el current_user puede venir de la caché de auth)"""
+    row = db.execute(select(_users.c.sync_version, _users.c.sync_floor).where(_users.c.id == owner_id)).one()
+    return row.sync_version, row.sync_floor
+
+
+def next_version(db: Session, owner_id: int) -> int:
+    """Reserva la siguiente versión del usuario dentro de la transacción en curso (hasta el commit)"""
+    db.execute(update(_users).where(_users.c.id == owner_id).values(sync_version=_users.c.sync_version + 1))
+    return db.execute(select(_users.c.sync_version).where(_users.c.id == owner_id)).scalar_one()
+
+
+def record_deletions(db: Session, entity: str, version: int, *conditions, params: list[dict] | None = None):
+    """Lápidas para las filas de `entity` que cumplen `conditions`; llamar justo antes del DELETE equivalente.
+
+    Con `params` se ejecuta como executemany (mismos bindparam que el DELETE).
+    """
+    table = _tables[entity]
+    rows = select(table.c.owner_id, literal(entity), table.c.id, literal(version), literal(datetime.utcnow())).where(*conditions)
+    stmt = insert(_tombstones).from_select(["owner_id", "entity", "entity_id", "version", "created_at"], rows)
+    if params:
+        db.execute(stmt, params)
+    else:
+        db.execute(stmt)
+
+
+def changes_since(db: Session, owner_id: int, since: int) -> dict:
+    """Cambios posteriores a `since`, o la lista completa (full=True) si no se pueden calcular.
+
+    La versión se lee antes que las filas: si entra un cambio entre medias, el cliente lo
+    recibe ahora y otra vez en la siguiente sincronización (aplicarlo dos veces no cambia nada).
+    """
+    version, floor = current_version(db, owner_id)
+    full = since <= 0 or since < floor or since > version
+    changed = {}
+    for entity, model in ((INVENTORY, models.InventoryItem), (RECIPE, models.SavedRecipe)):
+        query = db.query(model).filter(model.owner_id == owner_id)
+        if not full:
+            query = query.filter(model.version > since)
+        changed[entity] = query.order_by(model.id).all()
+
+    deleted = {INVENTORY: [], RECIPE: []}
+    if not full:
+        tombstones = db.execute(
+            select(_tombstones.c.entity, _tombstones.c.entity_id)
+            .where(_tombstones.c.owner_id == owner_id, _tombstones.c.version > since)
+            .order_by(_tombstones.c.version)
+        )
+        for entity, entity_id in tombstones:
+            deleted[entity].append(entity_id)
+    return {
+        "version": version,
+        "full": full,
+        "inventory": changed[INVENTORY],
+        "recipes": changed[RECIPE],
+        "deleted_inventory": deleted[INVENTORY],
+        "deleted_recipes": deleted[RECIPE],
+    }
+
+
+def list_etag(entity: str, owner_id: int, version: int) -> str:
+    # Débil: el mismo contenido puede salir comprimido o no (CompressionMiddleware)
+    return f'W/"{entity}-{owner_id}-{version}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Comparación débil (RFC 9110): se ignora el prefijo W/
+    return etag.removeprefix("W/") in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+
+
+def prune_tombstones(db: Session, retention_days: int = SYNC_TOMBSTONE_RETENTION_DAYS) -> dict:
+    """Borra las lápidas anteriores a retention_days y sube sync_floor de cada usuario afectado"""
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    floors = db.execute(
+        select(_tombstones.c.owner_id, func.max(_tombstones.c.version))
+        .where(_tombstones.c.created_at < cutoff)
+        .group_by(_tombstones.c.owner_id)
+    ).all()
+    deleted = 0
+    for owner_id, floor in floors:
+        db.execute(update(_users).where(_users.c.id == owner_id, _users.c.sync_floor < floor).values(sync_floor=floor))
+        deleted += db.execute(_tombstones.delete().where(_tombstones.c.owner_id == owner_id, _tombstones.c.version <= floor)).rowcount
+        db.commit()
+    return {"users": len(floors), "tombstones_deleted": deleted}
+
+
+def main():
+    import database
+    import migrations
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "prune"
+    if command != "prune":
+        sys.exit(f"Comando desconocido: {command} (usa prune)")
+    migrations.upgrade(database.engine)
+    db = database.SessionLocal()
+    try:
+        print(prune_tombstones(db))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
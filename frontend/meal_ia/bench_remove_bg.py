@@ -0,0 +1,84 @@
+"""Benchmark de remove_bg.py: implementación anterior (bucle por píxel) vs vectorizada.
+
+Comprueba además que con los parámetros por defecto el resultado es idéntico píxel a píxel.
+
+    python bench_remove_bg.py                       # assets/saludo.gif
+    python bench_remove_bg.py otra.gif --repeat 3 --workers 4
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image, ImageSequence
+
+import remove_bg
+
+
+def legacy_make_transparent(img):
+    # Copia de la versión anterior de remove_bg.make_transparent
+    datas = img.getdata()
+    newData = []
+    for item in datas:
+        if item[0] > 240 and item[1] > 240 and item[2] > 240:
+            newData.append((255, 255, 255, 0))
+        else:
+            newData.append(item)
+    img = img.convert("RGBA")
+    img.putdata(newData)
+    return img
+
+
+def legacy_process_gif(input_path, output_path):
+    im = Image.open(input_path)
+    frames = [legacy_make_transparent(frame.convert("RGBA")) for frame in ImageSequence.Iterator(im)]
+    frames[0].save(output_path, save_all=True, append_images=frames[1:], duration=im.info.get("duration", 100), loop=im.info.get("loop", 0), disposal=2)
+
+
+def _timed(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return round(best, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", nargs="?", default="assets/saludo.gif")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    with Image.open(args.input) as im:
+        frames = [frame.convert("RGBA") for frame in ImageSequence.Iterator(im)]
+    identical = all(
+        np.array_equal(np.asarray(legacy_make_transparent(frame)), np.asarray(remove_bg.make_transparent(frame)))
+        for frame in frames
+    )
+    out_dir = tempfile.mkdtemp(prefix="remove-bg-bench-")
+    report = {
+        "input": args.input,
+        "frames": len(frames),
+        "size": frames[0].size,
+        "cpus": os.cpu_count(),
+        "identical_output": identical,
+        "frames_only_seconds": {
+            "legacy": _timed(lambda: [legacy_make_transparent(f) for f in frames], args.repeat),
+            "vectorized": _timed(lambda: [remove_bg.make_transparent(f) for f in frames], args.repeat),
+            "vectorized_feather": _timed(lambda: [remove_bg.make_transparent(f, feather=20) for f in frames], args.repeat),
+        },
+        "full_gif_seconds": {
+            "legacy": _timed(lambda: legacy_process_gif(args.input, os.path.join(out_dir, "legacy.gif")), args.repeat),
+            "vectorized_1_worker": _timed(lambda: remove_bg.process_image(args.input, os.path.join(out_dir, "new1.gif"), workers=1), args.repeat),
+            f"vectorized_{args.workers}_workers": _timed(lambda: remove_bg.process_image(args.input, os.path.join(out_dir, "newN.gif"), workers=args.workers), args.repeat),
+        },
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
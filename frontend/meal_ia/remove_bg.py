@@ -1,46 +1,202 @@
+"""Quita el fondo de color (blanco por defecto) de GIFs animados e imágenes de assets/.
+
+Cada frame se procesa entero con NumPy (sin bucles por píxel): un píxel es fondo si en los
+tres canales está a menos de --tolerance de alguno de los colores clave. Con --feather el
+borde se suaviza: el alfa sube gradualmente en los siguientes `feather` niveles de distancia.
+Los frames se reparten entre procesos y se leen/escriben por tandas: nunca hay más de
+2 x workers frames RGBA en vuelo, por largo que sea el GIF (el escritor GIF de Pillow solo
+conserva los frames ya pasados a paleta, 1 byte por píxel).
+
+    python remove_bg.py                                   # assets/animation1.gif (como antes)
+    python remove_bg.py assets/saludo.gif -o assets/saludo_transparent.gif
+    python remove_bg.py assets/ --out-dir assets/transparent --feather 20
+    python remove_bg.py in.gif --key ffffff --key 00ff00 --tolerance 30 --workers 4
+"""
+import argparse
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, Sequence
+
+import numpy as np
 from PIL import Image, ImageSequence
 
-def make_transparent(img):
-    datas = img.getdata()
-    newData = []
-    for item in datas:
-        # Check if pixel is white (or very close to white)
-        # item is usually (R, G, B) or (R, G, B, A)
-        if item[0] > 240 and item[1] > 240 and item[2] > 240:
-            newData.append((255, 255, 255, 0)) # Transparent
-        else:
-            newData.append(item)
-    
-    img = img.convert("RGBA")
-    img.putdata(newData)
-    return img
-
-def process_gif(input_path, output_path):
-    print(f"Opening {input_path}...")
-    try:
-        im = Image.open(input_path)
-    except FileNotFoundError:
-        print("Error: Input file not found.")
-        return
+WHITE = (255, 255, 255)
+# Equivale al criterio anterior: cada canal > 240
+DEFAULT_TOLERANCE = 15
+IMAGE_EXTENSIONS = (".gif", ".png", ".webp")
+
+
+def parse_color(value: str) -> tuple[int, int, int]:
+    """'ffffff', '#00ff00' o '255,255,255'"""
+    value = value.strip().lstrip("#")
+    if "," in value:
+        color = tuple(int(part) for part in value.split(","))
+    elif len(value) == 6:
+        color = tuple(int(value[i:i + 2], 16) for i in (0, 2, 4))
+    else:
+        raise argparse.ArgumentTypeError(f"Color inválido: {value}")
+    if len(color) != 3 or not all(0 <= c <= 255 for c in color):
+        raise argparse.ArgumentTypeError(f"Color inválido: {value}")
+    return color
+
+
+def _key_distance(rgba: np.ndarray, key: tuple) -> np.ndarray:
+    """Máxima diferencia por canal entre cada píxel y `key` (uint8, sin pasar a enteros más anchos)"""
+    distance = None
+    for channel, value in enumerate(key):
+        plane = rgba[..., channel]
+        diff = np.maximum(plane, value) - np.minimum(plane, value)
+        distance = diff if distance is None else np.maximum(distance, diff, out=distance)
+    return distance
 
-    frames = []
-    
-    print("Processing frames...")
+
+def remove_background(rgba: np.ndarray, keys: Sequence[tuple] = (WHITE,), tolerance: int = DEFAULT_TOLERANCE, feather: int = 0) -> np.ndarray:
+    """Devuelve una copia de `rgba` (alto x ancho x 4, uint8) con el fondo transparente"""
+    rgba = np.ascontiguousarray(rgba)
+    # Cada píxel como un uint32: reemplazar píxeles enteros con np.where es mucho más rápido
+    # que asignar con máscara booleana sobre el eje de canales
+    pixels = rgba.view(np.uint32).reshape(rgba.shape[:2])
+    # Distancia a la clave más cercana; cada píxel de fondo toma el color de su clave y alfa 0
+    # (con la clave blanca por defecto: (255, 255, 255, 0), como la versión anterior)
+    distance = None
+    for key in keys:
+        key_distance = _key_distance(rgba, key)
+        background = key_distance < tolerance
+        if distance is not None:
+            background &= key_distance < distance
+        transparent = np.array([*key, 0], dtype=np.uint8).view(np.uint32)[0]
+        pixels = np.where(background, transparent, pixels)
+        distance = key_distance if distance is None else np.minimum(distance, key_distance, out=distance)
+    out = pixels.view(np.uint8).reshape(rgba.shape)
+    if feather > 0:
+        edge = (distance >= tolerance) & (distance < tolerance + feather)
+        ramp = ((distance.astype(np.uint16) - tolerance + 1) * 255 // (feather + 1)).clip(0, 255).astype(np.uint8)
+        out[..., 3] = np.where(edge, np.minimum(out[..., 3], ramp), out[..., 3])
+    return out
+
+
+def make_transparent(img: Image.Image, keys: Sequence[tuple] = (WHITE,), tolerance: int = DEFAULT_TOLERANCE, feather: int = 0) -> Image.Image:
+    """Versión para un solo frame de Pillow"""
+    rgba = np.asarray(img.convert("RGBA"))
+    return Image.fromarray(remove_background(rgba, keys, tolerance, feather), "RGBA")
+
+
+def _process_frame(job: tuple) -> tuple[bytes, tuple]:
+    # Corre en los procesos del pool: bytes RGBA de entrada -> bytes RGBA de salida
+    data, size, keys, tolerance, feather = job
+    rgba = np.frombuffer(data, dtype=np.uint8).reshape(size[1], size[0], 4)
+    return remove_background(rgba, keys, tolerance, feather).tobytes(), size
+
+
+def _read_frames(im: Image.Image) -> Iterator[tuple[bytes, tuple, int]]:
+    """Frames de uno en uno (bytes RGBA, tamaño, duración en ms)"""
+    default_duration = im.info.get("duration", 100)
     for frame in ImageSequence.Iterator(im):
-        frame = frame.convert("RGBA")
-        transparent_frame = make_transparent(frame)
-        frames.append(transparent_frame)
-
-    print(f"Saving to {output_path}...")
-    frames[0].save(
-        output_path,
-        save_all=True,
-        append_images=frames[1:],
-        duration=im.info.get('duration', 100),
-        loop=im.info.get('loop', 0),
-        disposal=2 # Clear background before next frame
-    )
-    print("Done!")
+        yield frame.convert("RGBA").tobytes(), frame.size, frame.info.get("duration", default_duration)
+
+
+def process_frames(frames: Iterable[tuple[bytes, tuple, int]], keys, tolerance: int, feather: int, workers: int) -> Iterator[Image.Image]:
+    """Procesa los frames en paralelo y los entrega en orden, con a lo sumo 2 x workers en vuelo"""
+    if workers <= 1:
+        for data, size, duration in frames:
+            frame = Image.frombytes("RGBA", size, _process_frame((data, size, keys, tolerance, feather))[0])
+            frame.info["duration"] = duration
+            yield frame
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for data, size, duration in frames:
+            pending.append((pool.submit(_process_frame, (data, size, keys, tolerance, feather)), duration))
+            if len(pending) >= 2 * workers:
+                yield _finished(*pending.popleft())
+        while pending:
+            yield _finished(*pending.popleft())
+
+
+def _finished(future, duration: int) -> Image.Image:
+    data, size = future.result()
+    frame = Image.frombytes("RGBA", size, data)
+    frame.info["duration"] = duration
+    return frame
+
+
+def process_image(input_path: str, output_path: str, keys=(WHITE,), tolerance: int = DEFAULT_TOLERANCE, feather: int = 0, workers: int = 1) -> int:
+    """Procesa un GIF animado o una imagen fija; devuelve el número de frames"""
+    with Image.open(input_path) as im:
+        n_frames = getattr(im, "n_frames", 1)
+        frames = process_frames(_read_frames(im), keys, tolerance, feather, workers if n_frames > 1 else 1)
+        first = next(frames)
+        if n_frames == 1:
+            first.save(output_path)
+            return 1
+        # append_images acepta un generador: Pillow va leyendo frames procesados a medida que escribe
+        # (la duración de cada frame viaja en frame.info)
+        first.save(
+            output_path,
+            save_all=True,
+            append_images=frames,
+            loop=im.info.get("loop", 0),
+            disposal=2,  # Clear background before next frame
+        )
+    return n_frames
+
+
+def _output_path(input_path: str, output: str | None, out_dir: str | None, suffix: str) -> str:
+    if output:
+        return output
+    stem, extension = os.path.splitext(os.path.basename(input_path))
+    return os.path.join(out_dir or os.path.dirname(input_path), f"{stem}{suffix}{extension}")
+
+
+def _collect_inputs(paths: list[str], suffix: str) -> list[str]:
+    inputs = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                stem, extension = os.path.splitext(name)
+                # No reprocesar salidas anteriores
+                if extension.lower() in IMAGE_EXTENSIONS and not stem.endswith(suffix):
+                    inputs.append(os.path.join(path, name))
+        else:
+            inputs.append(path)
+    return inputs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="*", default=["assets/animation1.gif"], help="archivos o directorios (GIF, PNG, WebP)")
+    parser.add_argument("-o", "--output", help="archivo de salida (solo con una entrada)")
+    parser.add_argument("--out-dir", help="directorio de salida (por defecto, junto a la entrada)")
+    parser.add_argument("--suffix", default="_transparent")
+    parser.add_argument("--key", action="append", type=parse_color, help="color de fondo (repetible); por defecto ffffff")
+    parser.add_argument("--tolerance", type=int, default=DEFAULT_TOLERANCE, help="distancia máxima por canal para ser fondo")
+    parser.add_argument("--feather", type=int, default=0, help="niveles de distancia para el borde suave (0 = borde duro)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    inputs = _collect_inputs(args.inputs, args.suffix)
+    if args.output and len(inputs) != 1:
+        parser.error("--output solo se puede usar con una entrada")
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+    keys = tuple(args.key or [WHITE])
+
+    failed = 0
+    for input_path in inputs:
+        output_path = _output_path(input_path, args.output, args.out_dir, args.suffix)
+        print(f"Processing {input_path} -> {output_path}...")
+        try:
+            frames = process_image(input_path, output_path, keys, args.tolerance, args.feather, args.workers)
+        except FileNotFoundError:
+            print(f"Error: Input file not found: {input_path}")
+            failed += 1
+            continue
+        print(f"Done! ({frames} frames)")
+    return 1 if failed else 0
+
 
 if __name__ == "__main__":
-    process_gif("assets/animation1.gif", "assets/animation1_transparent.gif")
+    sys.exit(main())